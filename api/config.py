@@ -13,6 +13,32 @@ URLS = {
     "CLOB": "https://clob.polymarket.com"
 }
 
+# Limites de requisição por família de endpoint: (requisições, janela em segundos)
+# (valores próximos aos limites documentados; são eles que limitam a vazão das buscas)
+RATE_LIMITS = {
+    "CLOB_PRICES_HISTORY": (1000, 10),
+    "DATA_POSITIONS": (150, 10),
+    "DATA_CLOSED_POSITIONS": (150, 10),
+    "DATA_TRADES": (200, 10),
+    "DATA_TRADED": (200, 10),
+    "GAMMA_MARKETS": (125, 10),
+    "SUBGRAPH": (100, 10),
+}
+
+# Família de rate limit (RATE_LIMITS) de cada endpoint: toda requisição passa pela fila dela
+URL_LIMITS = {
+    URLS["TRADES"]: "DATA_TRADES",
+    URLS["TOTAL_TRADES"]: "DATA_TRADED",
+    URLS["ACTIVE_POSITIONS"]: "DATA_POSITIONS",
+    URLS["CLOSED_POSITIONS"]: "DATA_CLOSED_POSITIONS",
+    URLS["MARKET"]: "GAMMA_MARKETS",
+    URLS["POSITIONS_SUBGRAPH"]: "SUBGRAPH",
+    f"{URLS['CLOB']}/prices-history": "CLOB_PRICES_HISTORY",
+}
+
+# Tamanho do pool de conexões HTTP compartilhado entre threads
+HTTP_POOL_SIZE = 64
+
 ACTION_TYPES = [
     "TRADE",
     "SPLIT",
@@ -69,4 +95,23 @@ QUERYS = {
         }
         """,
 
+    'HOLDERS': """
+        query GetMarketHolders($conditionId: String!, $first: Int!, $lastId: String!) {
+          userBalances(
+            where: { asset_: { condition: $conditionId }, balance_gt: "0", id_gt: $lastId }
+            first: $first
+            orderBy: id
+            orderDirection: asc
+          ) {
+            id
+            user
+            balance
+            asset {
+              id
+              outcomeIndex
+            }
+          }
+        }
+        """,
+
 }
\ No newline at end of file
@@ -1,16 +1,16 @@
-import time
 import random
-import requests
 import pandas as pd
 from api.config import URLS
+from api.session import request, ResponseCache
 from typing import List, Dict, Any
 from helpers import loading_animation  # Assumindo que está em helpers.py
 from data.handle import assertion_active
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from api.jobs import CancelToken, Cancelled
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # --------------------------------------------------------------------------
-# FUNÇÕES-FILHAS (EXECUTADAS EM PROCESSOS SEPARADOS)
-# Elas devem ser silenciosas para não quebrar a animação no processo-pai.
+# FUNÇÕES-FILHAS (EXECUTADAS EM THREADS)
+# Elas devem ser silenciosas para não quebrar a animação da thread principal.
 # --------------------------------------------------------------------------
 
 def page(
@@ -20,17 +20,19 @@ def page(
     limit: int = 500,
     process_id: int = None,
     retry_count: int = 0,
+    cancel: CancelToken | None = None,
     ) -> Dict[str, Any]:
     
     """
     Busca uma página específica de dados.
     Esta função é SILENCIOSA (sem prints) para rodar em paralelo.
     """
+    cancel = cancel or CancelToken()
     
     params = {"limit": limit, "offset": offset, "user": user_address}
     
     try:
-        response = requests.get(url, params=params, timeout=30)
+        response = request("GET", url, cancel=cancel, params=params, timeout=30)
         
         if response.status_code == 200:
             data = response.json()
@@ -45,13 +47,16 @@ def page(
             
             # --- PRINT REMOVIDO ---
             # print(f"⚠️  {process_info}: Rate limit...")
-            time.sleep(total_delay)
+            cancel.sleep(total_delay)
             
             return {"offset": offset, "data": [], "success": False, "error": "Rate limited", "retry_count": retry_count}
         
         else:
             return {"offset": offset, "data": [], "success": False, "error": response.status_code, "retry_count": retry_count}
     
+    except Cancelled:
+        raise
+    
     except Exception as e:
         # --- PRINT REMOVIDO ---
         # print(f'Error Puxando página: {e}')
@@ -64,17 +69,20 @@ def fetch_range(
     end_offset: int,
     process_id: int,
     num_processes: int,
-    max_limit: int = 500
+    max_limit: int = 500,
+    cancel: CancelToken | None = None,
     ) -> List[Dict[str, Any]]:
     """
     Busca um range específico de offsets.
     Esta função é SILENCIOSA (sem prints) para rodar em paralelo.
+    cancel: (Opcional) checado a cada página e nas esperas de retentativa
     """
     # --- PRINT REMOVIDO ---
     # print(f"Processo {process_id}: Buscando offsets...")
+    cancel = cancel or CancelToken()
     
     initial_delay = random.uniform(0.1, 0.5) * process_id
-    if initial_delay > 0: time.sleep(initial_delay)
+    if initial_delay > 0: cancel.sleep(initial_delay)
     
     all_data = []
     current_offset = start_offset
@@ -96,13 +104,15 @@ def fetch_range(
         max_retries = 5  
         
         while retry_count < max_retries:
+            cancel.check()
             result = page(
                 url=url,
                 user_address=user_address,
                 offset=current_offset,
                 limit=max_limit,
                 process_id=process_id,
-                retry_count=retry_count
+                retry_count=retry_count,
+                cancel=cancel,
             )
             
             if result["success"] and result["data"]:
@@ -149,7 +159,7 @@ def fetch_range(
         
         jitter = random.uniform(-0.1, 0.1)
         delay = max(0.1, base_delay + jitter)
-        time.sleep(delay)
+        cancel.sleep(delay)
     
     # --- PRINT REMOVIDO ---
     # print(f"Processo {process_id}: Concluído...")
@@ -166,9 +176,12 @@ def all_data_parallel(
     num_processes: int,
     display_message: str,  # <-- NOVO PARÂMETRO
     records_per_process: int = 250,
+    cancel: CancelToken | None = None,
     ):
     """
     Busca todos os dados usando processos paralelos e exibe animação.
+    Cada "processo" é uma thread: o trabalho é só I/O e todas dividem a
+    sessão HTTP e o CancelToken (cancel).
     """
     ranges = []
     for i in range(num_processes):
@@ -183,7 +196,7 @@ def all_data_parallel(
     initial_msg = f"📊 {display_message} (0 de {num_processes} processos)"
     
     with loading_animation(initial_msg) as anim_status:
-        with ProcessPoolExecutor(max_workers=num_processes) as executor:
+        with ThreadPoolExecutor(max_workers=num_processes) as executor:
             futures = []
             for start_offset, end_offset, process_id in ranges:
                 future = executor.submit(
@@ -193,7 +206,8 @@ def all_data_parallel(
                     start_offset,
                     end_offset,
                     process_id,
-                    num_processes
+                    num_processes,
+                    cancel=cancel,
                 )
                 futures.append(future)
             
@@ -206,6 +220,10 @@ def all_data_parallel(
                     
                     # --- ATUALIZA A MENSAGEM DA ANIMAÇÃO ---
                     anim_status['message'] = f"📊 {display_message} ({processos_concluidos} de {num_processes} processos)"
+                
+                except Cancelled:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
                     
                 except Exception as e:
                     # (Silencioso para não quebrar a animação)
@@ -218,6 +236,7 @@ def all_data_parallel(
 
 def user_data(
     user_address: str,
+    cancel: CancelToken | None = None,
     ):
     """
     Puxa toda as posições para o usuário em um dataframe.
@@ -228,7 +247,8 @@ def user_data(
         user_address=user_address,
         url=URLS['CLOSED_POSITIONS'],
         num_processes=20,
-        display_message="Buscando Posições Fechadas" # <-- Passa a mensagem
+        display_message="Buscando Posições Fechadas", # <-- Passa a mensagem
+        cancel=cancel,
     ))
     
     # Passo 2: Posições Ativas
@@ -236,39 +256,69 @@ def user_data(
         user_address=user_address,
         url=URLS['ACTIVE_POSITIONS'],
         num_processes=1,
-        display_message="Buscando Posições Ativas" # <-- Passa a mensagem
+        display_message="Buscando Posições Ativas", # <-- Passa a mensagem
+        cancel=cancel,
     ))
     
     # Passo 3: Dados de Mercado (já tinha a animação)
-    return fetch_market_data(assertion_active(active_df=active_data, closed_df=closed_data))
+    return fetch_market_data(
+        assertion_active(active_df=active_data, closed_df=closed_data), cancel=cancel
+    )
+
+# Metadados de mercado já buscados neste processo (slug -> tags, start_time, volume).
+# Carteiras diferentes compartilham muitos mercados; cada slug é buscado uma vez
+# por MARKET_CACHE_MAX_AGE (o volume de mercados ativos muda)
+MARKET_CACHE_ENTRIES = 50_000
+MARKET_CACHE_MAX_AGE = 15 * 60
+_market_cache = ResponseCache(MARKET_CACHE_ENTRIES, max_age=MARKET_CACHE_MAX_AGE)
+
+EMPTY_MARKET = {'tags': [], 'start_time': None, 'volume': None}
+
 
 def fetch_market_data(
     df: pd.DataFrame,
     batch_size: int = 100,
+    cancel: CancelToken | None = None,
     ) -> pd.DataFrame:
     """
-    (Função original - já estava correta, sem mudanças)
+    Junta tags, start_time e volume de cada mercado (por slug) ao df.
+    Slugs buscados há menos de MARKET_CACHE_MAX_AGE vêm do cache; falhas não são cacheadas.
+    cancel: (Opcional) checado a cada lote
     """
-    unique_slugs = df['slug'].unique()
+    # Carteira sem posições deste tipo: nada a buscar
+    if df.empty or 'slug' not in df.columns:
+        return df
+    
     all_data_dict = {}
-    total_batches = (len(unique_slugs) + batch_size - 1) // batch_size
+    pending_slugs = []
+    for slug in df['slug'].unique():
+        market = _market_cache.get(slug)
+        if market is None:
+            pending_slugs.append(slug)
+        else:
+            all_data_dict[slug] = market
+    total_batches = (len(pending_slugs) + batch_size - 1) // batch_size
     
     initial_msg = f"📊 Buscando dados de Mercado (0 de {total_batches})"
     
     with loading_animation(initial_msg) as anim_status:
-        for i in range(0, len(unique_slugs), batch_size):
-            batch_slugs = unique_slugs[i:i+batch_size]
+        for i in range(0, len(pending_slugs), batch_size):
+            batch_slugs = pending_slugs[i:i+batch_size]
             batch_num = (i // batch_size) + 1
             
             anim_status['message'] = f"📊 Buscando dados de Mercado ({batch_num} de {total_batches})"
+            if cancel is not None:
+                cancel.check()
             
             response = None
             try:
-                response = requests.get(
-                    url=URLS['MARKET'],
-                    params={'slug': batch_slugs.tolist(), 'include_tag': True, 'limit': len(batch_slugs)},
+                response = request(
+                    "GET", URLS['MARKET'], cancel=cancel,
+                    params={'slug': batch_slugs, 'include_tag': True, 'limit': len(batch_slugs)},
                     timeout=60
                 )
+            except Cancelled:
+                raise
             except Exception as e:
                 pass 
 
@@ -289,17 +339,21 @@ def fetch_market_data(
                 
                 for slug in batch_slugs:
                     if slug not in batch_dict:
-                        batch_dict[slug] = {'tags': [], 'start_time': None, 'volume': None}
+                        batch_dict[slug] = dict(EMPTY_MARKET)
+                for slug, market in batch_dict.items():
+                    _market_cache.put(slug, market)
                 all_data_dict.update(batch_dict)
             else:
                 for slug in batch_slugs:
-                    all_data_dict[slug] = {'tags': [],'start_time': None,'volume': None}
+                    all_data_dict[slug] = dict(EMPTY_MARKET)
 
         anim_status['message'] = "Concluindo..."
 
     print("✓ Coleta de dados de mercado concluída.")
     
-    market_data_df = pd.DataFrame.from_dict(all_data_dict, orient='index')
+    market_data_df = pd.DataFrame.from_dict(
+        all_data_dict, orient='index', columns=list(EMPTY_MARKET)
+    )
     combined_df = df.merge(
         market_data_df,
         left_on='slug',
@@ -309,15 +363,19 @@ def fetch_market_data(
     return combined_df
 
 def fetch_total_trades(
-    user_address
+    user_address,
+    cancel: CancelToken | None = None,
     ) -> int:
     """
     Busca o número total de trades de um usuário (com animação simples).
+    cancel: (Opcional) CancelToken (prioridade da requisição no escalonador)
     """
     params = {"user": user_address}
     
     try:
-        response = requests.get(URLS['TOTAL_TRADES'], params=params, timeout=30)
+        response = request(
+            "GET", URLS['TOTAL_TRADES'], cancel=cancel, params=params, timeout=30
+        )
         response.raise_for_status()
         data = response.json()
 
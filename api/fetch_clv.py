@@ -3,10 +3,17 @@ import time
 import requests
 import pandas as pd
 from api.config import URLS
+from api.session import request, ResponseCache
+from api.jobs import CancelToken, Cancelled
 from threading import Semaphore
 from typing import List, Dict, Any, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# Trades já buscados por (carteira, mercado, taker_only); o prefetch aquece este cache
+TRADES_CACHE_ENTRIES = 20_000
+TRADES_CACHE_MAX_AGE = 15 * 60
+_trades_cache = ResponseCache(TRADES_CACHE_ENTRIES, max_age=TRADES_CACHE_MAX_AGE)
+
 
 def fetch_trades_for_single_market_page(
     market_id: str,
@@ -15,13 +22,16 @@ def fetch_trades_for_single_market_page(
     taker_only: bool = False,
     limit: int = 100,
     offset: int = 0,
-    max_retries: int = 10
+    max_retries: int = 10,
+    cancel: CancelToken | None = None,
 ) -> Tuple[List[Dict[str, Any]], bool]:
     """
     Busca uma ÚNICA PÁGINA de trades para um ÚNICO mercado.
     Esta versão usa um loop 'while' para lidar corretamente com
     rate limits sem causar deadlock no semáforo.
+    cancel: (Opcional) checado antes de cada tentativa e nas esperas
     """
+    cancel = cancel or CancelToken()
     url = URLS["TRADES"]
     params = {
         "limit": limit, "offset": offset, "user": user_address,
@@ -35,9 +45,10 @@ def fetch_trades_for_single_market_page(
     
     try:
         while internal_retry_count <= max_retries:
+            cancel.check()
             try:
-                # Tentar fazer a requisição
-                response = requests.get(url, params=params, timeout=30)
+                # Tentar fazer a requisição (espera a vez no escalonador)
+                response = request("GET", url, cancel=cancel, params=params, timeout=30)
             
             except requests.exceptions.RequestException as e:
                 # 1. Falha de Conexão (ex: a internet caiu)
@@ -46,7 +57,7 @@ def fetch_trades_for_single_market_page(
                 if internal_retry_count > max_retries:
                     print(f"Falha de conexão final em {market_id[:10]}...", file=sys.stderr)
                     return ([], False) # Falha
-                time.sleep(5) # Espera 5s antes de retentar conexão
+                cancel.sleep(5) # Espera 5s antes de retentar conexão
                 continue # Tenta o 'while' de novo
             
             # 2. Sucesso na Requisição (analisar o status)
@@ -69,7 +80,7 @@ def fetch_trades_for_single_market_page(
                 
                 # DORMIR *DENTRO* DO SEMÁFORO
                 # Isso força o script a desacelerar globalmente.
-                time.sleep(delay)
+                cancel.sleep(delay)
                 
                 # Tentar o 'while' de novo
                 continue 
@@ -96,18 +107,28 @@ def fetch_trades_for_market_complete(
     user_address: str,
     taker_only: bool = False,
     limit: int = 100,
-    max_retries: int = 3
+    max_retries: int = 3,
+    cancel: CancelToken | None = None,
 ) -> Tuple[List[Dict[str, Any]], bool]:
     """
     Busca TODOS os trades para um ÚNICO mercado, usando paginação completa.
     Retorna (all_trades_list, overall_success_flag)
+    Mercados buscados há pouco (ver TRADES_CACHE_MAX_AGE) vêm do cache.
+    cancel: (Opcional) checado entre as páginas
     """
+    cancel = cancel or CancelToken()
+    cache_key = (str(user_address).lower(), market_id, taker_only)
+    cached = _trades_cache.get(cache_key)
+    if cached is not None:
+        return (list(cached), True)
+    
     all_trades = []
     offset = 0
     page_num = 1
     overall_success = True 
     
     while True:
+        cancel.check()
         # A função de página agora retorna (trades, success)
         page_trades, success = fetch_trades_for_single_market_page(
             market_id=market_id,
@@ -116,7 +137,8 @@ def fetch_trades_for_market_complete(
             taker_only=taker_only,
             limit=limit,
             offset=offset,
-            max_retries=max_retries
+            max_retries=max_retries,
+            cancel=cancel,
         )
         
         # Se qualquer página falhar, marcamos o mercado todo como falho e saímos
@@ -133,8 +155,10 @@ def fetch_trades_for_market_complete(
         
         offset += limit
         page_num += 1
-        time.sleep(0.1)
+        cancel.sleep(0.1)
     
+    if overall_success:
+        _trades_cache.put(cache_key, all_trades)
     return (all_trades, overall_success)
 
 
@@ -144,11 +168,15 @@ def _run_market_processing_loop(
     max_workers: int,
     user_address: str,
     markets_to_process: List[str],
+    cancel: CancelToken | None = None,
 ) -> Tuple[List[Dict[str, Any]], List[str]]:
     """
     Helper function para rodar o loop de processamento paralelo.
     Retorna (lista_de_trades_coletados, lista_de_mercados_que_falharam)
+    Se o loop for interrompido (cancel ou exceção de quem chamou), os
+    workers param e os mercados na fila não chegam a começar.
     """
+    cancel = cancel or CancelToken()
     all_trades_accumulator = []
     failed_markets_accumulator = []
     completed_count = 0
@@ -165,11 +193,13 @@ def _run_market_processing_loop(
                 semaphore=semaphore, 
                 market_id=market_id,
                 user_address=user_address,
-                taker_only=taker_only
+                taker_only=taker_only,
+                cancel=cancel,
             )
             return (market_id, trades, success)
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
         future_to_market = {
             executor.submit(process_single_market_wrapper, market_id): market_id
             for market_id in markets_to_process
@@ -196,11 +226,22 @@ def _run_market_processing_loop(
                     print(f"{progress_prefix} Falha controlada em {result_market_id[:20]}... (marcado para retentativa)")
                     failed_markets_accumulator.append(result_market_id)
 
+            except Cancelled:
+                raise
+            
             except Exception as e:
                 # Falha inesperada (exceção no código)
                 print(f"{progress_prefix} Erro CRÍTICO em {market_id[:20]}...: {e}")
                 failed_markets_accumulator.append(market_id)
     
+    except BaseException:
+        # Cancelado, ou o script do dashboard foi interrompido: para os workers
+        cancel.cancel()
+        raise
+    
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+    
     return (all_trades_accumulator, failed_markets_accumulator)
 
 
@@ -210,6 +251,7 @@ def fetch_all_trades_parallel(
     user_address: Optional[str] = None,
     taker_only: bool = False,
     max_workers: int = 20,
+    cancel: CancelToken | None = None,
 ) -> pd.DataFrame:
     
     """
@@ -230,6 +272,7 @@ def fetch_all_trades_parallel(
         taker_only=taker_only,
         max_workers=max_workers,
         markets_to_process=condition_ids,
+        cancel=cancel,
     )
     
     # Puxar novamente os que falharam
@@ -243,7 +286,8 @@ def fetch_all_trades_parallel(
             markets_to_process=failed_markets,
             user_address=user_address,
             taker_only=taker_only,
-            max_workers=max_workers
+            max_workers=max_workers,
+            cancel=cancel,
         )
         
         # Adiciona os trades da retentativa à lista principal
@@ -278,9 +322,11 @@ def fetch_clv(
     max_workers: int = 25,
     taker_only: bool = False,
     simultaneous_requests: int = 10,
+    cancel: CancelToken | None = None,
 ):
     """
     Função principal -> Consolida tudo
+    cancel: (Opcional) interrompe a busca (ver api.jobs.CancelToken)
     """
     
     return fetch_all_trades_parallel(
@@ -288,5 +334,6 @@ def fetch_clv(
         user_address=user_address,
         taker_only=taker_only,
         max_workers=max_workers,
-        semaphore=Semaphore(simultaneous_requests)
+        semaphore=Semaphore(simultaneous_requests),
+        cancel=cancel,
     )
@@ -2,18 +2,22 @@ import time
 import requests
 import pandas as pd
 from api.config import URLS, QUERYS
+from api.session import limiter_for, request
 from helpers import loading_animation 
 from api.fetch import fetch_market_data
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from api.jobs import FetchJob, CancelToken, Cancelled
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 def query_graphql(
     endpoint: str,
     query: str,
-    variables: dict | None = None
+    variables: dict | None = None,
+    cancel: CancelToken | None = None,
     ) -> dict:
     """
     Executa uma query GraphQL (agora silenciosa em caso de erro)
+    cancel: (Opcional) CancelToken da busca (prioridade no rate limiter)
     """
     headers = {
         "Content-Type": "application/json",
@@ -25,7 +29,11 @@ def query_graphql(
         payload["variables"] = variables
     
     try:
-        response = requests.post(endpoint, json=payload, headers=headers, timeout=30)
+        response = request(
+            "POST", endpoint, cancel=cancel, json=payload, headers=headers, timeout=30
+        )
+        if response.status_code == 429:
+            limiter_for(endpoint).penalize(2)
         response.raise_for_status()
         return response.json()
     
@@ -37,9 +45,11 @@ def get_all_user_positions(
     user_address: str,
     endpoint: str = URLS['POSITIONS_SUBGRAPH'],
     batch_size: int = 1000,
+    job: FetchJob | None = None,
     ) -> list[dict[str]]:
     """
     Busca TODAS as posições com paginação automática e animação.
+    job: (Opcional) recebe o progresso da paginação
     """
     all_positions = []
     skip = 0
@@ -50,12 +60,19 @@ def get_all_user_positions(
     with loading_animation(initial_msg) as anim_status:
         while True:
             anim_status['message'] = f"Buscando posições (Pág {batch_num}, Total: {len(all_positions):,})"
+            if job is not None:
+                job.check()
+                job.progress(
+                    stage='positions',
+                    message=f"Listing positions (page {batch_num}, {len(all_positions):,} so far)",
+                )
             
             batch = get_user_positions(
                 user_address,
                 endpoint,
                 first=batch_size,
                 skip=skip,
+                cancel=job,
             )
             
             if not batch:
@@ -68,8 +85,6 @@ def get_all_user_positions(
             
             skip += batch_size
             batch_num += 1
-            
-            time.sleep(0.2)
     
     # --- MUDANÇA: Print final ---
     print(f"Posições do subgraph coletadas: {len(all_positions):,} registros.")
@@ -84,6 +99,7 @@ def get_user_positions(
     endpoint: str = URLS['POSITIONS_SUBGRAPH'], 
     first: int = 1000,
     skip: int = 0, 
+    cancel: CancelToken | None = None,
     ) -> list[dict[str]]:
     """
     Busca uma página de posições (função auxiliar silenciosa)
@@ -94,7 +110,7 @@ def get_user_positions(
         "skip": skip
     }
     
-    result = query_graphql(endpoint, QUERYS['ACTIVE'], variables)
+    result = query_graphql(endpoint, QUERYS['ACTIVE'], variables, cancel=cancel)
     
     if "error" in result:
         return []
@@ -139,11 +155,15 @@ def _fetch_batch_pnl(
     condition_batch: list[str],
     closed: bool = True,
     limit: int = 25,
-    max_retries: int = 5
+    max_retries: int = 5,
+    cancel: CancelToken | None = None,
     ) -> list[dict[str]]:
     """
-    Função auxiliar (PROCESSO-FILHO) - DEVE SER SILENCIOSA
+    Função auxiliar (THREAD) - DEVE SER SILENCIOSA
+    O ritmo das requisições é dado pelo rate limiter do endpoint.
+    cancel: (Opcional) checado a cada página e nas esperas de retentativa
     """
+    cancel = cancel or CancelToken()
     
     # Definições Iniciais
     batch_data = []
@@ -152,9 +172,11 @@ def _fetch_batch_pnl(
     page_num = 1
     url = URLS["CLOSED_POSITIONS"] if closed \
         else URLS["ACTIVE_POSITIONS"]
+    limiter = limiter_for(url)
     
     # Loop para puxar os dados
     while True:
+        cancel.check()
         market_param = ",".join(condition_batch)
         params = {
             "user": user_address,
@@ -164,7 +186,7 @@ def _fetch_batch_pnl(
         }
         
         try:
-            response = requests.get(url, params=params, timeout=30)
+            response = request("GET", url, cancel=cancel, params=params, timeout=30)
             
             # Se deu Certo:
             if response.status_code == 200:
@@ -181,8 +203,6 @@ def _fetch_batch_pnl(
                 if offset >= 10000: break
                 retry_count = 0
                 
-                time.sleep(0.1)
-                
             # Lidar com timeout
             elif response.status_code == 429:
                 base_delay_rate = 2
@@ -190,8 +210,9 @@ def _fetch_batch_pnl(
                 exponential_delay = min(base_delay_rate * (2 ** retry_count), max_delay)
                 total_delay = exponential_delay
                 
-    
-                time.sleep(total_delay)
+                # Segura também as outras threads do mesmo endpoint
+                limiter.penalize(total_delay)
+                cancel.sleep(total_delay)
                 retry_count += 1
                 
                 if retry_count >= max_retries: break
@@ -208,16 +229,19 @@ def _fetch_batch_pnl(
                 delay = 2 * (2 ** retry_count)
                 total_delay = min(delay, 60)
     
-                time.sleep(total_delay)
+                cancel.sleep(total_delay)
                 continue
         
+        except Cancelled:
+            raise
+        
         # Se for Algum outro Erro
         except Exception:
 
             retry_count += 1
             if retry_count >= max_retries:
                 break
-            time.sleep(2)
+            cancel.sleep(2)
             continue
     
     return batch_data
@@ -229,9 +253,12 @@ def fetch_from_rest(
     markets_per_request: int = 50,
     closed: bool = True,
     max_workers: int = 4,
+    job: FetchJob | None = None,
     ) -> pd.DataFrame:
     """
-    Busca TODOS os dados de PNL (PROCESSO-PAI) com animação.
+    Busca TODOS os dados de PNL com animação.
+    Os lotes são só I/O: rodam em threads que dividem a sessão e o rate limiter.
+    job: (Opcional) recebe cada lote assim que ele chega (exibição parcial)
     """
     
 
@@ -254,19 +281,22 @@ def fetch_from_rest(
         batches.append((condition_batch, batch_num))
     
     all_pnl_data = []
-    
+    kind = 'closed' if closed else 'active'
+    if job is not None:
+        job.progress(stage=kind, done=0, total=total_batches)
     
     initial_msg = f"Buscando PNL da API (0 de {total_batches} lotes)"
     
     # Começar de Fato o Processamento
     with loading_animation(initial_msg) as anim_status:
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
             future_to_batch = {
                 executor.submit(
                     _fetch_batch_pnl,
                     user_address,
                     batch,
-                    closed
+                    closed,
+                    cancel=job,
                     ): batch_num
                 for batch, batch_num in batches
             }
@@ -279,12 +309,19 @@ def fetch_from_rest(
                 
                 # --- MUDANÇA: Atualiza a animação ---
                 anim_status['message'] = f"Buscando PNL da API ({completed_batches} de {total_batches} lotes)"
+                if job is not None:
+                    job.progress(done=completed_batches)
                 
                 try:
                     batch_data = future.result()
                     all_pnl_data.extend(batch_data)
+                    if job is not None:
+                        job.add(kind, batch_data)
                     
-                    
+                except Cancelled:
+                    # Lotes na fila não chegam a começar
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
                     
                 except Exception as e:
                     # TODO: Printar erro para facilitar
@@ -308,10 +345,12 @@ def fetch_missing(
     user_address: str,
     missing: set,
     closed: bool,
+    job: FetchJob | None = None,
     ):
     
     url = URLS["CLOSED_POSITIONS"] if closed \
         else URLS["ACTIVE_POSITIONS"]
+    limiter = limiter_for(url)
     
     
     missing_list = list(missing)
@@ -323,6 +362,8 @@ def fetch_missing(
     
     with loading_animation(initial_msg) as anim_status:
         for i, condition_id in enumerate(missing_list):
+            if job is not None:
+                job.check()
             
             anim_status['message'] = f"Buscando conditionIds faltantes ({i+1} de {total_missing})"
             
@@ -338,7 +379,7 @@ def fetch_missing(
                     "offset": offset
                 }
                 try:
-                    response = requests.get(url, params=params, timeout=30)  
+                    response = request("GET", url, cancel=job, params=params, timeout=30)
                     
                     # Se deu Certo -> Mais dados
                     if response.status_code == 200:
@@ -357,13 +398,10 @@ def fetch_missing(
                         
                         # Condição de parada do Offset
                         if offset >= 10000: break
-                        
-                        # Descansar né
-                        time.sleep(0.1)
                     
                     # Timeout
                     elif response.status_code == 429:
-                        time.sleep(2)
+                        limiter.penalize(2)
                         continue
                     
                     # Algum erro
@@ -373,7 +411,8 @@ def fetch_missing(
             
             if condition_data:
                 additional_data.extend(condition_data)
-                time.sleep(0.1)
+                if job is not None:
+                    job.add('closed' if closed else 'active', condition_data)
             
         if not additional_data:
             print(f"Busca por conditionIds faltantes concluída (nenhum dado adicional encontrado).")
@@ -385,8 +424,13 @@ def fetch_missing(
 def fetch_positions_from_rest(
     user_address: str,
     positions: list,
-    closed: bool
+    closed: bool,
+    job: FetchJob | None = None,
+    enrich: bool = True,
     ):
+    """
+    Posições (ativas ou fechadas) da API REST e, se enrich, os metadados de mercado.
+    """
     
     # Listar os condition_ids a buscar
     unique_condition_ids = list(
@@ -406,6 +450,7 @@ def fetch_positions_from_rest(
         markets_per_request=50,
         closed=closed,
         max_workers=4,
+        job=job,
     )
     
     # Buscar dados Faltantes:
@@ -415,35 +460,53 @@ def fetch_positions_from_rest(
         
         # De fato buscar:
         if missing:
-            missing_df = fetch_missing(user_address, missing, closed)
+            missing_df = fetch_missing(user_address, missing, closed, job=job)
             
             if not missing_df.empty:
                 df_rest = pd.concat([df_rest, missing_df])
     
     
     # Puxar metadados de mercado
-    return fetch_market_data(df_rest)
+    return fetch_market_data(df_rest) if enrich else df_rest
                 
 
             
     
 def fetch_pnl_data(
     user_address: str,
+    job: FetchJob | None = None,
     ) -> pd.DataFrame:
     """
     Função principal orquestradora (com várias animações).
+    Ordem: posições ativas, fechadas (lote a lote) e por fim os metadados
+    de mercado das duas, para que o job tenha dados parciais o quanto antes.
+    job: (Opcional) recebe progresso e dados parciais (ver api.jobs)
     """
     print(f"Iniciando coleta de dados para: {user_address}")
     
     
     # Buscar Todas as Posições
     active_positions, closed_positions = split_positions(
-        get_all_user_positions(user_address)
+        get_all_user_positions(user_address, job=job)
     )
     
     # Aqui começa a lógica de puxar dados em rest
     # Retorna em pd.DataFrame
-    active_df = fetch_positions_from_rest(user_address,active_positions, closed=False)
-    closed_df = fetch_positions_from_rest(user_address, closed_positions, closed=True)
+    active_df = fetch_positions_from_rest(
+        user_address, active_positions, closed=False, job=job, enrich=False)
+    closed_df = fetch_positions_from_rest(
+        user_address, closed_positions, closed=True, job=job, enrich=False)
+    
+    # Metadados (tags, início do jogo) por último: as posições já podem ser exibidas
+    if job is not None:
+        job.progress(stage='metadata')
+    active_df = fetch_market_data(active_df, cancel=job)
+    if job is not None:
+        job.add('active', active_df)
+        job.progress(done=1, total=2)
+    closed_df = fetch_market_data(closed_df, cancel=job)
+    if job is not None:
+        job.add('closed', closed_df)
+        job.progress(done=2)
     
     return closed_df, active_df
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Holders de mercados: todas as carteiras com saldo nos tokens de um mercado.
+Usado pela varredura de mercados (sweep.py).
+"""
+import re
+from api.config import URLS, QUERYS
+from api.session import request
+from api.fetch_subgraph import query_graphql
+
+CONDITION_ID = re.compile(r'^0x[0-9a-fA-F]{64}$')
+
+# Tokens da polymarket têm 6 casas decimais
+TOKEN_DECIMALS = 10 ** 6
+
+
+def resolve_markets(
+    markets: list[str],
+    batch_size: int = 100,
+    ) -> dict[str, str]:
+    """
+    Recebe slugs e/ou conditionIds e retorna {mercado: conditionId}.
+    Slugs não encontrados ficam de fora.
+    """
+    resolved = {m: m.lower() for m in markets if CONDITION_ID.match(m)}
+    slugs = [m for m in markets if m not in resolved]
+
+    for i in range(0, len(slugs), batch_size):
+        batch = slugs[i:i + batch_size]
+        response = request(
+            "GET", URLS['MARKET'],
+            params={'slug': batch, 'limit': len(batch)},
+            timeout=60,
+        )
+        response.raise_for_status()
+
+        for market in response.json():
+            if market.get('slug') in batch and market.get('conditionId'):
+                resolved[market['slug']] = market['conditionId'].lower()
+
+    return resolved
+
+
+def get_market_holders(
+    condition_id: str,
+    batch_size: int = 1000,
+    ) -> list[dict]:
+    """
+    Todas as posições com saldo > 0 nos tokens do mercado (paginação por id,
+    sem o limite de 'skip' do subgraph).
+    Retorna [{'wallet', 'tokenId', 'outcomeIndex', 'shares'}]
+    """
+    holders = []
+    last_id = ''
+
+    while True:
+        result = query_graphql(
+            URLS['POSITIONS_SUBGRAPH'],
+            QUERYS['HOLDERS'],
+            {'conditionId': condition_id, 'first': batch_size, 'lastId': last_id},
+        )
+        if 'error' in result:
+            raise RuntimeError(f"Subgraph: {result['error']}")
+        # Falhas do GraphQL (timeout, indexação) vêm com HTTP 200 em 'errors':
+        # sem levantar, a página vazia viraria uma lista de holders truncada
+        if result.get('errors'):
+            raise RuntimeError(f"Subgraph: {result['errors']}")
+
+        balances = (result.get('data') or {}).get('userBalances')
+        if balances is None:
+            raise RuntimeError(f"Subgraph: resposta sem userBalances ({condition_id})")
+        for balance in balances:
+            asset = balance.get('asset') or {}
+            holders.append({
+                'wallet': balance['user'].lower(),
+                'tokenId': asset.get('id'),
+                'outcomeIndex': asset.get('outcomeIndex'),
+                'shares': int(balance.get('balance', 0)) / TOKEN_DECIMALS,
+            })
+
+        if len(balances) < batch_size:
+            return holders
+        last_id = balances[-1]['id']
@@ -0,0 +1,227 @@
+"""
+Buscas de carteira em background: estado compartilhado entre a thread
+que busca e quem acompanha (dashboard).
+- progress(): etapa atual, mensagem e contagem (lotes/páginas)
+- add(): registros que já chegaram, por tipo ('active', 'closed')
+- frame(): os registros parciais como DataFrame, para exibir antes do fim
+- cancel(): a busca para na próxima página/retentativa (CancelToken)
+- priority: classe da busca no escalonador de requisições (api.session.RateLimiter)
+"""
+import time
+import threading
+import pandas as pd
+
+# Etapas da busca, na ordem em que acontecem
+STAGES = {
+    'positions': 'Listing positions',
+    'active': 'Fetching open positions',
+    'closed': 'Fetching closed positions',
+    'metadata': 'Fetching market metadata',
+    'done': 'Done',
+}
+
+
+class Cancelled(Exception):
+    """
+    A busca foi cancelada (ex.: o usuário trocou de carteira).
+    """
+
+
+class CancelToken:
+    """
+    Sinal de cancelamento compartilhado entre quem pede e as threads da busca.
+    As funções de busca chamam check() entre páginas e sleep() nas esperas
+    de retentativa, então param logo depois de cancel().
+    priority: 'interactive' (alguém esperando na tela), 'normal' (lotes, CLIs)
+              ou 'background' (prefetch: só a folga do rate limit). Pode mudar
+              durante a busca (ex.: prefetch promovido quando uma sessão espera).
+    O token também identifica a busca no revezamento dentro da classe.
+    """
+
+    def __init__(self, priority: str = 'normal'):
+        self._event = threading.Event()
+        self.priority = priority
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise Cancelled()
+
+    def sleep(self, seconds: float) -> None:
+        # time.sleep que acorda (com Cancelled) se a busca for cancelada
+        if self._event.wait(seconds):
+            raise Cancelled()
+
+
+class FetchJob(CancelToken):
+    """
+    Uma busca de carteira. Escrito pela thread da busca, lido por qualquer sessão.
+    Também é o CancelToken da busca.
+    """
+
+    def __init__(self, wallet: str, priority: str = 'normal'):
+        super().__init__(priority)
+        self.wallet = wallet
+        self.watchers = 0       # Sessões esperando por esta busca
+        self.running = False    # Já assumida por um loader (JobRegistry.start)
+        self.started_at = time.monotonic()
+        self.stage = 'positions'
+        self.message = STAGES['positions']
+        self.done = 0
+        self.total = None
+        self.version = 0        # Muda a cada atualização (quem exibe sabe se há novidade)
+
+        self._records = {'active': [], 'closed': []}
+        self._frames = {}       # kind -> (nº de registros, DataFrame)
+        self._lock = threading.Lock()
+
+    def progress(
+        self,
+        stage: str | None = None,
+        message: str | None = None,
+        done: int | None = None,
+        total: int | None = None,
+        ) -> None:
+        with self._lock:
+            if stage is not None and stage != self.stage:
+                self.stage = stage
+                self.message = STAGES[stage]
+                self.done, self.total = 0, None
+            if message is not None:
+                self.message = message
+            if done is not None:
+                self.done = done
+            if total is not None:
+                self.total = total
+            self.version += 1
+
+    def add(
+        self,
+        kind: str,
+        records: list[dict] | pd.DataFrame,
+        ) -> None:
+        """
+        Registros parciais que acabaram de chegar (ex.: um lote da API REST).
+        Um DataFrame substitui o que havia (ex.: depois dos metadados).
+        """
+        with self._lock:
+            if isinstance(records, pd.DataFrame):
+                self._frames[kind] = (-1, records)
+                self._records[kind] = []
+            else:
+                self._records[kind].extend(records)
+            self.version += 1
+
+    def frame(self, kind: str) -> pd.DataFrame:
+        # DataFrame montado uma vez por conjunto de registros
+        with self._lock:
+            count = len(self._records[kind])
+            cached = self._frames.get(kind)
+            if cached is not None and (cached[0] == -1 or cached[0] == count):
+                return cached[1]
+            records = list(self._records[kind])
+
+        df = pd.DataFrame(records)
+        with self._lock:
+            self._frames[kind] = (len(records), df)
+        return df
+
+    @property
+    def fraction(self) -> float | None:
+        # Fração concluída da etapa atual (None se o total ainda não é conhecido)
+        if not self.total:
+            return None
+        return min(self.done / self.total, 1.0)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+
+class JobRegistry:
+    """
+    Buscas em andamento por carteira (uma por carteira no processo).
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(wallet: str) -> str:
+        return wallet.strip().lower()
+
+    def start(self, wallet: str) -> FetchJob:
+        # Reaproveita o job reservado por watch() (com as sessões que esperam por ele)
+        wallet = self._key(wallet)
+        with self._lock:
+            job = self._jobs.get(wallet)
+            if job is None:
+                job = self._jobs[wallet] = FetchJob(wallet)
+            job.running = True
+            job.started_at = time.monotonic()
+        return job
+
+    def get(self, wallet: str) -> FetchJob | None:
+        return self._jobs.get(self._key(wallet))
+
+    def watch(self, wallet: str) -> FetchJob:
+        # Uma sessão vai esperar pela busca da carteira (reserva o job se preciso)
+        # A busca (mesmo um prefetch em andamento) passa a ser interativa
+        wallet = self._key(wallet)
+        with self._lock:
+            job = self._jobs.get(wallet)
+            if job is None:
+                job = self._jobs[wallet] = FetchJob(wallet)
+            job.priority = 'interactive'
+            job.watchers += 1
+        return job
+
+    def unwatch(self, job: FetchJob) -> None:
+        """
+        A espera de uma sessão por este job terminou (a busca acabou, com ou
+        sem erro). Um job reservado que nenhum loader assumiu sai do registro.
+        """
+        with self._lock:
+            job.watchers = max(job.watchers - 1, 0)
+            if job.watchers == 0 and not job.running and self._jobs.get(job.wallet) is job:
+                del self._jobs[job.wallet]
+
+    def prefetch(self, wallet: str) -> None:
+        # Reserva um job de fundo (ninguém esperando) se a carteira ainda não tem um
+        wallet = self._key(wallet)
+        with self._lock:
+            if wallet not in self._jobs:
+                self._jobs[wallet] = FetchJob(wallet, priority='background')
+
+    def discard(self, wallet: str) -> None:
+        # Cancela a busca só se nenhuma sessão espera por ela (ex.: prefetch descartado)
+        with self._lock:
+            job = self._jobs.get(self._key(wallet))
+            if job is not None and job.watchers == 0:
+                job.cancel()
+
+    def release(self, wallet: str) -> None:
+        """
+        Uma sessão desistiu da carteira. Sem mais ninguém esperando,
+        a busca é cancelada (libera rate limit e threads na hora).
+        """
+        with self._lock:
+            job = self._jobs.get(self._key(wallet))
+            if job is None:
+                return
+            job.watchers = max(job.watchers - 1, 0)
+            if job.watchers == 0:
+                job.cancel()
+
+    def finish(self, job: FetchJob) -> None:
+        job.progress(stage='done')
+        with self._lock:
+            if self._jobs.get(job.wallet) is job:
+                del self._jobs[job.wallet]
@@ -4,14 +4,34 @@ Processa um DataFrame e retorna com a odd no início de cada evento
 """
 import requests
 from datetime import datetime, timedelta
+import os
 import pytz
+import numpy as np
 import pandas as pd
-import json
 import time
-import random
-from typing import Optional, Dict, Any, List, Tuple
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import asyncio
+from typing import Optional, Dict, Any, List, Tuple, Callable
+from concurrent.futures import ThreadPoolExecutor
 from api.config import URLS
+from helpers import loading_animation
+from api.session import limiter_for, request, request_async, RateLimiter, ResponseCache
+from api.jobs import CancelToken, Cancelled
+
+# Preços de início já coletados: (market_id, match_ts, hours_before, fidelity) -> preço
+# Só de eventos já começados (o histórico não muda mais); o prefetch aquece este cache
+PRICE_CACHE_ENTRIES = 200_000
+_price_cache = ResponseCache(PRICE_CACHE_ENTRIES)
+_MISSING = object()
+
+# Histórico completo por (token, dia), base das consultas de preço num instante (as-of)
+# Só dias já encerrados ficam em cache (o histórico deles não muda mais), como arrays
+# NumPy e limitados por bytes (um dia em 1 minuto: ~23KB)
+HISTORY_CHUNK_SECONDS = 86_400
+HISTORY_CACHE_ENTRIES = 20_000
+HISTORY_CACHE_MB = int(os.environ.get('HISTORY_CACHE_MB', 64))
+_history_cache = ResponseCache(
+    HISTORY_CACHE_ENTRIES, budget_bytes=HISTORY_CACHE_MB * 2**20
+)
 
 
 def get_price_history(
@@ -56,7 +76,7 @@ def get_price_history(
     }
     
     try:
-        response = requests.get(url, params=params, timeout=timeout)
+        response = request("GET", url, params=params, timeout=timeout)
         
         if response.status_code == 200:
             data = response.json()
@@ -163,123 +183,293 @@ def get_match_start_price(
     return None
 
 
-def process_batch(
-    rows_data: List[Tuple[int, Dict[str, Any]]],
-    market_id_col: str,
-    start_time_col: str,
-    hours_before: int,
-    fidelity: int,
-    delay_between_requests: float,
+async def _fetch_price_history_async(
+    params: Dict[str, Any],
     timeout: int,
-    process_id: int,
-    num_processes: int
-) -> List[Tuple[int, Optional[float]]]:
+    limiter: RateLimiter,
+    max_retries: int = 5,
+    cancel: Optional[CancelToken] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Busca um histórico de preços pela fila do escalonador (request_async).
+    limiter: o do endpoint, segurado por inteiro quando a API responde 429
+    cancel: (Opcional) prioridade da busca; checado antes de cada tentativa
+    """
+    url = f"{URLS['CLOB']}/prices-history"
+    cancel = cancel or CancelToken()
+
+    for retry_count in range(max_retries + 1):
+        cancel.check()
+
+        try:
+            response = await request_async(
+                "GET", url, cancel=cancel, params=params, timeout=timeout
+            )
+        except requests.exceptions.RequestException:
+            await asyncio.sleep(min(2 ** retry_count, 30))
+            continue
+
+        if response.status_code == 200:
+            return response.json()
+
+        if response.status_code == 429:
+            # Segura todos os workers, não só este
+            limiter.penalize(min(2 ** retry_count, 30))
+            continue
+
+        return None
+
+    return None
+
+
+async def collect_match_start_prices(
+    requests_list: List[Tuple[str, int]],
+    hours_before: int = 1,
+    fidelity: int = 1,
+    timeout: int = 30,
+    max_concurrency: int = 32,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Dict[Tuple[str, int], Optional[float]]:
     """
-    Processa um lote de eventos em paralelo
+    Coleta o preço de início para cada par (market_id, match_ts) de forma assíncrona
+    Pares já em cache (ex.: aquecidos pelo prefetch) não vão à API.
+    Cancelado (cancel), os workers que ainda não começaram nem chegam a pedir
+    slot ao rate limiter e a coleta termina com Cancelled.
     
     Args:
-        rows_data: Lista de tuplas (idx, row_dict) contendo os dados das linhas
-        market_id_col: Nome da coluna que contém o market_id
-        start_time_col: Nome da coluna que contém a data/hora
-        hours_before: Horas antes do início para buscar
+        requests_list: Lista de pares (market_id, timestamp unix do início)
+        hours_before: Quantas horas antes do início buscar
         fidelity: Resolução dos dados em minutos
-        delay_between_requests: Delay entre requisições
-        timeout: Timeout da requisição
-        process_id: ID do processo (para logs)
-        num_processes: Número total de processos
+        timeout: Timeout da requisição em segundos
+        max_concurrency: Máximo de requisições em voo ao mesmo tempo
+        progress_callback: Chamado como callback(concluídos, total) a cada resposta
+        cancel: (Opcional) CancelToken da busca
     
     Returns:
-        Lista de tuplas (idx, price) com os resultados
+        dict {(market_id, match_ts): preço ou None}
     """
-    results = []
-    total_batch = len(rows_data)
-    
-    # Delay inicial para jitter (evitar sincronização)
-    initial_delay = random.uniform(0.1, 0.5) * process_id
-    if initial_delay > 0:
-        time.sleep(initial_delay)
-    
-    base_delay = delay_between_requests + (process_id * 0.05)  # Delay base com variação por processo
+    cancel = cancel or CancelToken()
+    limiter = limiter_for(f"{URLS['CLOB']}/prices-history")
+    semaphore = asyncio.Semaphore(max_concurrency)
+    total = len(requests_list)
+    results = {}
+    now = time.time()
+    
+    pending = []
+    for market_id, match_ts in requests_list:
+        price = _price_cache.get((market_id, match_ts, hours_before, fidelity), _MISSING)
+        if price is _MISSING:
+            pending.append((market_id, match_ts))
+        else:
+            results[(market_id, match_ts)] = price
+    done = len(results)
+
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency))
+
+    async def worker(market_id: str, match_ts: int) -> None:
+        nonlocal done
+        match_datetime = datetime.fromtimestamp(match_ts, tz=pytz.UTC)
+        params = {
+            "market": market_id,
+            "startTs": match_ts - hours_before * 3600,
+            "endTs": match_ts,
+            "fidelity": fidelity,
+        }
+
+        try:
+            async with semaphore:
+                if cancel.cancelled:
+                    return
+                price_history = await _fetch_price_history_async(
+                    params, timeout, limiter, cancel=cancel
+                )
+
+            entry = extract_match_start_price(
+                price_history, match_datetime, max_hours_before=hours_before
+            )
+            results[(market_id, match_ts)] = entry.get("p") if entry else None
+            if price_history is not None and match_ts <= now:
+                _price_cache.put(
+                    (market_id, match_ts, hours_before, fidelity),
+                    results[(market_id, match_ts)],
+                )
+
+        except Cancelled:
+            return
+
+        except Exception:
+            results[(market_id, match_ts)] = None
+
+        done += 1
+        if progress_callback:
+            progress_callback(done, total)
+
+    await asyncio.gather(*(worker(m, ts) for m, ts in pending))
+    cancel.check()
+    return results
+
+
+async def collect_price_histories(
+    chunks: List[Tuple[str, int]],
+    fidelity: int = 1,
+    timeout: int = 30,
+    max_concurrency: int = 32,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Dict[Tuple[str, int], List[Dict[str, Any]]]:
+    """
+    Histórico de cada par (token, dia) de forma assíncrona: uma requisição por dia
+    de cada token, não importa quantos trades caem nele. Dias em cache não vão à API.
     
-    print(f"🔄 Processo {process_id}: Iniciando processamento de {total_batch} eventos")
+    Args:
+        chunks: Lista de pares (market_id, início do dia em timestamp unix)
+        fidelity: Resolução dos dados em minutos
+        timeout: Timeout da requisição em segundos
+        max_concurrency: Máximo de requisições em voo ao mesmo tempo
+        progress_callback: Chamado como callback(concluídos, total) a cada resposta
+        cancel: (Opcional) CancelToken da busca
     
-    for batch_idx, (idx, row_dict) in enumerate(rows_data):
-        market_id = str(row_dict.get(market_id_col, ''))
-        start_time_str = str(row_dict.get(start_time_col, ''))
-        
-        # Pular se dados incompletos
-        if not market_id or market_id == 'nan' or not start_time_str or start_time_str == 'nan':
-            results.append((idx, None))
-            continue
-        
-        # Converter start_time para datetime
-        try:
-            if isinstance(start_time_str, str):
-                if '+' in start_time_str or start_time_str.endswith('Z'):
-                    match_datetime = pd.to_datetime(start_time_str).to_pydatetime()
-                    if match_datetime.tzinfo is None:
-                        match_datetime = pytz.UTC.localize(match_datetime)
-                    else:
-                        match_datetime = match_datetime.astimezone(pytz.UTC)
-                else:
-                    match_datetime = pd.to_datetime(start_time_str).to_pydatetime()
-                    if match_datetime.tzinfo is None:
-                        match_datetime = pytz.UTC.localize(match_datetime)
-                    else:
-                        match_datetime = match_datetime.astimezone(pytz.UTC)
-            else:
-                match_datetime = pd.to_datetime(start_time_str).to_pydatetime()
-                if match_datetime.tzinfo is None:
-                    match_datetime = pytz.UTC.localize(match_datetime)
-                else:
-                    match_datetime = match_datetime.astimezone(pytz.UTC)
-        except Exception as e:
-            print(f"⚠️  Processo {process_id}, linha {idx}: Erro ao converter start_time: {e}")
-            results.append((idx, None))
-            continue
+    Returns:
+        dict {(market_id, início do dia): (timestamps, preços)} em arrays NumPy
+        (vazios se falhou)
+    """
+    cancel = cancel or CancelToken()
+    limiter = limiter_for(f"{URLS['CLOB']}/prices-history")
+    semaphore = asyncio.Semaphore(max_concurrency)
+    total = len(chunks)
+    results = {}
+    now = time.time()
+    
+    pending = []
+    for market_id, chunk_ts in chunks:
+        history = _history_cache.get((market_id, chunk_ts, fidelity), _MISSING)
+        if history is _MISSING:
+            pending.append((market_id, chunk_ts))
+        else:
+            results[(market_id, chunk_ts)] = history
+    done = len(results)
+    
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=max_concurrency))
+    
+    async def worker(market_id: str, chunk_ts: int) -> None:
+        nonlocal done
+        params = {
+            "market": market_id,
+            "startTs": chunk_ts,
+            "endTs": chunk_ts + HISTORY_CHUNK_SECONDS,
+            "fidelity": fidelity,
+        }
         
-        # Obter preço
         try:
-            price = get_match_start_price(
-                market_id=market_id,
-                match_datetime=match_datetime,
-                hours_before=hours_before,
-                fidelity=fidelity,
-                timeout=timeout
-            )
-            results.append((idx, price))
+            async with semaphore:
+                if cancel.cancelled:
+                    return
+                price_history = await _fetch_price_history_async(
+                    params, timeout, limiter, cancel=cancel
+                )
             
-        except Exception as e:
-            print(f"❌ Processo {process_id}, linha {idx}: Erro ao processar: {e}")
-            results.append((idx, None))
+            history = _history_arrays((price_history or {}).get("history") or [])
+            results[(market_id, chunk_ts)] = history
+            if price_history is not None and chunk_ts + HISTORY_CHUNK_SECONDS <= now:
+                _history_cache.put((market_id, chunk_ts, fidelity), history)
+        
+        except Cancelled:
+            return
         
-        # Delay entre requisições (com jitter)
-        if delay_between_requests > 0:
-            jitter = random.uniform(-0.05, 0.05)
-            delay = max(0.05, base_delay + jitter)
-            time.sleep(delay)
+        except Exception:
+            results[(market_id, chunk_ts)] = _history_arrays([])
         
-        # Log de progresso a cada 10 eventos
-        if (batch_idx + 1) % 10 == 0:
-            print(f"✅ Processo {process_id}: Processados {batch_idx + 1}/{total_batch} eventos do lote")
+        done += 1
+        if progress_callback:
+            progress_callback(done, total)
     
-    print(f"🏁 Processo {process_id}: Concluído - {total_batch} eventos processados")
+    await asyncio.gather(*(worker(m, ts) for m, ts in pending))
+    cancel.check()
     return results
 
 
+def fetch_price_histories(
+    market_ids,
+    timestamps,
+    fidelity: int = 1,
+    timeout: int = 30,
+    max_concurrency: int = 32,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    cancel: Optional[CancelToken] = None,
+) -> Dict[str, Tuple[Any, Any]]:
+    """
+    Histórico de preços que cobre cada par (market_id, timestamp unix), para
+    consultas em lote do preço num instante (ver data.latency.PriceStore).
+    Os instantes são agrupados por dia: uma requisição por (token, dia).
+    
+    Returns:
+        dict {market_id: (timestamps, preços)} em ordem de tempo (arrays NumPy)
+    """
+    keys = pd.DataFrame({
+        'market': pd.Series(market_ids, dtype=str).to_numpy(),
+        'chunk': (
+            pd.Series(timestamps, dtype='int64').to_numpy()
+            // HISTORY_CHUNK_SECONDS * HISTORY_CHUNK_SECONDS
+        ),
+    }).drop_duplicates()
+    chunks = list(zip(keys['market'].tolist(), keys['chunk'].tolist()))
+    
+    histories = _run_async(collect_price_histories(
+        chunks, fidelity, timeout, max_concurrency, progress_callback, cancel,
+    ))
+    
+    parts = {}
+    for (market_id, _), history in histories.items():
+        parts.setdefault(market_id, []).append(history)
+    
+    series = {}
+    for market_id, histories in parts.items():
+        times = np.concatenate([times for times, _ in histories])
+        prices = np.concatenate([prices for _, prices in histories])
+        # Ordem de tempo, um ponto por instante
+        times, first = np.unique(times, return_index=True)
+        series[market_id] = (times, prices[first])
+    return series
+
+
+def _history_arrays(history: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pontos {'t', 'p'} da API -> (timestamps int64, preços float), sem pontos inválidos.
+    """
+    frame = pd.DataFrame(history, columns=['t', 'p']).dropna()
+    return frame['t'].to_numpy(dtype='int64'), frame['p'].to_numpy(dtype=float)
+
+
+def _run_async(coro):
+    """
+    Roda a coroutine até o fim, mesmo se já existir um loop ativo (ex: notebooks).
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
 def process_dataframe(
     df: pd.DataFrame,
     market_id_col: str = "asset",
     start_time_col: str = "start_time",
     hours_before: int = 1,
     fidelity: int = 1,
-    delay_between_requests: float = 0.1,
     timeout: int = 30,
-    num_processes: int = 10,
-    verbose: bool = True
+    max_concurrency: int = 32,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    verbose: bool = True,
+    cancel: Optional[CancelToken] = None,
 ) -> pd.DataFrame:
     """
-    Processa um DataFrame em paralelo e adiciona coluna com a odd antes/início de cada evento
+    Adiciona ao DataFrame uma coluna com a odd antes/início de cada evento
     Busca preços de até 1 hora ANTES do início até o início do jogo (nunca depois)
     
     Args:
@@ -288,93 +478,73 @@ def process_dataframe(
         start_time_col: Nome da coluna que contém a data/hora do evento
         hours_before: Quantas horas antes do início buscar (padrão: 1 hora)
         fidelity: Resolução dos dados em minutos
-        delay_between_requests: Delay em segundos entre requisições (para evitar rate limit)
         timeout: Timeout da requisição em segundos
-        num_processes: Número de processos paralelos (padrão: 10)
+        max_concurrency: Máximo de requisições simultâneas (o ritmo é dado pelo rate limiter)
+        progress_callback: Chamado como callback(concluídos, total) a cada resposta
         verbose: Se True, imprime progresso
+        cancel: (Opcional) CancelToken: cancelada, a coleta levanta Cancelled
     
     Returns:
         DataFrame original com coluna 'match_start_price' adicionada
     """
-    # Criar cópia para não modificar o original
-    result_df = df.copy()
-    
-    # Inicializar coluna de preço
-    result_df['match_start_price'] = None
-    
     # Verificar se as colunas necessárias existem
     if market_id_col not in df.columns:
         raise ValueError(f"Coluna '{market_id_col}' não encontrada no DataFrame")
     if start_time_col not in df.columns:
         raise ValueError(f"Coluna '{start_time_col}' não encontrada no DataFrame")
     
+    # Criar cópia para não modificar o original
+    result_df = df.copy()
     total_rows = len(df)
     
-    # Calcular tamanho do lote por processo
-    events_per_process = max(1, total_rows // num_processes)
+    # Normalizar entradas de uma vez (linhas inválidas ficam sem preço)
+    market_ids = df[market_id_col].astype(str)
+    start_times = pd.to_datetime(
+        df[start_time_col], format='ISO8601', utc=True, errors='coerce'
+    )
+    valid = (
+        df[market_id_col].notna()
+        & ~market_ids.isin(['', 'nan'])
+        & start_times.notna()
+    )
+    match_ts = pd.Series(0, index=df.index, dtype='int64')
+    match_ts[valid] = (
+        (start_times[valid] - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+    )
+    
+    # Vários registros apontam para o mesmo (token, início): uma requisição por par
+    keys = pd.MultiIndex.from_arrays([market_ids, match_ts])
+    unique_keys = keys[valid.to_numpy()].unique().tolist()
     
     if verbose:
-        print(f"📊 Processando {total_rows} eventos em {num_processes} processos paralelos...")
+        print(f"📊 Processando {total_rows} eventos ({len(unique_keys)} consultas únicas)...")
         print(f"   Coluna de market_id: '{market_id_col}'")
         print(f"   Coluna de start_time: '{start_time_col}'")
-        print(f"   Eventos por processo: ~{events_per_process}")
-        print()
-    
-    # Preparar dados para processamento paralelo
-    # Converter DataFrame para lista de dicionários (serializável)
-    rows_data_list = []
-    for idx, row in df.iterrows():
-        row_dict = row.to_dict()
-        rows_data_list.append((idx, row_dict))
-    
-    # Dividir em lotes
-    batches = []
-    for i in range(num_processes):
-        start_idx = i * events_per_process
-        end_idx = (i + 1) * events_per_process if i < num_processes - 1 else total_rows
-        batch_data = rows_data_list[start_idx:end_idx]
-        if batch_data:  # Só adicionar se não estiver vazio
-            batches.append((batch_data, i + 1))
-    
-    if verbose:
-        print(f"🔄 Dividido em {len(batches)} lotes para processamento paralelo")
         print()
     
     start_time = time.time()
-    all_results = []
-    
-    # Processar em paralelo
-    with ProcessPoolExecutor(max_workers=num_processes) as executor:
-        futures = []
-        for batch_data, process_id in batches:
-            future = executor.submit(
-                process_batch,
-                batch_data,
-                market_id_col,
-                start_time_col,
-                hours_before,
-                fidelity,
-                delay_between_requests,
-                timeout,
-                process_id,
-                num_processes
-            )
-            futures.append(future)
-        
-        # Coletar resultados conforme vão chegando
-        for future in as_completed(futures):
-            try:
-                batch_results = future.result()
-                all_results.extend(batch_results)
-                if verbose:
-                    print(f"✅ Lote concluído: {len(batch_results)} eventos processados")
-            except Exception as e:
-                if verbose:
-                    print(f"❌ Erro em lote: {e}")
-    
-    # Aplicar resultados ao DataFrame
-    for idx, price in all_results:
-        result_df.at[idx, 'match_start_price'] = price
+    
+    if progress_callback is None and verbose:
+        with loading_animation("🔄 Coletando preços de fechamento") as anim_status:
+            def show_progress(done: int, total: int) -> None:
+                anim_status['message'] = f"🔄 Coletando preços de fechamento ({done} de {total})"
+            
+            prices = _run_async(collect_match_start_prices(
+                unique_keys, hours_before, fidelity, timeout,
+                max_concurrency, show_progress, cancel,
+            ))
+    else:
+        prices = _run_async(collect_match_start_prices(
+            unique_keys, hours_before, fidelity, timeout,
+            max_concurrency, progress_callback, cancel,
+        ))
+    
+    result_df['match_start_price'] = float('nan')
+    if prices:
+        price_map = pd.Series(prices, dtype=float)
+        result_df.loc[valid, 'match_start_price'] = (
+            price_map.reindex(keys[valid.to_numpy()]).to_numpy()
+        )
     
     end_time = time.time()
     elapsed_time = end_time - start_time
@@ -391,7 +561,7 @@ def process_dataframe(
         print(f"   Total: {total_rows} eventos")
         print(f"   Sucessos: {success_count}")
         print(f"   Erros: {error_count}")
-        print(f"   Taxa de sucesso: {(success_count/total_rows*100):.1f}%")
+        print(f"   Taxa de sucesso: {(success_count/max(total_rows, 1)*100):.1f}%")
         print("=" * 80)
     
     return result_df
@@ -435,10 +605,7 @@ def main():
         
         # Processar DataFrame - TODOS os eventos
         total_events = len(df)
-        estimated_time_minutes = (total_events * 0.1) / 60
         print(f"🔍 Processando TODOS os {total_events} eventos...")
-        print(f"   ⏱️  Tempo estimado: ~{estimated_time_minutes:.1f} minutos")
-        print(f"   (Delay de {0.1}s entre requisições para evitar rate limit)")
         print()
         
         result_df = process_dataframe(
@@ -446,7 +613,6 @@ def main():
             market_id_col="asset",
             start_time_col="start_time",
             hours_before=1,  # Buscar preços de até 1 hora antes do início
-            num_processes=10,  # Número de processos paralelos
             verbose=True
         )
         
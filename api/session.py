@@ -0,0 +1,318 @@
+"""
+Sessão HTTP compartilhada e escalonador de requisições para as APIs da polymarket.
+Toda requisição passa por request()/request_async(): espera a vez na fila do
+limiter do endpoint (por prioridade, ver RateLimiter) e usa a sessão compartilhada.
+"""
+import os
+import time
+import asyncio
+import threading
+import requests
+from collections import OrderedDict, deque
+from requests.adapters import HTTPAdapter
+from api.config import RATE_LIMITS, URL_LIMITS, HTTP_POOL_SIZE
+from data.cache import value_nbytes
+
+# Classes de prioridade (ver CancelToken.priority), da mais urgente para a menos
+PRIORITIES = ('interactive', 'normal', 'background')
+# Divisão dos slots entre interactive e normal quando as duas têm fila
+PRIORITY_WEIGHTS = {'interactive': 4, 'normal': 1}
+# Parte do bucket que buscas de fundo (prefetch) nunca consomem: fica para o primeiro plano
+SPARE_RESERVE = 0.5
+# Intervalo máximo entre verificações de quem espera (cancelamento, promoção)
+POLL_SECONDS = 0.1
+
+
+_session = None
+_session_lock = threading.Lock()
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _reset_after_fork() -> None:
+    # Processos-filhos (ProcessPoolExecutor) não podem reaproveitar os sockets do pai
+    global _session, _session_lock
+    _session = None
+    _session_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_session() -> requests.Session:
+    """
+    Retorna a sessão HTTP do processo (criada na primeira chamada).
+    O pool de conexões é reaproveitado por todas as threads.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_SIZE,
+                    pool_maxsize=HTTP_POOL_SIZE,
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+
+    return _session
+
+
+class _Ticket:
+    """
+    Lugar de uma chamada na fila do limiter.
+    """
+    __slots__ = ('owner', 'priority', 'granted')
+
+    def __init__(self, cancel):
+        self.owner = cancel
+        self.priority = getattr(cancel, 'priority', 'normal')
+        self.granted = False
+
+
+class RateLimiter:
+    """
+    Token bucket com fila por prioridade: o escalonador de uma família de endpoints.
+    Cada chamada entra na fila da classe do seu CancelToken (sem token: 'normal'):
+    - interactive e normal dividem os slots na proporção de PRIORITY_WEIGHTS
+    - background só leva a folga: nenhuma outra classe na fila e o bucket
+      acima da reserva (SPARE_RESERVE)
+    - dentro de uma classe, as buscas (um CancelToken cada) se revezam
+    Funciona entre threads e dentro de um event loop.
+    """
+
+    def __init__(
+        self,
+        requests_per_window: int,
+        window_seconds: float,
+        ):
+        self.interval = window_seconds / requests_per_window
+        self.capacity = requests_per_window
+        self.reserve = int(requests_per_window * SPARE_RESERVE)
+        self._next_slot = time.monotonic()
+        # Classe -> {dono: fila de tickets}; a ordem dos donos é a do revezamento
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        # Passo de cada classe com peso (stride scheduling): a menor é a próxima
+        self._pass = {priority: 0.0 for priority in PRIORITY_WEIGHTS}
+        self._cond = threading.Condition()
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        queue = self._queues[ticket.priority]
+        if not queue and ticket.priority in self._pass:
+            # Classe que volta a ter fila não acumula crédito do tempo parada
+            active = [self._pass[p] for p in self._pass if self._queues[p]]
+            if active:
+                self._pass[ticket.priority] = max(self._pass[ticket.priority], min(active))
+        queue.setdefault(ticket.owner, deque()).append(ticket)
+
+    def _remove(self, ticket: _Ticket) -> None:
+        queue = self._queues[ticket.priority]
+        tickets = queue.get(ticket.owner)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del queue[ticket.owner]
+
+    def _requeue(self, ticket: _Ticket) -> None:
+        # A busca mudou de prioridade enquanto esperava (ex.: prefetch promovido)
+        priority = getattr(ticket.owner, 'priority', 'normal')
+        if priority != ticket.priority:
+            self._remove(ticket)
+            ticket.priority = priority
+            self._enqueue(ticket)
+
+    def _next_class(self) -> str | None:
+        weighted = [p for p in PRIORITY_WEIGHTS if self._queues[p]]
+        if weighted:
+            return min(weighted, key=self._pass.get)
+        if self._queues['background']:
+            return 'background'
+        return None
+
+    def _dispatch(self) -> float:
+        """
+        Concede os slots disponíveis aos próximos da fila (de qualquer
+        thread ou task) e retorna quanto falta para o próximo slot.
+        """
+        while True:
+            priority = self._next_class()
+            if priority is None:
+                return POLL_SECONDS
+
+            now = time.monotonic()
+            # Permite rajadas até o tamanho da janela, nunca além disso
+            slot = max(self._next_slot, now - (self.capacity - 1) * self.interval)
+            ready = slot + self.reserve * self.interval if priority == 'background' else slot
+            if ready > now:
+                return ready - now
+
+            # Primeiro dono da fila leva o slot e vai para o fim (revezamento)
+            queue = self._queues[priority]
+            owner, tickets = next(iter(queue.items()))
+            ticket = tickets.popleft()
+            del queue[owner]
+            if tickets:
+                queue[owner] = tickets
+
+            ticket.granted = True
+            self._next_slot = slot + self.interval
+            if priority in self._pass:
+                self._pass[priority] += 1 / PRIORITY_WEIGHTS[priority]
+            self._cond.notify_all()
+
+    def acquire(self, cancel=None) -> None:
+        """
+        Espera a vez da chamada na fila.
+        cancel: (Opcional) CancelToken da busca: define a prioridade e o
+                revezamento; cancelado, a espera termina com Cancelled
+        """
+        ticket = _Ticket(cancel)
+        with self._cond:
+            self._enqueue(ticket)
+            try:
+                while True:
+                    wait = self._dispatch()
+                    if ticket.granted:
+                        return
+                    if cancel is not None:
+                        cancel.check()
+                        self._requeue(ticket)
+                    self._cond.wait(min(wait, POLL_SECONDS))
+            finally:
+                if not ticket.granted:
+                    self._remove(ticket)
+
+    async def acquire_async(self, cancel=None) -> None:
+        ticket = _Ticket(cancel)
+        with self._cond:
+            self._enqueue(ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._dispatch()
+                    if ticket.granted:
+                        return
+                    if cancel is not None:
+                        cancel.check()
+                        self._requeue(ticket)
+                await asyncio.sleep(min(wait, POLL_SECONDS))
+        finally:
+            if not ticket.granted:
+                with self._cond:
+                    self._remove(ticket)
+
+    def waiting(self) -> dict:
+        # Chamadas na fila por classe
+        with self._cond:
+            return {
+                priority: sum(len(tickets) for tickets in queue.values())
+                for priority, queue in self._queues.items()
+            }
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Empurra o próximo slot (usado quando a API responde 429).
+        """
+        with self._cond:
+            self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+def get_limiter(name: str) -> RateLimiter:
+    """
+    Retorna o limiter compartilhado de uma família de endpoints (ver RATE_LIMITS).
+    """
+    if name not in _limiters:
+        with _limiters_lock:
+            if name not in _limiters:
+                _limiters[name] = RateLimiter(*RATE_LIMITS[name])
+    return _limiters[name]
+
+
+def limiter_for(url: str) -> RateLimiter:
+    # Limiter da família do endpoint (ver URL_LIMITS)
+    return get_limiter(URL_LIMITS[url])
+
+
+def request(
+    method: str,
+    url: str,
+    cancel=None,
+    **kwargs,
+    ) -> requests.Response:
+    """
+    Faz a requisição quando chegar a vez dela no limiter do endpoint.
+    cancel: (Opcional) CancelToken da busca (prioridade e cancelamento)
+    kwargs: repassados a requests.Session.request (params, json, timeout...)
+    """
+    limiter_for(url).acquire(cancel)
+    return get_session().request(method, url, **kwargs)
+
+
+async def request_async(
+    method: str,
+    url: str,
+    cancel=None,
+    **kwargs,
+    ) -> requests.Response:
+    # Como request(); a requisição roda numa thread do pool para não bloquear o event loop
+    await limiter_for(url).acquire_async(cancel)
+    return await asyncio.to_thread(get_session().request, method, url, **kwargs)
+
+
+class ResponseCache:
+    """
+    Respostas já buscadas, compartilhadas pelo processo (LRU com idade máxima).
+    O prefetch aquece e as buscas em primeiro plano leem daqui.
+    budget_bytes: (Opcional) limite também pelo tamanho dos valores (value_nbytes:
+    só o que tem 'nbytes', ex.: arrays NumPy, conta)
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_age: float | None = None,
+        budget_bytes: int | None = None,
+        ):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.budget_bytes = budget_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()   # key -> (guardado em, valor, bytes)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if self.max_age is not None and time.monotonic() - entry[0] > self.max_age:
+                del self._entries[key]
+                self.nbytes -= entry[2]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value) -> None:
+        nbytes = value_nbytes(value) if self.budget_bytes is not None else 0
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            self._entries[key] = (time.monotonic(), value, nbytes)
+            self.nbytes += nbytes
+
+            # Remove as menos usadas até caber (a recém-guardada fica)
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries
+                or (self.budget_bytes is not None and self.nbytes > self.budget_bytes)
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted[2]
+
+    def __len__(self) -> int:
+        return len(self._entries)
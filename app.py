@@ -6,8 +6,6 @@ from dashboard.pages import user_analysis
 # Importar o dataframe que vamos usar para testes
 
 
-st.set_page_config(layout="wide")
-
 def generate_dashboard():
     elements.top_bar()
     
@@ -29,4 +27,8 @@ def generate_dashboard():
     
 
 
-generate_dashboard()
\ No newline at end of file
+# O streamlit roda este script como __main__; processos filhos (ex.: workers do
+# sweep do simulador, via forkserver) o importam como __mp_main__ e não montam a página
+if __name__ == "__main__":
+    st.set_page_config(layout="wide")
+    generate_dashboard()
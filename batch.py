@@ -0,0 +1,249 @@
+"""
+Análise em lote de carteiras (sem dashboard).
+
+Uso:
+    python batch.py wallets.txt --output batch_results.parquet --workers 4
+
+- Rede: downloads em threads no processo principal; sessão HTTP, rate limiters
+  e cache de metadados de mercado são compartilhados entre todas as carteiras.
+- CPU: a análise de cada carteira (data.summary) roda em um ProcessPoolExecutor,
+  em paralelo com o download das próximas.
+- Checkpoint: cada carteira concluída vira uma linha em <output>.checkpoint.jsonl;
+  rodar de novo pula as carteiras já concluídas.
+- Saída: um único arquivo colunar com uma linha por carteira
+  (Parquet; CSV se não houver engine de Parquet instalada).
+- Leaderboard (--leaderboard): cada carteira analisada também é gravada
+  no leaderboard do dashboard (data.leaderboard), com o breakdown por tag.
+"""
+import os
+import json
+import multiprocessing
+import argparse
+import pandas as pd
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from helpers import sep
+from api.fetch_subgraph import fetch_pnl_data
+from data.summary import wallet_profile, SUMMARY_COLUMNS
+from data.leaderboard import Leaderboard, LEADERBOARD_PATH
+from data.significance import N_RESAMPLES
+
+BATCH_COLUMNS = SUMMARY_COLUMNS + ['analysed_at']
+# Processos de análise nascem do forkserver (como os do sweep, ver
+# copytrade.SWEEP_START_METHOD): são criados sob demanda com os downloads rodando,
+# e um fork copiaria travados os locks da sessão HTTP e do rate limiter
+ANALYSIS_START_METHOD = 'forkserver'
+
+
+def read_lines(path: str) -> list[str]:
+    """
+    Um item por linha; linhas vazias e comentários (#) são ignorados.
+    Itens repetidos entram uma vez só.
+    """
+    items = []
+    with open(path) as f:
+        for line in f:
+            item = line.split('#', 1)[0].strip()
+            if item and item not in items:
+                items.append(item)
+    return items
+
+
+def read_wallets(path: str) -> list[str]:
+    return list(dict.fromkeys(wallet.lower() for wallet in read_lines(path)))
+
+
+def checkpoint_path(output: str) -> str:
+    return f"{os.path.splitext(output)[0]}.checkpoint.jsonl"
+
+
+def load_checkpoint(path: str) -> dict:
+    """
+    Carteiras já concluídas: {wallet: resumo}. A última linha de cada carteira vale.
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Linha cortada por uma interrupção
+            done[record['wallet']] = record
+    return done
+
+
+def append_checkpoint(path: str, record: dict) -> None:
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+        f.flush()
+
+
+def error_record(wallet: str, error: Exception) -> dict:
+    record = dict.fromkeys(SUMMARY_COLUMNS)
+    record.update(wallet=wallet, status='error', error=f"{type(error).__name__}: {error}")
+    return record
+
+
+def write_output(df: pd.DataFrame, output: str) -> str:
+    """
+    Grava o resultado consolidado. Retorna o caminho efetivamente escrito.
+    """
+    if output.endswith('.csv'):
+        df.to_csv(output, index=False)
+        return output
+
+    try:
+        df.to_parquet(output, index=False)
+        return output
+    except ImportError:
+        csv_output = f"{os.path.splitext(output)[0]}.csv"
+        print(f"⚠️  Nenhuma engine de Parquet instalada (pyarrow/fastparquet). Gravando {csv_output}")
+        df.to_csv(csv_output, index=False)
+        return csv_output
+
+
+def _finish(
+    wallet: str,
+    record: dict,
+    checkpoint: str,
+    done: dict,
+    ) -> None:
+    # Grava a carteira concluída no checkpoint
+    record['analysed_at'] = datetime.now(timezone.utc).isoformat()
+    append_checkpoint(checkpoint, record)
+    done[wallet] = record
+
+    if record['status'] == 'ok':
+        detail = f" | ROI {record['roi']:.2%} em {record['bets']} apostas"
+    elif record['status'] == 'error':
+        detail = f" | {record['error']}"
+    else:
+        detail = ''
+    print(f"[{len(done)}] {wallet}: {record['status']}{detail}")
+
+
+def run_batch(
+    wallets: list[str],
+    output: str = 'batch_results.parquet',
+    workers: int | None = None,
+    fetch_workers: int = 1,
+    n_resamples: int = N_RESAMPLES,
+    retry_errors: bool = False,
+    leaderboard: str | None = None,
+    ) -> pd.DataFrame:
+    """
+    Roda fetch_pnl_data -> wallet_summary para cada carteira e grava
+    o resultado consolidado em 'output'. Retorna o DataFrame consolidado.
+    workers:       processos para a análise (CPU)
+    fetch_workers: carteiras baixando ao mesmo tempo (I/O); a vazão de
+                   fato é limitada pelos rate limiters de api.session
+    leaderboard:   (Opcional) arquivo do leaderboard a atualizar
+    """
+    workers = workers or os.cpu_count() or 1
+    board = Leaderboard(leaderboard) if leaderboard else None
+    checkpoint = checkpoint_path(output)
+    done = load_checkpoint(checkpoint)
+
+    pending = [
+        wallet for wallet in wallets
+        if wallet not in done
+        or (retry_errors and done[wallet]['status'] == 'error')
+    ]
+    print(sep())
+    print(f"{len(wallets)} carteiras | {len(wallets) - len(pending)} no checkpoint | "
+          f"{len(pending)} a analisar ({fetch_workers} downloads, {workers} processos)")
+    print(sep())
+
+    queue = iter(pending)
+    fetching, analysing = {}, {}
+
+    try:
+        with ThreadPoolExecutor(max_workers=fetch_workers) as network, \
+             ProcessPoolExecutor(
+                 max_workers=workers,
+                 mp_context=multiprocessing.get_context(ANALYSIS_START_METHOD),
+             ) as analysis:
+
+            def refill():
+                # Fan-out limitado: nunca mais que fetch_workers downloads e,
+                # se a análise ficar para trás, para de baixar (limita memória)
+                while len(fetching) < fetch_workers and len(analysing) < 2 * workers:
+                    wallet = next(queue, None)
+                    if wallet is None:
+                        return
+                    fetching[network.submit(fetch_pnl_data, wallet)] = wallet
+
+            refill()
+            while fetching or analysing:
+                finished, _ = wait([*fetching, *analysing], return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    if future in fetching:
+                        wallet = fetching.pop(future)
+                        try:
+                            closed_df, active_df = future.result()
+                        except Exception as e:
+                            _finish(wallet, error_record(wallet, e), checkpoint, done)
+                            continue
+                        analysing[analysis.submit(
+                            wallet_profile, wallet, closed_df, active_df, n_resamples
+                        )] = wallet
+                    else:
+                        wallet = analysing.pop(future)
+                        try:
+                            record, tags = future.result()
+                        except Exception as e:
+                            record, tags = error_record(wallet, e), None
+                        _finish(wallet, record, checkpoint, done)
+
+                        if board is not None and record['status'] == 'ok':
+                            board.upsert(record, tags)
+
+                refill()
+
+    finally:
+        # Mesmo interrompido, grava o que já foi concluído
+        records = [done[wallet] for wallet in wallets if wallet in done]
+        results = pd.DataFrame(records, columns=BATCH_COLUMNS)
+        path = write_output(results, output)
+        print(sep())
+        print(f"{len(records)} carteiras gravadas em {path}")
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Análise em lote de carteiras da Polymarket."
+    )
+    parser.add_argument('wallets', help="Arquivo com um endereço por linha")
+    parser.add_argument('-o', '--output', default='batch_results.parquet',
+                        help="Arquivo de saída (.parquet ou .csv)")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="Processos para a análise (padrão: número de CPUs)")
+    parser.add_argument('-f', '--fetch-workers', type=int, default=4,
+                        help="Carteiras baixando ao mesmo tempo")
+    parser.add_argument('--resamples', type=int, default=N_RESAMPLES,
+                        help="Reamostras do bootstrap por carteira")
+    parser.add_argument('--retry-errors', action='store_true',
+                        help="Analisa de novo as carteiras que falharam no checkpoint")
+    parser.add_argument('--leaderboard', nargs='?', const=LEADERBOARD_PATH, default=None,
+                        help="Grava também no leaderboard (padrão: %(const)s)")
+    args = parser.parse_args()
+
+    run_batch(
+        read_wallets(args.wallets),
+        output=args.output,
+        workers=args.workers,
+        fetch_workers=args.fetch_workers,
+        n_resamples=args.resamples,
+        retry_errors=args.retry_errors,
+        leaderboard=args.leaderboard,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,13 @@
+import uuid
 import numpy as np
 import pandas as pd
 import streamlit as st
 from dashboard.ui import formatting
+from data.tags import TagIndex
+from data.dataset import WalletDataset
 from data.analysis import DataAnalyst
 from dashboard.backend import data_helpers as dh
+from dashboard.backend.user_data import get_leaderboard
 
 def filter_clv_df(
     df:pd.DataFrame,
@@ -104,24 +108,40 @@ def fetch_clv(
 def render_clv_section(
     df: pd.DataFrame,
     user_address: str,
+    tag_index: TagIndex | None = None,
+    persist: bool = False,
+    dataset: WalletDataset | None = None,
 ):
     """
     Controla toda a lógica de exibição do CLV:
     1. Mostra o botão.
-    2. Se clicado, calcula e SALVA os dados no st.session_state.
+    2. Se clicado, calcula e SALVA os dados no st.session_state
+       (e no leaderboard, se persist=True).
     3. Em CADA re-execução, LÊ os dados e chama display_clv.
+    dataset: (Opcional) de onde 'df' saiu; guarda o bootstrap do CLV (memo)
     """
     st.header('Closing Line Value Stats')
     # 1. O Botão (Calcula e Salva)
     if st.button('Fetch CLV for Filtered User Trades'):
         with st.spinner("Fetching CLV data..."):
-            # Chama a função de cálculo
-            clv_df = DataAnalyst.calculate_clv(
+            # Chama a função de cálculo (numa thread: trocar de carteira cancela a busca)
+            clv_df = dh.run_cancellable(
+                DataAnalyst.calculate_clv,
                 user_address=user_address,
-                df=df
+                df=df,
+                message="Fetching CLV data...",
             )
             # Salva os DADOS BRUTOS (DataFrame) no estado
             st.session_state['clv_data'] = clv_df
+            # Identifica o resultado (memo do bootstrap): cada busca é única
+            st.session_state['clv_key'] = (
+                (dataset.version, uuid.uuid4().hex) if dataset is not None else None
+            )
+            
+            if persist and clv_df is not None:
+                get_leaderboard().update_clv(
+                    user_address.lower(), clv_df, tag_index=tag_index
+                )
 
     # 2. A Exibição (Lê e Desenha)
     # Isso roda em TODA re-execução, garantindo que o CLV
@@ -133,14 +153,22 @@ def render_clv_section(
         # Garante que os dados existem antes de tentar exibir
         if clv_data is not None and not clv_data.empty:
             # Chama a função de exibição
-            display_clv(df=clv_data)
+            display_clv(
+                df=clv_data, tag_index=tag_index,
+                dataset=dataset, key=st.session_state.get('clv_key'),
+            )
         elif clv_data is None:
             # Limpa o estado se a função de cálculo falhou (retornou None)
             st.error("Erro ao calcular CLV. A função não retornou dados.")
             del st.session_state['clv_data']
 
 
-def display_clv(df: pd.DataFrame):
+def display_clv(
+    df: pd.DataFrame,
+    tag_index: TagIndex | None = None,
+    dataset: WalletDataset | None = None,
+    key: tuple | None = None,
+    ):
     """
     Recebe um DataFrame de CLV já calculado e exibe
     o expander, o dataframe formatado e as estatísticas.
@@ -154,9 +182,13 @@ def display_clv(df: pd.DataFrame):
     
     
 
-    print_clv_data(df=df)
+    print_clv_data(df=df, tag_index=tag_index, dataset=dataset, key=key)
     
 
+    with st.expander("CLV by Position Size"):
+        stake_styler, _ = dh.create_stake_df(df=df)
+        st.dataframe(data=stake_styler, hide_index=True, width='stretch')
+
     with st.expander("All CLV Data", expanded=True):
     
         # 3. Exibe o DataFrame
@@ -171,7 +203,12 @@ def display_clv(df: pd.DataFrame):
     
 
 
-def print_clv_data(df: pd.DataFrame) -> None:
+def print_clv_data(
+    df: pd.DataFrame,
+    tag_index: TagIndex | None = None,
+    dataset: WalletDataset | None = None,
+    key: tuple | None = None,
+    ) -> None:
     # 1. Cálculos (seu código original)
     total_rows = len(df)
     
@@ -201,11 +238,23 @@ def print_clv_data(df: pd.DataFrame) -> None:
     # --- Linha 2: Métricas de CLV (Valor de Fechamento) ---
     st.subheader("Closing Line Value (CLV)")
     
-    # Cria 3 colunas para os "cartões"
-    cols = st.columns(3)
-    cols[0].metric(label="Markets", value=df['tags'].explode().nunique())
+    # Cria 4 colunas para os "cartões"
+    cols = st.columns(4)
+    tag_index = TagIndex.for_frame(df, tag_index)
+    cols[0].metric(label="Markets", value=tag_index.unique_tags(df))
     cols[1].metric(label="CLV+ (Beat Market)", value=f"{pos_clv * 100:.2f}%")
     cols[2].metric(label="CLV- (Lost to Market)", value=f"{neg_clv * 100:.2f}%")
+    
+    # CLV médio com intervalo de confiança (bootstrap)
+    clv_boot = dh.bootstrap_summary(df, dataset, key)['clv']
+    cols[3].metric(
+        label="Avg CLV",
+        value=formatting.float_to_pct(clv_boot['estimate']),
+    )
+    cols[3].caption(
+        f"95% CI: {formatting.float_to_interval(clv_boot['low'], clv_boot['high'])}"
+        f" · {formatting.format_p_value(clv_boot['p_value'])}"
+    )
 
     
     
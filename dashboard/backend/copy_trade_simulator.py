@@ -1,15 +1,56 @@
+import uuid
 import pandas as pd
 import streamlit as st
-from helpers import safe_divide
+from data import copytrade, portfolio, latency
+from data.dataset import WalletDataset
+from data.prefetch import WALLET_ADDRESS
 from dashboard.ui import elements
 import plotly.graph_objects as go
 from api.fetch_clv import fetch_clv
+from api.jobs import CancelToken
 from dashboard.backend import data_helpers as dh
+from dashboard.backend import user_data
+
+STRATEGY_OPTIONS = ["Flat Staking", "Capped", "2x Flat"]
+SELL_OPTIONS = ["Proportional", "One Sell Dumps All", "Never Sell"]
+
+# Grades iniciais do modo Sweep
+DEFAULT_STAKE_GRID = "50, 100, 250, 500, 1000"
+DEFAULT_TRIGGER_GRID = "1, 5, 10, 25"
+# Limite de combinações por sweep (cada uma é uma simulação completa)
+MAX_SWEEP_COMBINATIONS = 2000
+
+# Modo Portfolio: carteiras copiadas da mesma banca
+MAX_PORTFOLIO_WALLETS = 20
+DEFAULT_BANKROLL = 10_000.00
+
+SWEEP_METRICS = {
+    'pnl': 'Total PnL ($)',
+    'roi': 'ROI (%)',
+    'max_drawdown': 'Max Drawdown ($)',
+}
+
 
 def run(
-    df: pd.DataFrame,
-    tags: list
+    dataset: WalletDataset,
+    tags: list,
     ) -> None:
+    mode = st.segmented_control(
+        "Mode",
+        options=["Single", "Sweep", "Portfolio"],
+        default="Single",
+        help=(
+            "Sweep: every combination of stake, trigger and strategies on the same trades. "
+            "Portfolio: several traders copied from one bankroll."
+        ),
+    )
+    if mode == "Sweep":
+        run_sweep(dataset, tags)
+        return
+    if mode == "Portfolio":
+        run_portfolio()
+        return
+
     cols = st.columns([1, 2])
     
     with cols[0]:
@@ -26,21 +67,32 @@ def run(
                 
                 # 2. Gera o novo DF Simulado
                 sim_df = get_df(
-                    df=df,
-                    params=params 
+                    dataset=dataset,
+                    params=params,
                 )
                 
                 if not sim_df.empty:
 
-                    final_result_df = run_flat_sim_calculation(
-                        df=sim_df,
-                        copy_stake=params['stake'],
-                        trigger=params['trigger'],
-                        strategy=params['strategy'],
-                        sell_strategy=params['sell_strategy']
-                    )
+                    if params['latency']:
+                        final_result_df, latency_df = run_latency_calculation(
+                            df=sim_df,
+                            params=params,
+                        )
+                    else:
+                        final_result_df = run_flat_sim_calculation(
+                            df=sim_df,
+                            copy_stake=params['stake'],
+                            trigger=params['trigger'],
+                            strategy=params['strategy'],
+                            sell_strategy=params['sell_strategy']
+                        )
+                        latency_df = None
                     
                     st.session_state['simulation_result'] = final_result_df
+                    st.session_state['latency_result'] = latency_df
+                    # Identifica o resultado (cache dos exports das tabelas).
+                    # Cada simulação é única: o CLV é buscado de novo a cada execução
+                    st.session_state['simulation_key'] = (dataset.version, uuid.uuid4().hex)
                     
                     st.success("Simulation Ended")
                     
@@ -48,9 +100,17 @@ def run(
                     st.warning("No trade found for the given filters.")
                     # Limpa resultados anteriores se a nova busca for vazia
                     st.session_state['simulation_result'] = None
+                    st.session_state['latency_result'] = None
 
         if st.session_state.get('simulation_result') is not None:
-            display_sim_results(st.session_state['simulation_result'])
+            display_sim_results(
+                st.session_state['simulation_result'],
+                export_key=st.session_state.get('simulation_key'),
+                export_dataset=dataset,
+            )
+        
+        if st.session_state.get('latency_result') is not None:
+            display_latency_results(st.session_state['latency_result'])
 
 
 def get_params(
@@ -86,7 +146,7 @@ def get_params(
     st.divider()
 
     # 3- Strategy
-    strategy_options = ["Flat Staking", "Capped", "2x Flat"]
+    strategy_options = STRATEGY_OPTIONS
     strategy_captions = [
         "Assuming all bets would be made with the selected stake",
         "Bets lower than stake are copied as is. Higher bets are capped to the selected Stake.",
@@ -114,7 +174,7 @@ def get_params(
     
     st.divider()
     
-    sell_options = ["Proportional", "One Sell Dumps All", "Never Sell"]
+    sell_options = SELL_OPTIONS
     sell_captions = [
         "Standard: If trader sells 10%, you sell 10%.",
         "Panic Mode: If trader sells any amount, you close the entire position.",
@@ -127,6 +187,17 @@ def get_params(
         captions=sell_captions,
         index=0
     )
+    
+    st.divider()
+    
+    # 5- Latência da cópia (preço do CLOB em timestamp + latência)
+    copy_latency = st.select_slider(
+        label="Copy Latency",
+        options=latency.LATENCIES,
+        value=0,
+        format_func=format_latency,
+        help="Copied fills are priced from the token's price history at trade time + latency.",
+    )
         
     return {
         "user": st.session_state.get('selected_wallet', ''),
@@ -135,19 +206,30 @@ def get_params(
         "trigger": trigger_value,
         "selected_tags": selected_tags,
         "sell_strategy": selected_sell_strat,
+        "latency": copy_latency,
     }
 
 
+def format_latency(seconds: int) -> str:
+    # 0 -> 'None', 30 -> '30s', 120 -> '2min'
+    if not seconds:
+        return "None"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}min"
+    return f"{seconds}s"
+
+
 def get_df(
-    df: pd.DataFrame,
-    params: dict
+    dataset: WalletDataset,
+    params: dict,
     ) -> pd.DataFrame:
     """
     Orquestra a filtragem e busca de dados da API (Fetch CLV).
     Recebe 'params' explicitamente para garantir consistência.
     """
     
-    filtered_data_dict = filter_df(df, params)
+    df = dataset.frame
+    filtered_data_dict = filter_df(dataset, params)
     
     trades_df = fetch_clv(
         df=filtered_data_dict['raw'],
@@ -157,21 +239,35 @@ def get_df(
     if trades_df.empty:
         return pd.DataFrame()
 
-    won_map = df.drop_duplicates('asset').set_index('asset')['curPrice']
-    trades_df['won'] = trades_df['asset'].map(won_map)
+    return attach_positions(trades_df, df)
+
+
+def attach_positions(
+    trades_df: pd.DataFrame,
+    positions_df: pd.DataFrame,
+    ) -> pd.DataFrame:
+    """
+    Dados da posição em cada trade, pelo asset: resultado ('won', do curPrice),
+    stake do trader (o modo Sweep filtra por ela) e 'endDate' (liquidação no Portfolio).
+    """
+    positions = positions_df.drop_duplicates('asset').set_index('asset')
+    trades_df['won'] = trades_df['asset'].map(positions['curPrice'])
+    for column in ['staked', 'endDate']:
+        if column in positions.columns:
+            trades_df[column] = trades_df['asset'].map(positions[column])
 
     return trades_df
     
     
 def filter_df(
-    df: pd.DataFrame,
-    params: dict
+    dataset: WalletDataset,
+    params: dict,
     ) -> dict:
     """
     Wrapper para chamar o elements.get_filtered_df com os parâmetros corretos.
     """
     return elements.get_filtered_df(
-        df=df,
+        dataset=dataset,
         tags=params['selected_tags'],
         stake=params['stake'],
     )
@@ -184,218 +280,562 @@ def run_flat_sim_calculation(
     strategy: str,
     sell_strategy: str,
     ) -> pd.DataFrame:
+    """
+    Uma linha por asset com os resultados da cópia e do trader.
+    O cálculo roda sobre arrays (ver data.copytrade): o lado do trader com
+    operações cumulativas e só a lógica da cópia num laço.
+    """
+    return copytrade.run_simulation(
+        df,
+        copy_stake=copy_stake,
+        trigger=trigger,
+        strategy=strategy,
+        sell_strategy=sell_strategy,
+    )
+
+
+def run_latency_calculation(
+    df: pd.DataFrame,
+    params: dict,
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Simulação com a cópia precificada em timestamp + latência e a comparação
+    entre as latências de data.latency.LATENCIES (mesmos fills e mesma passada
+    do trader; o histórico de preços é buscado uma vez para todas).
+    """
+    fills = copytrade.Fills(df)
+    if fills.n_assets == 0:
+        return pd.DataFrame(), None
+    trader = copytrade.TraderPass(fills)
     
-    if 'timestamp' in df.columns:
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s', errors='coerce')
-        df = df.sort_values(by='timestamp', ascending=True)
+    store = dh.run_cancellable(
+        latency.load_store, fills, message="Fetching price history..."
+    )
+    prices, _ = latency.copy_prices(fills, store, params['latency'])
+    
+    sim_params = {
+        'copy_stake': params['stake'],
+        'trigger': params['trigger'],
+        'strategy': params['strategy'],
+        'sell_strategy': params['sell_strategy'],
+    }
+    result = copytrade.simulate(fills, trader, **sim_params, prices=prices)
+    return result, latency.latency_table(fills, trader, store, **sim_params)
+
 
-    grouped = df.groupby('asset')
-    copy_trade_list = [] 
+def display_latency_results(
+    data: pd.DataFrame,
+    ) -> None:
+    """
+    Quanto do edge sobrevive a cada latência (PnL, ROI e preço médio contra a
+    cópia no preço do trader).
+    """
+    st.write("### Latency Impact")
+    st.caption(
+        "Copy fills priced from the CLOB price history (1 minute resolution): the first "
+        "point at or after trade time + latency, at most one point later. Coverage: "
+        "copied fills with a price point; the rest keep the trader's price."
+    )
     
-    for _, asset_df in grouped:
-        
-        # --- INICIALIZAÇÃO ---
-        trader_shares = 0.0
-        trader_usdc = 0.0 
-        trader_realized_profit = 0.0 
-        
-        trader_gross_bought_usd = 0.0 
-        trader_gross_shares_bought = 0.0 
-        
-        trader_gross_sold_usd = 0.0 
-        trader_gross_shares_sold = 0.0 
-        
-        trader_buy_txs = 0
-        trader_sell_txs = 0
+    labels = data['latency'].map(format_latency)
+    fig = go.Figure(go.Bar(
+        x=labels,
+        y=data['pnl'],
+        marker_color=["#60E224" if pnl > 0 else "#E22424" for pnl in data['pnl']],
+        hovertemplate='$%{y:,.2f}<extra></extra>',
+    ))
+    fig.update_layout(
+        xaxis_title="Latency",
+        yaxis_title="Copy PnL",
+        template="plotly_dark",
+        height=300,
+    )
+    st.plotly_chart(fig, width='stretch')
+    
+    st.dataframe(
+        data.assign(latency=labels),
+        column_config={
+            "latency": st.column_config.TextColumn("Latency"),
+            "pnl": st.column_config.NumberColumn("PnL", format="$%.2f"),
+            "roi": st.column_config.NumberColumn("ROI", format="%.2f%%"),
+            "edge_retained": st.column_config.NumberColumn("Edge Retained", format="%.1f%%"),
+            "avg_buy": st.column_config.NumberColumn("Avg Buy", format="%.3f"),
+            "slippage": st.column_config.NumberColumn("Slippage", format="%.2f%%"),
+            "coverage": st.column_config.NumberColumn("Coverage", format="%.1f%%"),
+        },
+        hide_index=True,
+    )
 
-        # Copy
-        copy_shares = 0.0
-        copy_usdc = 0.0   
-        copy_realized_profit = 0.0
-        
-        copy_gross_bought_usd = 0.0
-        copy_gross_shares_bought = 0.0
+
+def run_sweep(
+    dataset: WalletDataset,
+    tags: list,
+    ) -> None:
+    """
+    Modo Sweep: busca os trades uma vez (na menor stake da grade), faz a passada
+    do trader uma vez e roda todas as combinações em paralelo (copytrade.sweep).
+    """
+    cols = st.columns([1, 2])
+    
+    with cols[0]:
+        params = get_sweep_params(tags)
+        st.divider()
         
-        copy_gross_sold_usd = 0.0
-        copy_gross_shares_sold = 0.0
+        n_combinations = (
+            len(params['stakes']) * len(params['triggers'])
+            * len(params['strategies']) * len(params['sell_strategies'])
+        )
+        st.caption(f"{n_combinations} combinations")
+        valid = 0 < n_combinations <= MAX_SWEEP_COMBINATIONS
+        if n_combinations > MAX_SWEEP_COMBINATIONS:
+            st.warning(f"Too many combinations (max {MAX_SWEEP_COMBINATIONS}).")
         
-        copy_buy_txs = 0
-        copy_sell_txs = 0
+        sweep = st.button('Run Sweep', type="primary", disabled=not valid)
+    
+    with cols[1]:
         
-        # --- LOOP ---
-        for _, row in asset_df.iterrows():
-            side = row['side'].upper()
-            price = float(row['price'])
-            shares = float(row['size'])
-            usdcSize = shares * price 
-            
-            # === COMPRA ===
-            if side == 'BUY':
-                trader_buy_txs += 1
-                trader_shares += shares
-                trader_usdc += usdcSize 
-                
-                trader_gross_bought_usd += usdcSize
-                trader_gross_shares_bought += shares
-            
-                if not trader_usdc > trigger:
-                    continue
-                
-                # Lógica de Stake (Copy)
-                target_exposure = 0.0
-                if strategy == 'Flat Staking':
-                    target_exposure = copy_stake
-                
-                elif strategy == 'Capped':
-                    target_exposure = min(trader_usdc, copy_stake)
-                
-                elif strategy == '2x Flat':
-                    target_exposure = copy_stake if trader_usdc >= (copy_stake * 2) else 0.0
-                
-                amount_to_buy = target_exposure - copy_usdc
-                
-                if amount_to_buy <= 0.01: continue 
-                
-                remaining_budget = copy_stake - copy_usdc
-                
-                real_buy_amount = min(amount_to_buy, remaining_budget)
-                
-                if real_buy_amount <= 0.001: continue
-
-                copy_buy_txs += 1
-                copy_usdc += real_buy_amount
-                
-                shares_bought_copy = (real_buy_amount / price)
-                copy_shares += shares_bought_copy
-                
-                copy_gross_bought_usd += real_buy_amount
-                copy_gross_shares_bought += shares_bought_copy
-            
-            # === VENDA ===
-            elif side == 'SELL':
-                trader_sell_txs += 1
-                
-                trader_gross_sold_usd += usdcSize 
-                trader_gross_shares_sold += shares
-                
-                trader_shares_before = trader_shares
-                trader_usdc_before = trader_usdc
-                
-                trader_sell_ratio = (shares / trader_shares_before) if trader_shares_before > 0 else 0.0
-                if trader_sell_ratio > 1.0: trader_sell_ratio = 1.0
+        if sweep:
+            with st.spinner("Running Sweep..."):
+                # Posições com staked > menor stake: as demais stakes filtram por asset
+                sim_df = get_df(
+                    dataset=dataset,
+                    params={**params, 'stake': min(params['stakes'])},
+                )
                 
-                trader_shares -= shares
-                cost_basis_removed = trader_usdc_before * trader_sell_ratio
-                trader_usdc -= cost_basis_removed
-                trader_realized_profit += (usdcSize - cost_basis_removed)
+                if not sim_df.empty:
+                    fills = copytrade.Fills(sim_df)
+                    trader = copytrade.TraderPass(fills)
+                    st.session_state['sweep_result'] = copytrade.sweep(
+                        fills,
+                        trader,
+                        stakes=params['stakes'],
+                        triggers=params['triggers'],
+                        strategies=params['strategies'],
+                        sell_strategies=params['sell_strategies'],
+                    )
+                    st.success("Sweep Ended")
+                    
+                else:
+                    st.warning("No trade found for the given filters.")
+                    st.session_state['sweep_result'] = None
+        
+        if st.session_state.get('sweep_result') is not None:
+            display_sweep_results(st.session_state['sweep_result'])
 
-                if copy_shares <= 0:
-                    continue
-                
-                copy_sell_ratio = 0.0
-                
-                if sell_strategy == 'Proportional':
-                    copy_sell_ratio = trader_sell_ratio
-                elif sell_strategy == 'One Sell Dumps All':
-                    copy_sell_ratio = 1.0 if shares > 0 else 0.0
-                elif sell_strategy == 'Never Sell':
-                    copy_sell_ratio = 0.0
-                
-                if copy_sell_ratio <= 0:
-                    continue
 
-                copy_sell_txs += 1
-                copy_shares_before = copy_shares
-                copy_usdc_before = copy_usdc 
-                
-                copy_shares_to_sell = copy_shares_before * copy_sell_ratio
-                copy_sell_value = copy_shares_to_sell * price
-                
-                copy_gross_sold_usd += copy_sell_value
-                copy_gross_shares_sold += copy_shares_to_sell
-                
-                copy_cost_basis_removed = copy_usdc_before * copy_sell_ratio
-                
-                copy_shares -= copy_shares_to_sell
-                copy_usdc -= copy_cost_basis_removed
-                copy_realized_profit += (copy_sell_value - copy_cost_basis_removed)
-                
-        # === FECHAMENTO & CÁLCULO DE MÉDIAS ===
+def parse_grid(
+    text: str,
+    min_value: float = 0.0,
+    ) -> list[float]:
+    # "50, 100 250" -> [50.0, 100.0, 250.0] (ordenado, sem repetidos; inválidos ignorados)
+    values = set()
+    for item in text.replace(',', ' ').split():
         try:
-            raw_won = asset_df['won'].iloc[0]
-            won = 1 if float(raw_won) >= 0.9 else 0
-        except:
-            won = 0 
+            value = float(item)
+        except ValueError:
+            continue
+        if value >= min_value:
+            values.add(value)
+    return sorted(values)
+
+
+def get_sweep_params(
+    tags: list
+    ) -> dict:
+    """
+    Widgets do modo Sweep: grades de stake e trigger (listas de valores) e
+    as estratégias a combinar.
+    """
+    st.subheader("Sweep Settings")
+    
+    stakes = parse_grid(
+        st.text_input(
+            "Stakes ($)",
+            value=DEFAULT_STAKE_GRID,
+            help="Comma separated values. Each stake only counts positions the trader staked more than it.",
+        ),
+        min_value=1.0,
+    )
+    
+    triggers = parse_grid(
+        st.text_input(
+            "Trigger Values ($)",
+            value=DEFAULT_TRIGGER_GRID,
+            help="Comma separated values. Min amount in $ traded by the original user to Trigger the CopyTrade.",
+        ),
+    )
+    
+    st.divider()
+    
+    selected_tags = st.pills(
+        label='Select Markets',
+        options=tags,
+        selection_mode='multi',
+        default=[],
+        key='sweep_tags',
+    )
+    
+    st.divider()
+    
+    strategies = st.multiselect(
+        "Strategies",
+        options=STRATEGY_OPTIONS,
+        default=STRATEGY_OPTIONS,
+    )
+    sell_strategies = st.multiselect(
+        "Sell Strategies",
+        options=SELL_OPTIONS,
+        default=SELL_OPTIONS,
+    )
+    
+    return {
+        "user": st.session_state.get('selected_wallet', ''),
+        "stakes": stakes,
+        "triggers": triggers,
+        "strategies": strategies,
+        "sell_strategies": sell_strategies,
+        "selected_tags": selected_tags,
+    }
+
+
+def run_portfolio(
+    ) -> None:
+    """
+    Modo Portfolio: as carteiras listadas copiadas da mesma banca, em ordem de
+    tempo, com limites de exposição por mercado e de posições abertas
+    (data.portfolio). Uma curva de capital para o conjunto.
+    """
+    cols = st.columns([1, 2])
+    
+    with cols[0]:
+        params = get_portfolio_params()
+        st.divider()
         
-        final_value_trader = trader_shares if won else 0.0
-        final_value_copy = copy_shares if won else 0.0
+        n_wallets = len(params['wallets'])
+        st.caption(f"{n_wallets} wallets")
+        if n_wallets > MAX_PORTFOLIO_WALLETS:
+            st.warning(f"Too many wallets (max {MAX_PORTFOLIO_WALLETS}).")
+        if params['invalid']:
+            st.warning(f"Invalid addresses ignored: {', '.join(params['invalid'])}")
         
-        trader_live_profit = final_value_trader - trader_usdc
-        copy_live_profit = final_value_copy - copy_usdc
+        simulate = st.button(
+            'Simulate Portfolio',
+            type="primary",
+            disabled=not 0 < n_wallets <= MAX_PORTFOLIO_WALLETS,
+        )
+    
+    with cols[1]:
         
-        trader_total_profit = trader_realized_profit + trader_live_profit
-        copy_total_profit = copy_realized_profit + copy_live_profit
+        if simulate:
+            # Posições e trades de cada carteira (caches do processo: repetir é barato)
+            frames = dh.run_cancellable(
+                load_portfolio_frames,
+                params['wallets'],
+                stake=params['stake'],
+                message="Fetching trades...",
+            )
+            result = portfolio.run_portfolio(
+                frames,
+                copy_stake=params['stake'],
+                trigger=params['trigger'],
+                strategy=params['strategy'],
+                sell_strategy=params['sell_strategy'],
+                bankroll=params['bankroll'],
+                max_exposure=params['max_exposure'],
+                max_positions=params['max_positions'],
+            )
+            st.session_state['portfolio_result'] = result
+            
+            if result is None:
+                st.warning("No trade found for the given wallets.")
+            else:
+                st.success("Simulation Ended")
         
-        # Avgs
-        t_avg_buy  = safe_divide(trader_gross_bought_usd, trader_gross_shares_bought, 0.0)
-        t_avg_sell = safe_divide(trader_gross_sold_usd, trader_gross_shares_sold, 0.0)
-        t_avg_held = safe_divide(trader_usdc, trader_shares, 0.0)
+        if st.session_state.get('portfolio_result') is not None:
+            display_portfolio_results(st.session_state['portfolio_result'])
 
-        c_avg_buy  = safe_divide(copy_gross_bought_usd, copy_gross_shares_bought, 0.0)
-        c_avg_sell = safe_divide(copy_gross_sold_usd, copy_gross_shares_sold, 0.0)
-        c_avg_held = safe_divide(copy_usdc, copy_shares, 0.0)
+
+def get_portfolio_params(
+    ) -> dict:
+    """
+    Widgets do modo Portfolio: carteiras, parâmetros da cópia (os mesmos para
+    todas) e limites da banca. Limites em 0 = sem limite.
+    """
+    st.subheader("Portfolio Settings")
+    
+    text = st.text_area(
+        "Wallets",
+        value=st.session_state.get('selected_wallet', ''),
+        help="One address per line (or comma separated).",
+    )
+    wallets, invalid = [], []
+    for item in text.replace(',', ' ').split():
+        if not WALLET_ADDRESS.match(item):
+            invalid.append(item)
+        elif item.lower() not in wallets:
+            wallets.append(item.lower())
+    
+    st.divider()
+    
+    bankroll = st.number_input(
+        "Bankroll ($)",
+        min_value=1.00,
+        step=1000.00,
+        format="%.2f",
+        value=DEFAULT_BANKROLL,
+    )
+    max_exposure = st.number_input(
+        "Max Exposure per Market ($)",
+        min_value=0.00,
+        step=100.00,
+        format="%.2f",
+        value=0.00,
+        help="Open cost in one market, summed over all wallets. 0 = no limit.",
+    )
+    max_positions = st.number_input(
+        "Max Open Positions",
+        min_value=0,
+        step=1,
+        value=0,
+        help="Markets held at the same time. 0 = no limit.",
+    )
+    
+    st.divider()
+    
+    stake = st.number_input(
+        label="Selected Stake ($)",
+        min_value=1.00,
+        step=100.00,
+        format="%.2f",
+        value=100.00,
+        key='portfolio_stake',
+    )
+    trigger_value = st.number_input(
+        label="Trigger Value ($)",
+        min_value=0.00,
+        step=1.00,
+        format="%.2f",
+        value=5.00,
+        help="Min amount in $ traded by the original user to Trigger the CopyTrade.",
+        key='portfolio_trigger',
+    )
+    strategy = st.selectbox("Strategy", options=STRATEGY_OPTIONS)
+    sell_strategy = st.selectbox("Sell Strategy", options=SELL_OPTIONS)
+    
+    return {
+        "wallets": wallets,
+        "invalid": invalid,
+        "bankroll": bankroll,
+        "max_exposure": max_exposure or None,
+        "max_positions": int(max_positions) or None,
+        "stake": stake,
+        "trigger": trigger_value,
+        "strategy": strategy,
+        "sell_strategy": sell_strategy,
+    }
 
 
-        t_roi = safe_divide(trader_total_profit * 100, trader_gross_bought_usd, 0.0)
-        c_roi = safe_divide(copy_total_profit * 100, copy_gross_bought_usd, 0.0)
+def load_portfolio_frames(
+    wallets: list[str],
+    stake: float,
+    cancel: CancelToken | None = None,
+    ) -> dict:
+    """
+    {carteira: trades} para o Portfolio, como get_df: posições fechadas com
+    staked > stake e os trades delas. Roda fora da sessão (sem st.*).
+    """
+    cache = user_data.get_wallet_cache()
+    frames = {}
+    for wallet in wallets:
+        positions = cache.get(wallet)['closed'].frame
+        if cancel is not None:
+            cancel.check()
+        if 'staked' in positions.columns:
+            positions = positions[positions['staked'] > stake]
+        if positions.empty:
+            continue
         
-        first_row = asset_df.iloc[0]
+        trades_df = fetch_clv(df=positions, user_address=wallet, cancel=cancel)
+        if not trades_df.empty:
+            frames[wallet] = attach_positions(trades_df, positions)
+    return frames
 
-        position = {
-            'timestamp': first_row['timestamp'],
-            'trade': first_row.get('title', 'Unknown'),
-            'bet': first_row.get('outcome', 'Unknown'),
-            'won': won,
-            
-            # --- COPY DATA ---
-            'copy_total_bought': copy_gross_bought_usd,
-            'copy_total_sold': copy_gross_sold_usd,     
-            'copy_held_live': copy_usdc, 
-            'copy_avg_buy': c_avg_buy,
-            'copy_avg_sell': c_avg_sell,
-            'copy_avg_held': c_avg_held,
-            'copy_buy_txs': copy_buy_txs,
-            'copy_sell_txs': copy_sell_txs,
-            'copy_pnl_realized': copy_realized_profit,
-            'copy_pnl_live': copy_live_profit,
-            'copy_pnl_total': copy_total_profit,
-            'copy_roi': c_roi,
-            
-            # --- TRADER DATA ---
-            'trader_total_bought': trader_gross_bought_usd, 
-            'trader_total_sold': trader_gross_sold_usd,     
-            'trader_held_live': trader_usdc,  
-            'trader_avg_buy': t_avg_buy,
-            'trader_avg_sell': t_avg_sell,
-            'trader_avg_held': t_avg_held,
-            'trader_buy_txs': trader_buy_txs,
-            'trader_sell_txs': trader_sell_txs,
-            'trader_pnl_realized': trader_realized_profit,
-            'trader_pnl_live': trader_live_profit,
-            'trader_pnl_total': trader_total_profit,
-            'trader_roi': t_roi,
-        }
 
-        copy_trade_list.append(position)
+def display_portfolio_results(
+    result: dict,
+    ) -> None:
+    """
+    KPIs da banca, curva de capital com drawdown e os totais por carteira.
+    """
+    summary = result['summary']
+    equity = result['equity']
+    
+    st.subheader("Portfolio Results")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Portfolio PnL", f"${summary['pnl']:,.2f}")
+    col2.metric("Return", f"{summary['return']:.2f}%", help=f"ROI on staked: {summary['roi']:.2f}%")
+    col3.metric("Max Drawdown", f"${summary['max_drawdown']:,.2f}")
+    col4.metric("Peak Exposure", f"${summary['peak_exposure']:,.2f}")
+    st.caption(
+        f"Staked ${summary['volume']:,.2f} · Peak open markets: {summary['peak_positions']} · "
+        f"Buys blocked by limits: {summary['blocked']}"
+    )
+    
+    st.divider()
+    
+    # --- CURVA DE CAPITAL ---
+    st.write("### Equity Curve")
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=equity['timestamp'],
+        y=equity['equity'],
+        mode='lines',
+        name='Equity',
+        line=dict(color="#60E224", width=2),
+        hovertemplate='$%{y:,.2f}',
+    ))
+    fig.add_trace(go.Scatter(
+        x=equity['timestamp'],
+        y=equity['cash'],
+        mode='lines',
+        name='Cash',
+        line=dict(color='white', width=1),
+        hovertemplate='$%{y:,.2f}',
+    ))
+    fig.update_layout(
+        xaxis_title="Date",
+        yaxis_title="Bankroll",
+        template="plotly_dark",
+        hovermode="x unified",
+        height=450,
+    )
+    st.plotly_chart(fig, width='stretch')
     
-    result_df = pd.DataFrame(copy_trade_list)
-    if not result_df.empty:
-        result_df = result_df.sort_values(by='timestamp', ascending=True)
+    # Drawdown em $ (distância do topo da banca)
+    fig = go.Figure(go.Scatter(
+        x=equity['timestamp'],
+        y=-equity['drawdown'],
+        mode='lines',
+        name='Drawdown',
+        fill='tozeroy',
+        line=dict(color="#E22424", width=1),
+        hovertemplate='$%{y:,.2f}',
+    ))
+    fig.update_layout(
+        xaxis_title="Date",
+        yaxis_title="Drawdown",
+        template="plotly_dark",
+        height=250,
+    )
+    st.plotly_chart(fig, width='stretch')
+    
+    # --- CARTEIRAS ---
+    st.write("### Wallets")
+    st.dataframe(
+        result['wallets'],
+        column_config={
+            "wallet": st.column_config.TextColumn("Wallet", width="large"),
+            "pnl": st.column_config.NumberColumn("PnL", format="$%.2f"),
+            "volume": st.column_config.NumberColumn("Staked", format="$%.2f"),
+            "roi": st.column_config.NumberColumn("ROI", format="%.2f%%"),
+            "markets": st.column_config.NumberColumn("Markets"),
+            "buy_txs": st.column_config.NumberColumn("# Buys"),
+            "sell_txs": st.column_config.NumberColumn("# Sells"),
+            "blocked_bankroll": st.column_config.NumberColumn("Blocked: Bankroll"),
+            "blocked_exposure": st.column_config.NumberColumn("Blocked: Exposure"),
+            "blocked_positions": st.column_config.NumberColumn("Blocked: Positions"),
+        },
+        hide_index=True,
+    )
 
-    return result_df
+
+def display_sweep_results(
+    data: pd.DataFrame,
+    ) -> None:
+    """
+    Heatmap stake x trigger da métrica escolhida (por par de estratégias),
+    melhor combinação e a tabela completa.
+    """
+    if data is None or data.empty:
+        st.warning("Sweep data is Empty.")
+        return
+    
+    st.subheader("Sweep Results")
+    
+    metric = st.selectbox(
+        "Metric",
+        options=list(SWEEP_METRICS),
+        format_func=SWEEP_METRICS.get,
+    )
+    
+    # Melhor combinação: maior PnL/ROI, menor drawdown
+    best = data.loc[
+        data[metric].idxmin() if metric == 'max_drawdown' else data[metric].idxmax()
+    ]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Best PnL", f"${best['pnl']:,.2f}")
+    col2.metric("ROI", f"{best['roi']:.2f}%")
+    col3.metric("Max Drawdown", f"${best['max_drawdown']:,.2f}")
+    col4.metric("Markets", f"{best['markets']}")
+    st.caption(
+        f"Best by {SWEEP_METRICS[metric]}: stake ${best['stake']:,.2f}, "
+        f"trigger ${best['trigger']:,.2f}, {best['strategy']} / {best['sell_strategy']}"
+    )
+    
+    st.divider()
+    
+    # --- HEATMAP ---
+    cols = st.columns(2)
+    strategy = cols[0].selectbox("Strategy", options=data['strategy'].unique())
+    sell_strategy = cols[1].selectbox("Sell Strategy", options=data['sell_strategy'].unique())
+    
+    subset = data[(data['strategy'] == strategy) & (data['sell_strategy'] == sell_strategy)]
+    grid = subset.pivot(index='stake', columns='trigger', values=metric)
+    
+    # Drawdown: quanto menor melhor (escala invertida)
+    fig = go.Figure(go.Heatmap(
+        z=grid.to_numpy(),
+        x=[f"${t:,.2f}" for t in grid.columns],
+        y=[f"${s:,.2f}" for s in grid.index],
+        colorscale='RdYlGn',
+        reversescale=metric == 'max_drawdown',
+        text=grid.round(2).to_numpy(),
+        texttemplate='%{text}',
+        hovertemplate='Stake %{y}<br>Trigger %{x}<br>%{z:,.2f}<extra></extra>',
+    ))
+    fig.update_layout(
+        xaxis_title="Trigger",
+        yaxis_title="Stake",
+        template="plotly_dark",
+        height=500,
+    )
+    st.plotly_chart(fig, width='stretch')
+    
+    # --- TABELA ---
+    st.write("### All Combinations")
+    st.dataframe(
+        data.sort_values(metric, ascending=metric == 'max_drawdown'),
+        column_config={
+            "stake": st.column_config.NumberColumn("Stake", format="$%.2f"),
+            "trigger": st.column_config.NumberColumn("Trigger", format="$%.2f"),
+            "strategy": st.column_config.TextColumn("Strategy"),
+            "sell_strategy": st.column_config.TextColumn("Sell Strategy"),
+            "pnl": st.column_config.NumberColumn("PnL", format="$%.2f"),
+            "roi": st.column_config.NumberColumn("ROI", format="%.2f%%"),
+            "max_drawdown": st.column_config.NumberColumn("Max Drawdown", format="$%.2f"),
+            "volume": st.column_config.NumberColumn("Staked", format="$%.2f"),
+            "markets": st.column_config.NumberColumn("Markets"),
+        },
+        hide_index=True,
+    )
 
 
-def display_sim_results(data: pd.DataFrame):
+def display_sim_results(
+    data: pd.DataFrame,
+    export_key: tuple | None = None,
+    export_dataset: WalletDataset | None = None,
+    ):
     """
     Função Coordenadora:
     1. Valida dados.
@@ -431,7 +871,7 @@ def display_sim_results(data: pd.DataFrame):
     display_equity_chart(sim_df)
 
     # --- 3. CHAMADA DAS TABELAS ---
-    display_sim_tables(sim_df)
+    display_sim_tables(sim_df, export_key=export_key, export_dataset=export_dataset)
 
 
 def display_equity_chart(df: pd.DataFrame):
@@ -486,7 +926,11 @@ def display_equity_chart(df: pd.DataFrame):
     except Exception as e:
         st.error(f"Error rendering chart: {e}")
 
-def display_sim_tables(df: pd.DataFrame):
+def display_sim_tables(
+    df: pd.DataFrame,
+    export_key: tuple | None = None,
+    export_dataset: WalletDataset | None = None,
+    ):
     """
     Exibe as tabelas de simulação (Copy vs Trader) usando paginação.
     """
@@ -539,7 +983,9 @@ def display_sim_tables(df: pd.DataFrame):
             df=df_copy,
             unique_key="sim_copy_table",  # ID Único essencial para não conflitar com a outra aba
             page_size=10,                 # 10 linhas por página fica bom em dashboards
-            csv_file_name="copy_strategy_results.csv",
+            export_key=export_key,
+            export_dataset=export_dataset,
+            file_name="copy_strategy_results",
             # Argumentos do st.dataframe:
             column_config=common_column_config,
             column_order=order,
@@ -552,7 +998,9 @@ def display_sim_tables(df: pd.DataFrame):
             df=df_trader,
             unique_key="sim_trader_table", # ID Único diferente da aba 1
             page_size=10,
-            csv_file_name="trader_original_results.csv",
+            export_key=export_key,
+            export_dataset=export_dataset,
+            file_name="trader_original_results",
             # Argumentos do st.dataframe:
             column_config=common_column_config,
             column_order=order,
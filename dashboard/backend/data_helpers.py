@@ -1,10 +1,26 @@
+import io
 import math
+import time
+import threading
+import importlib.util
+from concurrent.futures import Future
 import pandas as pd
 from helpers import *
 import streamlit as st
 from datetime import datetime
 from dashboard.ui import formatting
+import numpy as np
+from collections.abc import Mapping
+from pandas.io.formats.style import Styler
+from data.tags import TagIndex
+from data.dataset import WalletDataset, result_nbytes
 from data.analysis import DataAnalyst
+from data.dataset import parse_dates, staked
+from data.aggregation import time_bucket_stats
+from data.risk import daily_pnl
+from data.significance import bootstrap_stats, FAST_RESAMPLES, FAST_SEED
+from data.leaderboard import Leaderboard
+from api.jobs import CancelToken
 
 
 
@@ -193,22 +209,9 @@ def cum_pnl(
     """
     Recebe um dataframe e retorna um DataFrame com o
     lucro diário e o lucro cumulativo.
-    Colunas: ['Date', 'Daily Profit', 'Cumulative Profit']
+    Colunas: ['Date', 'Profit', 'Cumulative Profit']
     """
-    df = df.copy()
-    
-    df[date_column] = pd.to_datetime(df[date_column], errors='coerce')
-    df = df.sort_values(by=date_column)
-    
-   
-    daily_profit = df.groupby(df[date_column].dt.normalize())[pnl_column].sum()
-    out_df = daily_profit.reset_index()
-    out_df.columns = ['Date', 'Profit']
-    
-    # 4. Calcular o lucro CUMULATIVO
-    out_df['Cumulative Profit'] = out_df['Profit'].cumsum()
-        
-    return out_df
+    return daily_pnl(df, pnl_column=pnl_column, date_column=date_column)
 
 
 def create_daily_summary(
@@ -217,34 +220,22 @@ def create_daily_summary(
     date_column: str = 'endDate'
 ) -> pd.DataFrame:
     
-    df = df.copy()
+    out = time_bucket_stats(
+        df,
+        freq='day',
+        date_column=date_column,
+        pnl_column=pnl_column,
+    )
 
-    df[date_column] = pd.to_datetime(
-        df[date_column],
-        format='ISO8601',
-        utc=True)
-    df = df.sort_values(by=date_column)
-    
-    df['staked'] = df['totalBought'] * df['avgPrice']
-    df['roi'] = safe_divide(df[pnl_column], df['staked'])
-
-    rows = []
-
-    for date, sub_df in df.groupby(df[date_column].dt.normalize()):
-        profit = sub_df[pnl_column].sum()
-        bets = len(sub_df)
-        roi = safe_divide(profit, sub_df['staked'].sum())
-        units = sub_df['roi'].sum()
-
-        rows.append({
-            "Date": date,
-            "Bets": bets,
-            "Profit": profit,
-            "ROI": roi,
-            "Units": units,
-        })
+    out = out.rename(columns={
+        'date': 'Date',
+        'bets': 'Bets',
+        'profit': 'Profit',
+        'roi': 'ROI',
+        'units': 'Units',
+    })[['Date', 'Bets', 'Profit', 'ROI', 'Units']]
 
-    out = pd.DataFrame(rows).sort_values(by='Date', ascending=False)
+    out = out.sort_values(by='Date', ascending=False)
 
     # Formatar coluna de data para YYYY-MM-DD
     out["Date"] = out["Date"].dt.strftime("%Y-%m-%d")
@@ -265,44 +256,226 @@ def create_daily_summary(
     return styler
 
 
+def filter_positions(
+    df: pd.DataFrame,
+    stake: float | None = None,
+    start_date=None,
+    end_date=None,
+    ) -> pd.DataFrame:
+    """
+    Aplica os filtros de data (endDate) e stake mínima em uma única máscara.
+    Com um WalletDataset, 'endDate' e 'staked' já vêm prontos.
+    """
+    end_dates = parse_dates(df['endDate'])
+    if end_dates is not df['endDate']:
+        df = df.assign(endDate=end_dates)
+
+    mask = np.ones(len(df), dtype=bool)
+
+    # Só aplica filtro se start_date e end_date forem datetime válidos
+    if isinstance(start_date, (datetime, pd.Timestamp)) and \
+       isinstance(end_date, (datetime, pd.Timestamp)):
+        mask &= ((end_dates >= start_date) & (end_dates <= end_date)).to_numpy()
+
+    if stake is not None:
+        mask &= (staked(df) > stake).to_numpy()
+
+    return df[mask]
+
+
+class FilteredPositions(Mapping):
+    """
+    Resultado de um filtro (tags, stake, datas) sobre um WalletDataset:
+    raw:      posições filtradas (cada posição uma vez)
+    main:     raw formatado (Styler)
+    exploded: uma linha por (posição, tag), formatado
+    latest:   raw ordenado por endDate (mais recentes primeiro), para as tabelas
+    main, exploded e latest só são montados se alguém os ler.
+    key: (version, filtros) que identifica o resultado (ex.: cache de exports)
+    Guardado no WalletDataset (memo): nbytes entra no orçamento do cache de carteiras.
+    """
+    KEYS = ('raw', 'main', 'exploded', 'latest')
+
+    def __init__(
+        self,
+        raw: pd.DataFrame,
+        tags: list,
+        tag_index: TagIndex,
+        key: tuple | None = None,
+        ):
+        self._values = {'raw': raw}
+        self._tags = tags
+        self._tag_index = tag_index
+        self.key = key
+
+    def __getitem__(self, key: str):
+        if key not in self._values:
+            if key == 'main':
+                self._values[key] = filter_and_format_closed(self['raw'])
+            elif key == 'exploded':
+                exploded = get_exploded_df(df=self['raw'], tag_index=self._tag_index)
+                if self._tags:
+                    exploded = exploded[exploded['tag'].isin(self._tags)]
+                self._values[key] = filter_and_format_closed(exploded)
+            elif key == 'latest':
+                raw = self['raw']
+                if 'endDate' in raw.columns:
+                    raw = raw.sort_values(by='endDate', ascending=False)
+                self._values[key] = raw
+            else:
+                raise KeyError(key)
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    @property
+    def nbytes(self) -> int:
+        # Só o que foi montado; o Styler conta pelo DataFrame que formata
+        return sum(
+            result_nbytes(value.data if isinstance(value, Styler) else value)
+            for value in list(self._values.values())
+        )
+
+
+def _filter_dataset(
+    dataset: WalletDataset,
+    tags: tuple,
+    stake: float | None,
+    start_date,
+    end_date,
+    ) -> FilteredPositions:
+    # Tags, período e stake viram interseção de conjuntos de linhas (FilterIndex);
+    # cada posição entra uma vez, mesmo com várias tags escolhidas
+    positions = dataset.filters.select(list(tags), stake, start_date, end_date)
+    
+    df = dataset.frame
+    if len(positions) < len(df):
+        df = df.iloc[positions]
+    
+    return FilteredPositions(
+        df, list(tags), dataset.tags,
+        key=(dataset.version, tags, stake, start_date, end_date),
+    )
+
+
+def filter_dataset(
+    dataset: WalletDataset,
+    tags: list = [],
+    stake: float | None = None,
+    start_date=None,
+    end_date=None,
+    ) -> FilteredPositions:
+    """
+    Filtro memoizado no dataset por (tags, stake, start, end):
+    reruns (troca de aba, paginação) reaproveitam o resultado.
+    """
+    tags = tuple(sorted(tags))
+    return dataset.memo(
+        ('filter', tags, stake, start_date, end_date),
+        lambda: _filter_dataset(dataset, tags, stake, start_date, end_date),
+    )
+
+
+def bootstrap_summary(
+    df: pd.DataFrame,
+    dataset: WalletDataset | None = None,
+    key: tuple | None = None,
+    ) -> dict:
+    """
+    bootstrap_stats do df (FAST_RESAMPLES, semente fixa).
+    Com dataset e key (ex.: FilteredPositions.key), memoizado no dataset:
+    reruns com os mesmos filtros não refazem a reamostragem.
+    """
+    def boot() -> dict:
+        return bootstrap_stats(df, n_resamples=FAST_RESAMPLES, seed=FAST_SEED)
+    
+    if dataset is None or key is None:
+        return boot()
+    return dataset.memo(('bootstrap', *key), boot)
+
+
 def get_tag_list(
-    df:pd.DataFrame
+    dataset: WalletDataset,
+    ) -> list:
+    # Retorna a lista de Tags do User (uma vez por dataset)
+    return dataset.memo(('tag_list',), lambda: _tag_list(dataset))
+
+
+def _tag_list(
+    dataset: WalletDataset,
     ) -> list:
-    # Retorna a lista de Tags do User
-    return DataAnalyst.tag_analysis(df=df)['tag'].unique()
+    return DataAnalyst.tag_analysis(
+        df=dataset.frame, tag_index=dataset.tags
+    )['tag'].unique().tolist()
 
 
 def create_tag_df(
-    df: pd.DataFrame,
+    dataset: WalletDataset,
     stake: float,
     start_date,
     end_date,
     ) -> pd.DataFrame:
-    # Recebe o dataframe geral e retorna o dataframe de tags
-    # 100% Formatado
-    
-    df = df.copy()
-    
-    # Filtrar o dataframe antes de fazer o Tag Analysis
-    df["endDate"] = pd.to_datetime(df['endDate'], format='ISO8601', utc=True).dt.tz_localize(None)
-    df["endDate"] = pd.to_datetime(df["endDate"], utc=False, errors="coerce")
+    # Recebe o dataset geral e retorna o dataframe de tags
+    # 100% Formatado (estatísticas memoizadas pelos mesmos filtros de filter_dataset)
+    tag_df = dataset.memo(
+        ('tag_table', stake, start_date, end_date),
+        lambda: _tag_table(dataset, stake, start_date, end_date),
+    )
     
-    if isinstance(start_date, (datetime, pd.Timestamp)) and \
-       isinstance(end_date, (datetime, pd.Timestamp)):
+    styler = (
+        tag_df.style
+            .format({
+                'Profit': formatting.float_to_dol,
+                'Staked': formatting.float_to_dol,
+                'ROI': formatting.float_to_pct,
+                'Units': formatting.float_to_units,
+                'p-value': formatting.format_p_value,
+            }, subset=[
+                col for col in ['Profit', 'Staked', 'ROI', 'Units', 'p-value']
+                if col in tag_df.columns
+            ])
+            .map(
+                formatting.color_positive_negative,
+                subset=['Profit', 'ROI', 'Units'] 
+            )
+    )
         
-        df = df[(df["endDate"] >= start_date) &
-                (df["endDate"] <= end_date)]
+    return styler
 
-    if stake is not None:
-        # Cria a coluna temporária calculada
-        df["calculated_stake"] = df["totalBought"] * df["avgPrice"]
 
-        # Filtra onde o valor calculado é maior que a stake passada
-        df = df[df["calculated_stake"] > stake]
-    
+def _tag_table(
+    dataset: WalletDataset,
+    stake: float,
+    start_date,
+    end_date,
+    ) -> pd.DataFrame:
+    # Mesmo filtro de datas/stake já usado pelo resto da página
+    df = filter_dataset(dataset, [], stake, start_date, end_date)['raw']
+    tag_index = dataset.tags
     
+    tag_df = DataAnalyst.tag_analysis(df=df, tag_index=tag_index)
     
-    tag_df = DataAnalyst.tag_analysis(df=df)
+    # Intervalo de confiança do ROI por tag (bootstrap)
+    significance = DataAnalyst.tag_significance(
+        df=df, tag_index=tag_index, n_resamples=FAST_RESAMPLES
+        )
+    if not significance.empty:
+        tag_df = tag_df.merge(
+            significance[['tag', 'roi_low', 'roi_high', 'roi_p']], on='tag', how='left'
+            )
+        # Intervalo e p-valor logo ao lado do ROI
+        interval = [
+            formatting.float_to_interval(low, high)
+            for low, high in zip(tag_df.pop('roi_low'), tag_df.pop('roi_high'))
+        ]
+        p_value = tag_df.pop('roi_p')
+        position = tag_df.columns.get_loc('roi') + 1
+        tag_df.insert(position, 'ROI CI', interval)
+        tag_df.insert(position + 1, 'p-value', p_value)
     
     tag_df = tag_df.rename(columns={
         'tag': 'Tag',
@@ -313,29 +486,180 @@ def create_tag_df(
         'bets': 'Total Bets',
     })
     
+    return tag_df
+
+
+def create_stake_df(
+    df: pd.DataFrame,
+    by_tag: bool = False,
+    tag_index: TagIndex | None = None,
+    ) -> tuple:
+    # Recebe o dataframe (já filtrado) e retorna o dataframe de
+    # faixas de stake 100% Formatado + o relatório de sizing vs edge
+    
+    stake_df, sizing = DataAnalyst.stake_analysis(
+        df=df, by_tag=by_tag, tag_index=tag_index
+        )
+    
+    stake_df = stake_df.drop(columns='bucket').rename(columns={
+        'stake_range': 'Stake Range',
+        'tag': 'Tag',
+        'profit': 'Profit',
+        'volume': 'Staked',
+        'roi': 'ROI',
+        'units': 'Units',
+        'bets': 'Total Bets',
+        'win_rate': 'Win Rate',
+        'clv': 'Avg CLV',
+    })
+    
     styler = (
-        tag_df.style
+        stake_df.style
             .format({
                 'Profit': formatting.float_to_dol,
                 'Staked': formatting.float_to_dol,
                 'ROI': formatting.float_to_pct,
                 'Units': formatting.float_to_units,
-            })
+                'Win Rate': formatting.float_to_pct,
+                'Avg CLV': formatting.float_to_pct,
+            }, na_rep='-')
             .map(
                 formatting.color_positive_negative,
-                subset=['Profit', 'ROI', 'Units'] 
+                subset=['Profit', 'ROI', 'Units', 'Avg CLV'] 
             )
     )
-        
-    return styler
+    
+    return styler, sizing
+
+
+def create_leaderboard_df(
+    board: Leaderboard,
+    metric: str,
+    tag: str | None = None,
+    min_bets: int = 0,
+    k: int = 50,
+    ) -> tuple:
+    # Top-k do leaderboard 100% Formatado + a lista de carteiras na ordem das linhas
+    top = board.top(metric=metric, k=k, tag=tag, min_bets=min_bets)
+    
+    if tag is None:
+        top['ROI CI'] = [
+            formatting.float_to_interval(low, high)
+            for low, high in zip(top['roi_low'], top['roi_high'])
+        ]
+    top['synced_at'] = parse_dates(top['synced_at']).dt.strftime("%d/%m/%Y %H:%M")
+    
+    top = top.rename(columns={
+        'rank': '#',
+        'wallet': 'Wallet',
+        'bets': 'Total Bets',
+        'profit': 'Profit',
+        'volume': 'Staked',
+        'roi': 'ROI',
+        'flat_units': 'Units',
+        'clv': 'Avg CLV',
+        'clv_positive': 'CLV+',
+        'sharpe': 'Sharpe',
+        'max_drawdown': 'Max Drawdown',
+        'synced_at': 'Last Synced',
+    })
+    columns = [
+        col for col in [
+            '#', 'Wallet', 'ROI', 'ROI CI', 'Units', 'Profit', 'Total Bets',
+            'Avg CLV', 'CLV+', 'Sharpe', 'Max Drawdown', 'Last Synced',
+        ] if col in top.columns
+    ]
+    top = top[columns]
+    
+    styler = (
+        top.style
+            .format({
+                'Profit': formatting.float_to_dol,
+                'ROI': formatting.float_to_pct,
+                'Units': formatting.float_to_units,
+                'Avg CLV': formatting.float_to_pct,
+                'CLV+': formatting.float_to_pct,
+                'Sharpe': '{:.2f}',
+                'Max Drawdown': formatting.float_to_dol,
+                'Total Bets': '{:.0f}',
+            }, subset=[
+                col for col in [
+                    'Profit', 'ROI', 'Units', 'Avg CLV', 'CLV+',
+                    'Sharpe', 'Max Drawdown', 'Total Bets',
+                ] if col in top.columns
+            ], na_rep='-')
+            .map(
+                formatting.color_positive_negative,
+                subset=[col for col in ['Profit', 'ROI', 'Units', 'Avg CLV'] if col in top.columns]
+            )
+    )
+    
+    return styler, top['Wallet'].tolist()
+
+
+# Exports das tabelas: gerados só no clique e guardados no dataset por (tabela, filtros, formato)
+EXPORT_CHUNK_ROWS = 50_000
+
+# formato -> (extensão, mime, módulos que o pandas aceita para escrever)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv', ()),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet', ('pyarrow', 'fastparquet')),
+    'Excel': (
+        'xlsx',
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        ('xlsxwriter', 'openpyxl'),
+    ),
+}
+
+
+@st.cache_resource(show_spinner=False)
+def export_formats() -> list[str]:
+    # Só oferece os formatos com engine instalada
+    return [
+        name for name, (_, _, engines) in EXPORT_FORMATS.items()
+        if not engines or any(importlib.util.find_spec(e) for e in engines)
+    ]
+
+
+def export_bytes(
+    df: pd.DataFrame,
+    fmt: str = 'CSV',
+    ) -> bytes:
+    """
+    Serializa o DataFrame no formato pedido.
+    CSV é escrito em blocos de EXPORT_CHUNK_ROWS linhas direto no buffer
+    (sem montar a string inteira antes de codificar).
+    """
+    buffer = io.BytesIO()
+
+    if fmt == 'CSV':
+        for start in range(0, max(len(df), 1), EXPORT_CHUNK_ROWS):
+            df.iloc[start:start + EXPORT_CHUNK_ROWS].to_csv(
+                buffer, index=False, header=(start == 0), encoding='utf-8'
+            )
+    elif fmt == 'Parquet':
+        df.to_parquet(buffer, index=False)
+    elif fmt == 'Excel':
+        # Excel não guarda fuso: datas vão sem tz
+        df = df.copy()
+        for col in df.select_dtypes(include=['datetimetz']).columns:
+            df[col] = df[col].dt.tz_localize(None)
+        df.to_excel(buffer, index=False)
+    else:
+        raise ValueError(f"Formato de export inválido: {fmt}")
+
+    return buffer.getvalue()
+
 
 def render_paginated_table(
     df: pd.DataFrame,
     unique_key: str,
     page_size: int = 20,
     format_func: callable = None,
-    csv_df: pd.DataFrame = None,
-    csv_file_name: str = "data.csv",
+    export_func: callable = None,
+    export_key: tuple | None = None,
+    export_dataset: WalletDataset | None = None,
+    file_name: str = "data",
     **st_dataframe_kwargs
     ) -> None:
     """
@@ -346,8 +670,13 @@ def render_paginated_table(
         unique_key: Uma string única para controlar o session_state desta tabela específica.
         page_size: Itens por página.
         format_func: (Opcional) Função para formatar APENAS a fatia visível (ex: adicionar R$, %).
-        csv_df: (Opcional) DataFrame específico para o CSV. Se None, usa o 'df' original.
-        csv_file_name: Nome do arquivo para download.
+        export_func: (Opcional) Função que monta o DataFrame do export a partir do 'df'.
+            Só roda quando alguém clica em Download.
+        export_key: (Opcional) Identifica o conteúdo de 'df' (ex.: FilteredPositions.key).
+            Com ela (e export_dataset) downloads repetidos não refazem o export.
+        export_dataset: (Opcional) Dataset de onde 'df' saiu: o arquivo gerado fica
+            no memo dele (conta no cache de carteiras e sai junto com a carteira).
+        file_name: Nome do arquivo para download (sem extensão).
         **st_dataframe_kwargs: Argumentos extras passados direto para st.dataframe (ex: column_config).
     """
     
@@ -400,7 +729,7 @@ def render_paginated_table(
         st.info("No data available.")
 
     # 5. Controles (Botões)
-    cols = st.columns([1, 1, 3, 2])
+    cols = st.columns([1, 1, 2, 1, 2])
     
     with cols[0]:
         st.button(
@@ -421,15 +750,72 @@ def render_paginated_table(
         )
         
     with cols[3]:
-        # Prepara dados para CSV (Usa csv_df se fornecido, senão usa o df original)
-        data_to_download = csv_df if csv_df is not None else df
-        csv_bytes = data_to_download.to_csv(index=False).encode('utf-8')
+        fmt = st.selectbox(
+            "Format",
+            options=export_formats(),
+            key=f"{unique_key}_export_format",
+            label_visibility='collapsed',
+        )
         
+    with cols[4]:
+        # O arquivo só é gerado no clique (callable), fora do rerun da página
+        def build_export() -> bytes:
+            def export() -> bytes:
+                return export_bytes(export_func(df) if export_func else df, fmt)
+            
+            if export_key is None or export_dataset is None:
+                return export()
+            return export_dataset.memo(('export', unique_key, *export_key, fmt), export)
+        
+        extension, mime, _ = EXPORT_FORMATS[fmt]
         st.download_button(
-            label="Download CSV",
-            data=csv_bytes,
-            file_name=csv_file_name,
-            mime='text/csv',
+            label=f"Download {fmt}",
+            data=build_export,
+            file_name=f"{file_name}.{extension}",
+            mime=mime,
             key=f"{unique_key}_btn_download",
+            on_click='ignore',
             width='stretch'
-        )
\ No newline at end of file
+        )
+
+
+# Intervalo em que a espera por uma busca devolve o controle ao streamlit (segundos)
+CANCEL_POLL_SECONDS = 0.25
+
+
+def run_cancellable(
+    func: callable,
+    *args,
+    message: str = "Working...",
+    **kwargs,
+    ):
+    """
+    Roda func(*args, cancel=token, **kwargs) numa thread enquanto o script
+    espera, atualizando um status. Cada atualização é um ponto em que o
+    streamlit pode interromper o script (outra carteira, rerun): aí o token
+    é cancelado e as buscas de func param em vez de rodar até o fim.
+    """
+    cancel = CancelToken(priority='interactive')
+    future = Future()
+    
+    def target():
+        try:
+            future.set_result(func(*args, cancel=cancel, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=target, daemon=True).start()
+    
+    status = st.empty()
+    started = time.monotonic()
+    try:
+        while True:
+            try:
+                return future.result(timeout=CANCEL_POLL_SECONDS)
+            except TimeoutError:
+                status.caption(f"{message} ({time.monotonic() - started:.0f}s)")
+    except BaseException:
+        cancel.cancel()
+        raise
+    finally:
+        status.empty()
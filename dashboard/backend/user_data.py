@@ -3,23 +3,63 @@ import pandas as pd
 import streamlit as st
 from api.fetch import fetch_total_trades
 from api.fetch_subgraph import fetch_pnl_data
+from api.jobs import FetchJob, JobRegistry, CancelToken, Cancelled
+from data.dataset import WalletDataset
+from data.aggregation import tag_breakdown
+from data.leaderboard import Leaderboard
+from data.cache import WalletCache
+from data.prefetch import Prefetcher
+from data.summary import dataset_summary
+from data.significance import FAST_RESAMPLES
+from dashboard.ui import elements
 from dashboard.ui.formatting import center_text
 
+# Intervalo de atualização da tela de progresso da busca (segundos)
+FETCH_POLL_SECONDS = 1.0
+
+
+@st.cache_resource
+def get_leaderboard() -> Leaderboard:
+    # Um leaderboard por processo, compartilhado entre as sessões
+    return Leaderboard()
+
 
 def select_user(
     ) -> str:
     # Retora um user válido    
+    # Ranking das carteiras já analisadas: clicar em uma linha abre a carteira
+    # (on_change='rerun': o ranking só é consultado com o expander aberto)
+    expander = st.expander(
+        "Leaderboard",
+        expanded=st.session_state.get("selected_wallet") is None,
+        on_change='rerun',
+        )
+    with expander:
+        picked = elements.leaderboard(get_leaderboard()) if expander.open else None
+    
     st.subheader("Select User")
 
     # campo de input do chat
     user_address = st.chat_input("Type user address")
     center_text('Hint: 0x507e52ef684ca2dd91f90a9d26d149dd3288beae', size=12)
     
+    # A seleção da tabela persiste entre reruns: só vale quando muda
+    if picked != st.session_state.get("leaderboard_pick"):
+        st.session_state["leaderboard_pick"] = picked
+        if picked and not user_address:
+            st.session_state["selected_wallet"] = picked
+            return picked
+    
     # se o usuário enviou algo
     if user_address:
-        wallet_trades = fetch_total_trades(user_address)
+        # A busca das posições começa (em background) enquanto o endereço é validado
+        get_prefetcher().wallet(user_address)
+        wallet_trades = fetch_total_trades(
+            user_address, cancel=CancelToken(priority='interactive')
+        )
 
         if wallet_trades == -1:
+            get_prefetcher().discard(user_address)
             st.error("Invalid Wallet.")
         else:
             st.success(
@@ -32,19 +72,160 @@ def select_user(
 
        
 def get_trades(
-    user_address: str
+    user_address: str,
+    job: FetchJob | None = None,
     ) -> pd.DataFrame:
     # Wrapper para puxar todas as Posições do User
-    with st.spinner("Fetching trades..."):
-        return fetch_pnl_data(user_address)
+    closed_df, active_df = fetch_pnl_data(user_address, job=job)
+    
+    # Índices únicos: os TagIndex alinham subconjuntos filtrados pelo índice
+    return closed_df.reset_index(drop=True), active_df.reset_index(drop=True)
+
+
+def load_wallet(
+    user_address: str,
+    board: Leaderboard | None = None,
+    job: FetchJob | None = None,
+    ) -> dict:
+    # Busca a carteira e monta os datasets (roda fora da sessão: sem st.*)
+    closed_df, active_df = get_trades(user_address, job=job)
+    
+    # Colunas derivadas, datas e tags calculadas uma única vez por carteira
+    closed = WalletDataset.from_frame(closed_df)
+    active = WalletDataset.from_frame(active_df)
+    datasets = {
+        'merge': merge_dfs(closed, active),
+        'closed': closed,
+        'active': active,
+    }
+    # Índices de filtro montados aqui, para entrarem na medida do cache de carteiras
+    for dataset in datasets.values():
+        dataset.filters
+    
+    # Cada carteira carregada (ou revalidada) entra/é atualizada no leaderboard
+    if board is not None:
+        sync_leaderboard(
+            user_address, datasets['merge'],
+            closed_positions=len(closed),
+            active_positions=len(active),
+            board=board,
+        )
+    return datasets
+
+
+@st.cache_resource
+def get_jobs() -> JobRegistry:
+    # Buscas em andamento (progresso e dados parciais), por processo
+    return JobRegistry()
+
+
+@st.cache_resource
+def get_wallet_cache() -> WalletCache:
+    # Um cache por processo: sessões que abrem a mesma carteira dividem os datasets
+    board = get_leaderboard()
+    jobs = get_jobs()
+    
+    def loader(wallet: str) -> dict:
+        job = jobs.start(wallet)
+        try:
+            return load_wallet(wallet, board, job=job)
+        finally:
+            jobs.finish(job)
+    
+    return WalletCache(loader=loader)
+
+
+@st.cache_resource
+def get_prefetcher() -> Prefetcher:
+    # Buscas especulativas de baixa prioridade (posições e dados de CLV), por processo
+    return Prefetcher(get_wallet_cache(), get_jobs())
+
+
+def get_datasets(
+    user_address: str
+    ) -> dict:
+    # Datasets da carteira direto do cache compartilhado.
+    # A sessão guarda só o endereço: a memória não cresce com o número de usuários
+    # Carteira nova: a busca roda em background e a página mostra o que já chegou
+    cache = get_wallet_cache()
+    pending = st.session_state.get("wallet_fetch")
+    
+    # Trocou de carteira no meio da busca: sem outra sessão esperando, ela é cancelada
+    if pending is not None and pending[0] != user_address:
+        get_jobs().release(pending[0])
+        get_prefetcher().discard(pending[0])
+        del st.session_state["wallet_fetch"]
+        pending = None
+    
+    if pending is not None:
+        future = pending[1]
+    else:
+        future = cache.submit(user_address)
+        # Só espera (e promove a busca) se há uma busca em andamento; a espera
+        # termina com ela, então o job nunca fica órfão no registro
+        if not future.done():
+            jobs = get_jobs()
+            job = jobs.watch(user_address)
+            future.add_done_callback(lambda _: jobs.unwatch(job))
+    
+    if not future.done():
+        st.session_state["wallet_fetch"] = (user_address, future)
+        fetch_progress(user_address, future)
+        st.stop()
+    
+    # Erros da busca sobem aqui (uma vez: o próximo rerun tenta de novo)
+    st.session_state.pop("wallet_fetch", None)
+    if isinstance(future.exception(), Cancelled):
+        # Carteira pedida de novo enquanto a busca antiga era cancelada: recomeça
+        st.rerun()
+    datasets = future.result()
+    
+    # Próximo passo provável é o CLV: trades e preços das tags principais em background
+    get_prefetcher().clv(user_address, datasets['closed'])
+    return datasets
+
+
+@st.fragment(run_every=FETCH_POLL_SECONDS)
+def fetch_progress(
+    user_address: str,
+    future,
+    ) -> None:
+    # Atualiza sozinho enquanto a busca roda; ao terminar, roda a página de novo
+    if future.done():
+        st.rerun()
+    
+    job = get_jobs().get(user_address)
+    if job is not None:
+        elements.fetch_progress(job)
+    else:
+        st.info("Fetching trades...")
 
 
 def merge_dfs(
-    closed_df: pd.DataFrame,
-    active_df: pd.DataFrame
-    ):
-    # Recebe os dois dataframes e cria um só para sintetizar as estatísticas
-    # Deixá-lo cru por enquanto, fica de TODO para resolvê-lo.
-    merge_df = pd.concat([active_df, closed_df])
-    merge_df['total_profit'] = merge_df['realizedPnl'].fillna(0) + merge_df['cashPnl'].fillna(0)
-    return merge_df
\ No newline at end of file
+    closed: WalletDataset,
+    active: WalletDataset,
+    ) -> WalletDataset:
+    # Recebe os dois datasets e cria um só para sintetizar as estatísticas
+    # (total_profit e demais colunas derivadas já vêm de cada dataset)
+    return WalletDataset.concat([active, closed])
+
+
+def sync_leaderboard(
+    wallet: str,
+    merged: WalletDataset,
+    closed_positions: int,
+    active_positions: int,
+    board: Leaderboard | None = None,
+    ) -> None:
+    # Atualiza só a linha (e as tags) desta carteira no leaderboard
+    summary = dataset_summary(
+        wallet.lower(), merged,
+        closed_positions=closed_positions,
+        active_positions=active_positions,
+        n_resamples=FAST_RESAMPLES,
+    )
+    if summary['status'] != 'ok':
+        return
+    
+    board = board if board is not None else get_leaderboard()
+    board.upsert(summary, tag_breakdown(merged.frame, merged.tags))
@@ -20,29 +20,18 @@ def user_analysis() -> None:
     current_address = st.session_state.get("selected_wallet")
 
 
-    if (
-        st.session_state.get("merge_df") is None 
-        # Não temos df (No momento)
-        or 
-        st.session_state.get("fetched_wallet") != current_address 
+    # Datasets compartilhados entre sessões (cache do processo): não alterar
+    datasets = user_data.get_datasets(current_address)
+
+    if st.session_state.get("fetched_wallet") != current_address:
         # Mudamos o endereço
-        ):
-        
-        # Puxar dados de Trades do User
-        closed_df, active_df = user_data.get_trades(user_address=current_address)
-        merge_df = user_data.merge_dfs(closed_df, active_df)
-        
-        # Salvar dados como sessão
-        st.session_state['merge_df'] = merge_df
-        st.session_state['closed_df'] = closed_df
-        st.session_state['active_df'] = active_df
         st.session_state["fetched_wallet"] = current_address
 
         if 'clv_data' in st.session_state:
             del st.session_state['clv_data']
 
     
-    if st.session_state["merge_df"].empty:
+    if datasets['merge'].empty:
         st.warning(f"A carteira {current_address} não possui trades registrados.")
         st.stop()
     
@@ -51,7 +40,7 @@ def user_analysis() -> None:
     
     
     # Tags do User:
-    tags = dh.get_tag_list(df=st.session_state["merge_df"])
+    tags = dh.get_tag_list(datasets['merge'])
     
     st.header('Select Filters to Apply:')
     st.divider()
@@ -64,7 +53,7 @@ def user_analysis() -> None:
     # Timeframe
     with cols[1]:
         _, start_td, end_td = elements.time_filter_buttons(
-            df=st.session_state["merge_df"])
+            df=datasets['merge'].frame)
     
     # Stake
     with cols[2]:
@@ -72,85 +61,122 @@ def user_analysis() -> None:
     
     st.divider()
     
-    closed_dfs = elements.get_filtered_df(
-        df=st.session_state["closed_df"],
-        tags=selected_tags,
-        stake=st.session_state.confirmed_stake,
-        start_date=start_td,
-        end_date=end_td
-        )
-
-    merged_dfs = elements.get_filtered_df(
-        df=st.session_state["merge_df"],
-        tags=selected_tags,
-        stake=st.session_state.confirmed_stake,
-        start_date=start_td,
-        end_date=end_td
-    )
-
-    active_dfs = elements.get_filtered_df(
-        df=st.session_state["active_df"],
-        tags=selected_tags,
-        stake=st.session_state.confirmed_stake,
-        start_date=start_td,
-        end_date=end_td
-    )    
+    # Filtros da página: cada seção filtra o dataset de que precisa (memoizado)
+    filters = {
+        'tags': selected_tags,
+        'stake': st.session_state.confirmed_stake,
+        'start_date': start_td,
+        'end_date': end_td,
+    }
+    
+    merged_dfs = elements.get_filtered_df(dataset=datasets['merge'], **filters)
     
     # Main Stats
-
-   
-
-    elements.user_stats(df=merged_dfs['raw'])
+    elements.user_stats(
+        df=merged_dfs['raw'], dataset=datasets['merge'], key=merged_dfs.key
+    )
     
     st.divider()
 
     elements.cum_profit(df=merged_dfs['raw']) 
     
-    st.divider()       
+    st.divider()
+    clv_section(datasets, filters, current_address)
+    
+    st.divider()
+    analysis_tabs(datasets, filters, tags)
+
+
+# Seções em fragmentos: interagir com uma delas (botão do CLV, troca de aba,
+# paginação, simulador) roda só o fragmento, não a página inteira.
+
+@st.fragment
+def clv_section(
+    datasets: dict,
+    filters: dict,
+    current_address: str,
+    ) -> None:
+    closed_dfs = elements.get_filtered_df(dataset=datasets['closed'], **filters)
+    
     clv.render_clv_section(
         df=closed_dfs['raw'],
-        user_address=current_address
+        user_address=current_address,
+        tag_index=datasets['closed'].tags,
+        dataset=datasets['closed'],
+        # CLV só vai para o leaderboard quando calculado sem filtros
+        persist=len(closed_dfs['raw']) == len(datasets['closed']),
     )
-    
-    st.divider()
-       
+
+
+@st.fragment
+def analysis_tabs(
+    datasets: dict,
+    filters: dict,
+    tags: list,
+    ) -> None:
     # Exibir os trades do User:
+    # on_change='rerun' deixa as abas com estado: só a aba aberta é montada
     tabs = st.tabs(
         [
             'Markets Analisys',
+            'Position Sizes',
             'Open Positions',
             'Closed Positions',
             'CopyTrade Simulator'
-            ])
+            ],
+        key='analysis_tab',
+        on_change='rerun',
+        )
     
     # Market Analysis
     with tabs[0]:
-        cols = st.columns([3,1])
-        with cols[0]:
-            # Criar o Tag DF
-            tag_df = dh.create_tag_df(
-                df=st.session_state['merge_df'],
-                start_date=start_td,
-                end_date=end_td,
-                stake=st.session_state.confirmed_stake
-            )
-            elements.tag_df(df=tag_df)
+        if tabs[0].open:
+            merged_dfs = elements.get_filtered_df(dataset=datasets['merge'], **filters)
+            cols = st.columns([3,1])
+            with cols[0]:
+                # Criar o Tag DF
+                tag_df = dh.create_tag_df(
+                    dataset=datasets['merge'],
+                    start_date=filters['start_date'],
+                    end_date=filters['end_date'],
+                    stake=filters['stake'],
+                )
+                elements.tag_df(df=tag_df)
+        
+            with cols[1]:
+                elements.daily_profit(df=merged_dfs['raw'])       
     
-        with cols[1]:
-            elements.daily_profit(df=merged_dfs['raw'])       
+    # Position Sizes
+    with tabs[1]:
+        if tabs[1].open:
+            merged_dfs = elements.get_filtered_df(dataset=datasets['merge'], **filters)
+            elements.stake_sizes(
+                df=merged_dfs['raw'],
+                tag_index=datasets['merge'].tags,
+            )
     
     # Open Positions
-    with tabs[1]:
-        elements.open_positions(
-            df=active_dfs['raw'])
+    with tabs[2]:
+        if tabs[2].open:
+            active_dfs = elements.get_filtered_df(dataset=datasets['active'], **filters)
+            elements.open_positions(
+                df=active_dfs['latest'],
+                export_key=active_dfs.key,
+                export_dataset=datasets['active'])
         
     # Closed Positions 
-    with tabs[2]:
-        elements.closed_positions(df=closed_dfs['raw'])
+    with tabs[3]:
+        if tabs[3].open:
+            closed_dfs = elements.get_filtered_df(dataset=datasets['closed'], **filters)
+            elements.closed_positions(
+                df=closed_dfs['latest'],
+                export_key=closed_dfs.key,
+                export_dataset=datasets['closed'])
     
     # CopyTrade Simulator
-    with tabs[3]:
-        copy_trade_simulator.run(
-            df=st.session_state['closed_df'],
-            tags=tags
-        )
+    with tabs[4]:
+        if tabs[4].open:
+            copy_trade_simulator.run(
+                dataset=datasets['closed'],
+                tags=tags,
+            )
@@ -1,10 +1,14 @@
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-from helpers import get_exploded_df
 from dashboard.ui.formatting import *
+from data.tags import TagIndex
+from api.jobs import FetchJob
+from data.dataset import WalletDataset
 from data.analysis import DataAnalyst
-from datetime import datetime, timedelta
+from data.risk import risk_metrics
+from data.leaderboard import Leaderboard, RANK_METRICS, TAG_METRICS
+from datetime import date, datetime, timedelta
 from dashboard.backend import data_helpers as dh
 from dateutil.relativedelta import relativedelta
 
@@ -16,9 +20,56 @@ def top_bar():
         center_text('Powered by Striker', size=12)
 
 
+def leaderboard(
+    board: Leaderboard,
+    key: str = 'leaderboard',
+    ) -> str | None:
+    # Ranking das carteiras já analisadas. Retorna a carteira clicada (ou None)
+    st.subheader('Leaderboard')
+    
+    if len(board) == 0:
+        st.caption('Nenhuma carteira analisada ainda: busque uma carteira abaixo.')
+        return None
+    
+    cols = st.columns([2, 2, 1, 1])
+    tag = cols[1].selectbox(
+        'Tag', ['All'] + board.tags(), key=f'{key}_tag'
+    )
+    tag = None if tag == 'All' else tag
+    
+    metrics = list(RANK_METRICS) if tag is None else TAG_METRICS
+    metric = cols[0].selectbox(
+        'Rank by', metrics, format_func=RANK_METRICS.get, key=f'{key}_metric'
+    )
+    min_bets = cols[2].number_input(
+        'Min. Bets', min_value=0, value=20, step=10, key=f'{key}_min_bets'
+    )
+    k = cols[3].number_input(
+        'Top', min_value=10, max_value=1000, value=50, step=10, key=f'{key}_k'
+    )
+    
+    styler, wallets = dh.create_leaderboard_df(
+        board, metric=metric, tag=tag, min_bets=int(min_bets), k=int(k)
+    )
+    event = st.dataframe(
+        data=styler,
+        hide_index=True,
+        width='stretch',
+        on_select='rerun',
+        selection_mode='single-row',
+        key=f'{key}_table',
+    )
+    
+    rows = event.selection.rows
+    return wallets[rows[0]] if rows else None
+
+
 def user_stats(
-    df: pd.DataFrame
+    df: pd.DataFrame,
+    dataset: WalletDataset | None = None,
+    key: tuple | None = None,
     ) -> None:
+    # dataset/key (ex.: FilteredPositions.key): bootstrap memoizado no dataset
     profit, staked, roi = DataAnalyst.calculate_stats(df)
     stats = DataAnalyst.calculate_advanced_stats(df)
     
@@ -29,12 +80,45 @@ def user_stats(
     cols1[2].metric(label="Staked", value=float_to_dol(staked))
     cols1[3].metric(label="Flat Profit", value=float_to_units(stats['flat_profit']))
 
+    # Intervalos de confiança (bootstrap) ao lado das estimativas
+    boot = dh.bootstrap_summary(df, dataset, key)
+    cols1[1].caption(_interval_caption(boot['roi'], float_to_pct))
+    cols1[3].caption(_interval_caption(boot['units'], float_to_units))
+
     # --- Linha 2: 3 Métricas Avançadas ---
     cols2 = st.columns(4)
     cols2[0].metric(label="Total Trades", value=len(df))
     cols2[1].metric(label="Avg Stake", value=float_to_dol(stats['avg_stake']))
     cols2[2].metric(label="Median Stake", value=float_to_dol(stats['median_stake']))
-    cols2[3].metric(label="Max Drawdown", value='Loading...')
+    risk = risk_metrics(dh.cum_pnl(df=df, date_column='endDate'), positions=df)
+    cols2[3].metric(
+        label="Max Drawdown",
+        value=float_to_dol(risk['max_drawdown']),
+        help=(
+            f"Duração: {risk['max_drawdown_days']} dias | "
+            f"Tempo abaixo do topo: {float_to_pct(risk['time_under_water'])}"
+        ),
+    )
+
+    # --- Linha 3: Métricas de Risco ---
+    cols3 = st.columns(4)
+    cols3[0].metric(label="Sharpe", value=_ratio(risk['sharpe']))
+    cols3[1].metric(label="Sortino", value=_ratio(risk['sortino']))
+    cols3[2].metric(
+        label="Win/Loss Ratio",
+        value=_ratio(risk['win_loss_ratio']),
+        help=f"Win Rate: {float_to_pct(risk['win_rate'])}",
+    )
+    cols3[3].metric(label="Longest Losing Streak", value=risk['longest_losing_streak'])
+
+
+def _ratio(value: float | None) -> str:
+    return '-' if value is None else f"{value:.2f}"
+
+
+def _interval_caption(summary: dict, formatter) -> str:
+    interval = float_to_interval(summary['low'], summary['high'], formatter)
+    return f"95% CI: {interval} · {format_p_value(summary['p_value'])}"
 
 
 def cum_profit(
@@ -91,30 +175,13 @@ def daily_profit(
 
 
 def closed_positions(
-    df: pd.DataFrame
+    df: pd.DataFrame,
+    export_key: tuple | None = None,
+    export_dataset: WalletDataset | None = None,
     ) -> None:
+    # df já ordenado por endDate (FilteredPositions['latest']): o rerun só fatia a página
     
     st.subheader('Closed Positions:')
-    
-    # 1. Preparação dos Dados (Sorting)
-    df = df.copy()
-    if 'endDate' in df.columns:
-        df = df.sort_values(by='endDate', ascending=False)
-        
-    # 2. Preparação do CSV (Opcional, se quiser nomes bonitos no Excel)
-    csv_export_df = df[[
-        'endDate', 'title', 'outcome', 'totalBought', 
-        'avgPrice', 'curPrice', 'realizedPnl', 'slug', 'tags'
-    ]].rename(columns={
-        'endDate': 'End Date',
-        'avgPrice': 'Average Price',
-        'totalBought': 'Total Bought',
-        'realizedPnl': 'Realized Profit',
-        'curPrice': 'Current Price',
-        'title': 'Event',
-        'outcome': 'Bet'
-    })
-
 
     df_config = {
         "hide_index": True,
@@ -124,18 +191,38 @@ def closed_positions(
         }
     }
 
-    # 4. Chama o Renderizador Paginado
+    # Chama o Renderizador Paginado
     dh.render_paginated_table(
         df=df,
         unique_key="closed_positions_table", # ID Único Importante
         page_size=20,
         format_func=dh.filter_and_format_closed, # Passa a função, NÃO chama ela ()
-        csv_df=csv_export_df,
-        csv_file_name=f'closed_positions_{st.session_state.get("selected_wallet", "all")}.csv',
+        export_func=closed_export_df, # Só roda no clique de Download
+        export_key=export_key,
+        export_dataset=export_dataset,
+        file_name=f'closed_positions_{st.session_state.get("selected_wallet", "all")}',
         **df_config # Passa hide_index, etc.
     )
 
 
+def closed_export_df(
+    df: pd.DataFrame
+    ) -> pd.DataFrame:
+    # Colunas e nomes do arquivo de download (nomes bonitos no Excel)
+    return df[[
+        'endDate', 'title', 'outcome', 'totalBought', 
+        'avgPrice', 'curPrice', 'realizedPnl', 'slug', 'tags'
+    ]].rename(columns={
+        'endDate': 'End Date',
+        'avgPrice': 'Average Price',
+        'totalBought': 'Total Bought',
+        'realizedPnl': 'Realized Profit',
+        'curPrice': 'Current Price',
+        'title': 'Event',
+        'outcome': 'Bet'
+    })
+
+
 def tag_df(
     df: pd.DataFrame
     ) -> None:
@@ -150,6 +237,40 @@ def tag_df(
     )
 
 
+def stake_sizes(
+    df: pd.DataFrame,
+    tag_index: TagIndex | None = None,
+    key: str = 'stake_sizes',
+    ) -> None:
+    st.subheader('PnL by Position Size')
+    
+    by_tag = st.toggle('Split by Tag', key=f'{key}_by_tag')
+    styler, sizing = dh.create_stake_df(df=df, by_tag=by_tag, tag_index=tag_index)
+    
+    # Sizing vs Edge: stakes maiores vão para as apostas de maior edge?
+    cols = st.columns(4)
+    cols[0].metric(
+        label="Sizes Up on Edge",
+        value={True: 'Yes', False: 'No', None: '-'}[sizing['sizes_up']],
+        help=f"Edge medido por {sizing['edge_metric'].upper()}",
+    )
+    cols[1].metric(label="Stake x Edge Corr.", value=_ratio(sizing['correlation']))
+    cols[2].metric(
+        label="Stake-Weighted Edge",
+        value=float_to_pct(sizing['weighted_edge']),
+    )
+    cols[3].metric(label="Flat Edge", value=float_to_pct(sizing['flat_edge']))
+    
+    st.dataframe(
+        data=styler,
+        hide_index=True,
+        column_order=[
+            col for col in styler.columns
+            if col not in ["Staked"]],
+        width='stretch'
+    )
+
+
 def time_filter_buttons(
     df: pd.DataFrame
     ) -> tuple:
@@ -167,7 +288,9 @@ def time_filter_buttons(
         "Custom"
     ]
 
-    today = datetime.today()
+    # Dias inteiros (00:00 até 23:59:59): os limites não mudam a cada rerun,
+    # então os filtros memoizados continuam valendo
+    today = datetime.combine(date.today(), datetime.min.time())
 
     # Default values to avoid UnboundLocalError
     start = None
@@ -220,10 +343,17 @@ def time_filter_buttons(
         end = None
 
     elif selected == "Custom":
-        start, end = st.date_input(
+        dates = st.date_input(
             "Select a custom date range",
             value=(df["endDate"].min(), df["endDate"].max()),
         )
+        # Enquanto o intervalo está sendo escolhido vem só uma data
+        if len(dates) == 2:
+            start = datetime.combine(dates[0], datetime.min.time())
+            end = datetime.combine(dates[1], datetime.min.time())
+
+    if end is not None:
+        end = end + timedelta(days=1) - timedelta(microseconds=1)
 
     return selected, start, end
 
@@ -241,56 +371,21 @@ def tag_buttons(
 
     
 def get_filtered_df(
-    df: pd.DataFrame,
+    dataset: WalletDataset,
     tags: list = [],
     stake: float | None = None,
     start_date=None,
-    end_date=None
-    ) -> dict:
-    
-    df = df.copy()
-
-    # Normaliza datas
-    df["endDate"] = pd.to_datetime(df['endDate'], format='ISO8601', utc=True).dt.tz_localize(None)
-
-    df["endDate"] = pd.to_datetime(df["endDate"], utc=False, errors="coerce")
-
-    # ---------------------------------------------------------------------
-    # 💡 Só aplica filtro se start_date e end_date forem datetime válidos
-    # ---------------------------------------------------------------------
-    if isinstance(start_date, (datetime, pd.Timestamp)) and \
-       isinstance(end_date, (datetime, pd.Timestamp)):
-        
-        df = df[(df["endDate"] >= start_date) &
-                (df["endDate"] <= end_date)]
-
-    if stake is not None:
-                # Cria a coluna temporária calculada
-        df["calculated_stake"] = df["totalBought"] * df["avgPrice"]
-
-        # Filtra onde o valor calculado é maior que a stake passada
-        df = df[df["calculated_stake"] > stake]
-    
-    # exploded pós-filtro
-    exploded_df = get_exploded_df(df=df)
-
-    # ---------------------------------------------------------------------
-    # TAG FILTER
-    # ---------------------------------------------------------------------
-    if tags:
-        raw_df = exploded_df[exploded_df["tag"].isin(tags)]
-        main_df = dh.filter_and_format_closed(raw_df)
-        tag_trades_df = dh.filter_and_format_closed(raw_df)
-    else:
-        raw_df = df
-        main_df = dh.filter_and_format_closed(df)
-        tag_trades_df = dh.filter_and_format_closed(exploded_df)
-
-    return {
-        "raw": raw_df,
-        "main": main_df,
-        "exploded": tag_trades_df
-    }
+    end_date=None,
+    ) -> dh.FilteredPositions:
+    # {'raw', 'main', 'exploded'}: filtro memoizado por versão do dataset + filtros;
+    # 'main' e 'exploded' (formatados) só são montados se forem usados
+    return dh.filter_dataset(
+        dataset,
+        tags=tags,
+        stake=stake,
+        start_date=start_date,
+        end_date=end_date,
+    )
 
 
 def stake(
@@ -340,17 +435,45 @@ def stake(
     # Retorna o valor CONFIRMADO, e não o que está sendo digitado no momento
     return st.session_state.confirmed_stake
 
-def open_positions(df: pd.DataFrame) -> None:
+def open_positions(
+    df: pd.DataFrame,
+    export_key: tuple | None = None,
+    export_dataset: WalletDataset | None = None,
+    ) -> None:
+    # df já ordenado por endDate (FilteredPositions['latest'])
     
     st.subheader('Open Positions:')
-    
-    # --- 1. PREPARAR O DF PRINCIPAL ---
-    # Garante cópia e ordena por data de vencimento (decrescente)
-    df = df.copy()
-    if 'endDate' in df.columns:
-        df = df.sort_values(by='endDate', ascending=False)
-    
-    # --- 2. PREPARAR O CSV PARA DOWNLOAD ---
+
+    # --- 1. CONFIGURAÇÃO VISUAL DA TABELA ---
+    # Aqui definimos o que esconder ou formatar na visualização da tela.
+    # Como sua função `dh.filter_and_format_active` provavelmente retorna um Styler
+    # com as colunas já renomeadas para "Slug" e "Tags", usamos essas chaves.
+    df_config = {
+        "hide_index": True,
+        "column_config": {
+            "Slug": None,  # Oculta a coluna Slug
+            "Tags": None,  # Oculta a coluna Tags
+            # Você pode adicionar outras configurações aqui se o Styler não cobrir tudo
+        }
+    }
+
+    # --- 2. RENDERIZAÇÃO PAGINADA ---
+    dh.render_paginated_table(
+        df=df,
+        unique_key="open_positions_table", # ID único para não conflitar com Closed Positions
+        page_size=20,
+        format_func=dh.filter_and_format_active, # A função que aplica cores/estilos
+        export_func=open_export_df, # Só roda no clique de Download
+        export_key=export_key,
+        export_dataset=export_dataset,
+        file_name=f'open_positions_{st.session_state.get("selected_wallet", "all")}',
+        **df_config # Repassa as configs de colunas
+    )
+
+
+def open_export_df(
+    df: pd.DataFrame
+    ) -> pd.DataFrame:
     # Define as colunas que queremos no Excel/CSV final
     csv_columns = [
         'endDate', 'title', 'outcome',
@@ -360,7 +483,7 @@ def open_positions(df: pd.DataFrame) -> None:
     
     # Filtra colunas existentes e renomeia para ficar bonito no download
     existing_cols = [col for col in csv_columns if col in df.columns]
-    csv_export_df = df[existing_cols].copy().rename(columns={
+    return df[existing_cols].rename(columns={
         'endDate': 'End Date',
         'avgPrice': 'Average Price',
         'totalBought': 'Total Bought',
@@ -373,26 +496,53 @@ def open_positions(df: pd.DataFrame) -> None:
         'tags': 'Tags'
     })
 
-    # --- 3. CONFIGURAÇÃO VISUAL DA TABELA ---
-    # Aqui definimos o que esconder ou formatar na visualização da tela.
-    # Como sua função `dh.filter_and_format_active` provavelmente retorna um Styler
-    # com as colunas já renomeadas para "Slug" e "Tags", usamos essas chaves.
-    df_config = {
-        "hide_index": True,
-        "column_config": {
-            "Slug": None,  # Oculta a coluna Slug
-            "Tags": None,  # Oculta a coluna Tags
-            # Você pode adicionar outras configurações aqui se o Styler não cobrir tudo
-        }
-    }
 
-    # --- 4. RENDERIZAÇÃO PAGINADA ---
-    dh.render_paginated_table(
-        df=df,
-        unique_key="open_positions_table", # ID único para não conflitar com Closed Positions
-        page_size=20,
-        format_func=dh.filter_and_format_active, # A função que aplica cores/estilos
-        csv_df=csv_export_df,
-        csv_file_name=f'open_positions_{st.session_state.get("selected_wallet", "all")}.csv',
-        **df_config # Repassa as configs de colunas
-    )
\ No newline at end of file
+# Linhas de cada tabela parcial na tela de progresso da busca
+FETCH_PREVIEW_ROWS = 100
+
+
+def fetch_progress(
+    job: FetchJob
+    ) -> None:
+    # Tela enquanto a carteira é buscada: progresso + posições que já chegaram
+    st.progress(
+        job.fraction or 0.0,
+        text=f"{job.message} — {job.elapsed:.0f}s",
+    )
+    
+    active = job.frame('active')
+    closed = job.frame('closed')
+    
+    cols = st.columns(3)
+    cols[0].metric(label="Open Positions", value=f"{len(active):,}")
+    cols[1].metric(label="Closed Positions", value=f"{len(closed):,}")
+    if 'realizedPnl' in closed.columns:
+        cols[2].metric(
+            label="Realized Profit (so far)",
+            value=float_to_dol(pd.to_numeric(closed['realizedPnl'], errors='coerce').sum()),
+        )
+    
+    if not active.empty:
+        st.subheader('Open Positions:')
+        st.dataframe(
+            active[[c for c in [
+                'title', 'outcome', 'totalBought', 'avgPrice',
+                'curPrice', 'currentValue', 'cashPnl'
+            ] if c in active.columns]].head(FETCH_PREVIEW_ROWS),
+            hide_index=True,
+            width='stretch',
+        )
+    
+    if not closed.empty:
+        st.subheader('Closed Positions:')
+        latest = closed
+        if 'endDate' in closed.columns:
+            latest = closed.sort_values(by='endDate', ascending=False)
+        st.dataframe(
+            latest[[c for c in [
+                'endDate', 'title', 'outcome', 'totalBought',
+                'avgPrice', 'curPrice', 'realizedPnl'
+            ] if c in latest.columns]].head(FETCH_PREVIEW_ROWS),
+            hide_index=True,
+            width='stretch',
+        )
@@ -69,4 +69,18 @@ def float_to_pct(value, decimals=2):
 def float_to_units(value, decimals = 2):
     if value is None:
         return "0.00u"
-    return f"{value:,.{decimals}f}u"
\ No newline at end of file
+    return f"{value:,.{decimals}f}u"
+
+def float_to_interval(low, high, formatter=float_to_pct):
+    """Formata um intervalo de confiança: [low, high]."""
+    if low is None or high is None or pd.isna(low) or pd.isna(high):
+        return "-"
+    return f"[{formatter(low)}, {formatter(high)}]"
+
+def format_p_value(value):
+    """Formata um p-valor (p < 0.001 abaixo da precisão)."""
+    if value is None or pd.isna(value):
+        return "-"
+    if value < 0.001:
+        return "p < 0.001"
+    return f"p = {value:.3f}"
@@ -0,0 +1,265 @@
+"""
+Agregação vetorizada das estatísticas de posições:
+Profit, Volume, ROI, Units e Bets em uma única passada de groupby.
+"""
+import numpy as np
+import pandas as pd
+from data.tags import TagIndex
+from data.dataset import (
+    STAKE_EDGES, parse_dates, staked, position_roi, total_profit, stake_bucket
+)
+
+STATS_COLUMNS = ['profit', 'volume', 'roi', 'units', 'bets']
+
+# Frequências de calendário aceitas (aliases de Period do pandas)
+FREQUENCIES = {
+    'day': 'D',
+    'week': 'W',        # Semana ISO (segunda a domingo)
+    'month': 'M',
+    'quarter': 'Q',
+}
+
+
+def position_metrics(
+    df: pd.DataFrame,
+    pnl_column: str | None = None,
+    ) -> pd.DataFrame:
+    """
+    Monta, por linha, as colunas que os agregados somam.
+    profit: total_profit, ou só 'pnl_column' se passado
+    volume: staked
+    units:  roi da posição (somado vira Flat Profit)
+    """
+    if pnl_column is not None:
+        profit = df[pnl_column].fillna(0)
+    else:
+        profit = total_profit(df)
+
+    return pd.DataFrame({
+        'profit': profit,
+        'volume': staked(df),
+        'units': position_roi(df),
+    }, index=df.index)
+
+
+def aggregate_stats(
+    metrics: pd.DataFrame,
+    keys: list,
+    extra: dict | None = None,
+    ) -> pd.DataFrame:
+    """
+    Recebe as métricas por linha (ver position_metrics) e as chaves de grupo
+    (arrays/Series do mesmo tamanho) e devolve um DataFrame indexado pelas
+    chaves com as colunas de STATS_COLUMNS.
+    extra: agregações nomeadas adicionais, no formato do .agg do pandas
+    """
+    extra = extra or {}
+    grouped = metrics.groupby(keys, sort=True, observed=True).agg(
+        profit=('profit', 'sum'),
+        volume=('volume', 'sum'),
+        units=('units', 'sum'),
+        bets=('profit', 'size'),
+        **extra,
+    )
+    grouped['roi'] = grouped['profit'] / grouped['volume']
+    grouped['bets'] = grouped['bets'].astype(int)
+
+    return grouped[STATS_COLUMNS + list(extra)]
+
+
+def tag_stats(
+    df: pd.DataFrame,
+    min_bets: int = 0,
+    exclude_tags: list = [],
+    tag_index: TagIndex | None = None,
+    ) -> pd.DataFrame:
+    """
+    Estatísticas por tag em uma única passada.
+    Colunas: ['tag', 'profit', 'volume', 'roi', 'units', 'bets']
+    """
+    tag_index = TagIndex.for_frame(df, tag_index)
+    positions, tag = tag_index.explode(df, exclude_tags=exclude_tags)
+    metrics = position_metrics(df).iloc[positions].reset_index(drop=True)
+
+    stats = aggregate_stats(metrics, [pd.Series(tag, name='tag')])
+    stats = stats[stats['bets'] >= int(min_bets)].reset_index()
+    stats['tag'] = stats['tag'].astype(object)
+
+    return stats
+
+
+def tag_breakdown(
+    df: pd.DataFrame,
+    tag_index: TagIndex | None = None,
+    clv_column: str = 'price_clv',
+    ) -> pd.DataFrame:
+    """
+    Estatísticas por tag com CLV médio e CLV+ (fração com CLV > 0).
+    CLV só é preenchido se o df passou por calculate_clv.
+    Colunas: ['tag', 'bets', 'profit', 'volume', 'roi', 'flat_units',
+              'clv', 'clv_positive', 'clv_bets']
+    """
+    tag_index = TagIndex.for_frame(df, tag_index)
+    positions, tag = tag_index.explode(df)
+    metrics = position_metrics(df).reset_index(drop=True)
+
+    clv = (
+        df[clv_column].to_numpy(dtype=float) if clv_column in df.columns
+        else np.full(len(df), np.nan)
+    )
+    metrics['clv'] = clv
+    metrics['clv_positive'] = np.where(np.isnan(clv), np.nan, clv > 0)
+
+    stats = aggregate_stats(
+        metrics.iloc[positions].reset_index(drop=True),
+        [pd.Series(tag, name='tag')],
+        extra={
+            'clv': ('clv', 'mean'),
+            'clv_positive': ('clv_positive', 'mean'),
+            'clv_bets': ('clv', 'count'),
+        },
+    ).reset_index()
+    stats['tag'] = stats['tag'].astype(object)
+    # Sem CLV calculado a contagem fica vazia (não zero), como as médias
+    stats['clv_bets'] = stats['clv_bets'].where(stats['clv_bets'] > 0)
+
+    return stats.rename(columns={'units': 'flat_units'})[[
+        'tag', 'bets', 'profit', 'volume', 'roi', 'flat_units',
+        'clv', 'clv_positive', 'clv_bets',
+    ]]
+
+
+def time_bucket_stats(
+    df: pd.DataFrame,
+    freq: str = 'day',
+    date_column: str = 'endDate',
+    pnl_column: str | None = None,
+    by_tag: bool = False,
+    exclude_tags: list = [],
+    tag_index: TagIndex | None = None,
+    ) -> pd.DataFrame:
+    """
+    Estatísticas por janela de calendário em uma única passada.
+    freq: 'day', 'week' (ISO), 'month', 'quarter' ou um alias de Period do pandas
+    by_tag: se True, agrupa também por tag (coluna 'tag')
+    Colunas: ['date', ('tag'), 'profit', 'volume', 'roi', 'units', 'bets']
+    """
+    period = parse_dates(df[date_column]).dt.to_period(FREQUENCIES.get(freq, freq))
+    period = period.rename('date').reset_index(drop=True)
+    metrics = position_metrics(df, pnl_column=pnl_column).reset_index(drop=True)
+    
+    if by_tag:
+        tag_index = TagIndex.for_frame(df, tag_index)
+        positions, tag = tag_index.explode(df, exclude_tags=exclude_tags)
+        metrics = metrics.iloc[positions].reset_index(drop=True)
+        keys = [period.iloc[positions].reset_index(drop=True), pd.Series(tag, name='tag')]
+    else:
+        keys = [period]
+    
+    return aggregate_stats(metrics, keys).reset_index()
+
+
+def stake_bucket_label(code: int) -> str:
+    """
+    Nome legível da faixa de stake: '$10 - $20', '< $1', '>= $1M'
+    """
+    def money(value):
+        for size, suffix in ((1e6, 'M'), (1e3, 'K')):
+            if value >= size:
+                return f"${value / size:g}{suffix}"
+        return f"${value:g}"
+
+    low, high = STAKE_EDGES[code], STAKE_EDGES[code + 1]
+    if low == 0:
+        return f"< {money(high)}"
+    if np.isinf(high):
+        return f">= {money(low)}"
+    return f"{money(low)} - {money(high)}"
+
+
+def stake_stats(
+    df: pd.DataFrame,
+    by_tag: bool = False,
+    clv_column: str = 'price_clv',
+    exclude_tags: list = [],
+    tag_index: TagIndex | None = None,
+    ) -> pd.DataFrame:
+    """
+    Estatísticas por faixa de stake (códigos pré-calculados no dataset).
+    Além de STATS_COLUMNS: win_rate e clv (média de 'clv_column', se existir).
+    Colunas: ['bucket', 'stake_range', ('tag'), *STATS_COLUMNS, 'win_rate', 'clv']
+    """
+    bucket = stake_bucket(df).rename('bucket').reset_index(drop=True)
+    metrics = position_metrics(df).reset_index(drop=True)
+
+    # Vitórias/derrotas só contam posições com resultado
+    pnl = metrics['profit'].to_numpy(dtype=float)
+    metrics['win'] = np.where(pnl > 0, 1.0, np.where(pnl < 0, 0.0, np.nan))
+    metrics['clv'] = (
+        df[clv_column].to_numpy(dtype=float) if clv_column in df.columns
+        else np.nan
+    )
+
+    if by_tag:
+        tag_index = TagIndex.for_frame(df, tag_index)
+        positions, tag = tag_index.explode(df, exclude_tags=exclude_tags)
+        metrics = metrics.iloc[positions].reset_index(drop=True)
+        keys = [bucket.iloc[positions].reset_index(drop=True), pd.Series(tag, name='tag')]
+    else:
+        keys = [bucket]
+
+    valid = (keys[0] >= 0).to_numpy()
+    stats = aggregate_stats(
+        metrics[valid], [k[valid] for k in keys],
+        extra={'win_rate': ('win', 'mean'), 'clv': ('clv', 'mean')},
+    ).reset_index()
+
+    stats.insert(1, 'stake_range', stats['bucket'].map(stake_bucket_label))
+    if by_tag:
+        stats['tag'] = stats['tag'].astype(object)
+
+    return stats
+
+
+def sizing_edge(
+    df: pd.DataFrame,
+    clv_column: str = 'price_clv',
+    ) -> dict:
+    """
+    O trader aumenta o stake nas apostas de maior edge?
+    Edge = CLV quando disponível (sinal menos ruidoso), senão ROI da posição.
+
+    Retorna:
+        edge_metric: 'clv' ou 'roi'
+        correlation: correlação de Spearman entre stake e edge
+        weighted_edge: edge médio ponderado pelo stake
+        flat_edge: edge médio com peso igual por aposta
+        sizes_up: True se stakes maiores vão para apostas de edge maior
+    """
+    use_clv = clv_column in df.columns and df[clv_column].notna().any()
+    edge = df[clv_column] if use_clv else position_roi(df)
+    stake = staked(df)
+
+    valid = edge.notna() & stake.notna() & (stake > 0)
+    edge, stake = edge[valid].astype(float), stake[valid].astype(float)
+
+    report = {
+        'edge_metric': 'clv' if use_clv else 'roi',
+        'correlation': None,
+        'weighted_edge': None,
+        'flat_edge': None,
+        'sizes_up': None,
+    }
+    if len(edge) < 2:
+        return report
+
+    # Spearman = Pearson dos ranks (sem depender do scipy)
+    correlation = stake.rank().corr(edge.rank())
+    report['correlation'] = None if np.isnan(correlation) else float(correlation)
+    report['weighted_edge'] = float((stake * edge).sum() / stake.sum())
+    report['flat_edge'] = float(edge.mean())
+    report['sizes_up'] = bool(
+        report['weighted_edge'] > report['flat_edge']
+        and (report['correlation'] or 0) > 0
+    )
+    return report
@@ -1,20 +1,23 @@
 import pandas as pd
-from helpers import safe_divide, to_list
+from helpers import safe_divide
+from data.tags import TagIndex, SPORTS_TAGS
+from data.dataset import staked, position_roi, total_profit
+from data.aggregation import tag_stats, time_bucket_stats, stake_stats, sizing_edge
+from data.significance import bootstrap_by_tag, N_RESAMPLES
 from api.price_history import process_dataframe
+from api.jobs import CancelToken
 # Import lazy de fetch_clv - só será importado quando calculate_clv for chamado
 
 class DataAnalyst:
     @staticmethod
     def calculate_advanced_stats(df:pd.DataFrame):
-        df = df.copy()
         stats = {}
         
-        df['staked'] = df['totalBought'] * df['avgPrice']
-        df['roi'] = safe_divide(df['realizedPnl'], df['staked'])
+        position_stake = staked(df)
         
-        stats['flat_profit'] = df['roi'].sum()
-        stats['avg_stake'] = df['staked'].mean()
-        stats['median_stake'] = df['staked'].median() 
+        stats['flat_profit'] = position_roi(df).sum()
+        stats['avg_stake'] = position_stake.mean()
+        stats['median_stake'] = position_stake.median() 
         
         return stats
     
@@ -24,21 +27,12 @@ class DataAnalyst:
         Recebe um dataframe, calcula e retorna:
         Profit, Vol e ROI
         """
-        df = df.copy()
+        # Colunas derivadas vêm prontas do WalletDataset (sem cópia)
+        total_profit_sum = total_profit(df).sum()
+        total_volume = staked(df).sum()
+        total_roi = safe_divide(total_profit_sum, total_volume) or 0
         
-        # Calcular total_profit: usar cashPnl se existir, senão apenas realizedPnl
-        df['total_profit'] = df['realizedPnl'].fillna(0)
-        if 'cashPnl' in df.columns:
-            df['total_profit'] += df['cashPnl'].fillna(0)
-        
-        df['volume'] = df['totalBought'] * df['avgPrice']
-        df['roi'] = safe_divide(df['total_profit'], df['volume'])
-
-        total_profit = df['total_profit'].sum()
-        total_volume = df['volume'].sum()
-        total_roi = safe_divide(total_profit, total_volume) or 0
-        
-        return total_profit, total_volume, total_roi
+        return total_profit_sum, total_volume, total_roi
     
     @staticmethod
     def return_stats(df: pd.DataFrame):
@@ -50,71 +44,104 @@ class DataAnalyst:
         return DataAnalyst.calculate_stats(df)
     
     @staticmethod
-    def in_depth_tag_analysis(df: pd.DataFrame):
+    def in_depth_tag_analysis(
+        df: pd.DataFrame,
+        tag_index: TagIndex | None = None,
+        ) -> dict:
         """
         Pipeline Completo de Análise para um user.
-        TODO: Estudo de Variância de Stake
+        Inclui o estudo de variância de stake (faixas de stake e sizing vs edge).
         """
-        df = df.copy()
-        df['staked'] = df['totalBought'] * df['avgPrice']
+        position_stake = staked(df)
         
         # Lucro Total, Vol e ROI. (Tupled)
         totals = DataAnalyst.calculate_stats(df=df)
-        avg_stake = df['staked'].mean()
         
         # Aqui começa a análise detalhada de Stakes
-        max_stake = df['staked'].max()
-        min_stake = df['staked'].min()
-        flat_profit = totals[2] * len(df) # ROI vs Apostas
+        stake_buckets, sizing = DataAnalyst.stake_analysis(df)
+        stake_buckets_by_tag, _ = DataAnalyst.stake_analysis(
+            df, by_tag=True, tag_index=tag_index
+            )
+        
+        return {
+            'totals': totals,
+            'flat_profit': position_roi(df).sum(),
+            'avg_stake': position_stake.mean(),
+            'max_stake': position_stake.max(),
+            'min_stake': position_stake.min(),
+            'stake_std': position_stake.std(),
+            'stake_buckets': stake_buckets,
+            'stake_buckets_by_tag': stake_buckets_by_tag,
+            'sizing': sizing,
+        }
+
+    @staticmethod
+    def stake_analysis(
+        df: pd.DataFrame,
+        by_tag: bool = False,
+        exclude_tags: list = [],
+        tag_index: TagIndex | None = None,
+        ) -> tuple[pd.DataFrame, dict]:
+        """
+        Recebe um dataframe e retorna (estatísticas por faixa de stake, sizing vs edge).
+        Usa 'price_clv' quando o df já passou por calculate_clv.
+        """
+        removed_tags = SPORTS_TAGS + exclude_tags if by_tag else exclude_tags
+        
+        buckets = stake_stats(
+            df, by_tag=by_tag, exclude_tags=removed_tags, tag_index=tag_index
+            )
+        
+        return buckets, sizing_edge(df)
  
     @staticmethod
     def tag_analysis(
         df: pd.DataFrame,
         min_bets: int = 50,
         exclude_tags: list = [],
+        tag_index: TagIndex | None = None,
         ):
         """
         Recebe um dataframe e retorna a análise do user por "tag"
+        tag_index: (Opcional) tags já normalizadas do df de origem
         """
         
-        df = df.copy()
-        
         # Verificar se a coluna 'tags' existe
         if 'tags' not in df.columns:
             print("⚠️  Aviso: Coluna 'tags' não encontrada no DataFrame. Retornando DataFrame vazio.")
             return pd.DataFrame(columns=['tag', 'profit', 'volume', 'roi', 'bets'])
         
-        removed_tags = ['Games', 'Sports'] + exclude_tags
-        
-        # Passo 1: Criar o df
-        tmp = df.copy()
-        tmp['__tags_list'] = tmp['tags'].apply(to_list)
-        exploded = tmp.explode('__tags_list', ignore_index=True)
-        exploded = exploded.rename(columns={'__tags_list': 'tag'})
-        exploded = exploded[exploded['tag'].notna()]
-        exploded = exploded[~exploded['tag'].isin(removed_tags)]
-        
-        # Filtrar quais tags vamos estudar antes de entrar em loop
-        bets_per_tag = exploded.groupby('tag').size()
-        valid_tags = bets_per_tag[bets_per_tag >= int(min_bets)].index
-        
-        result = []
-        
-        for tag in valid_tags:
-            tag_df = exploded[exploded['tag'] == tag]
-            profit, vol, roi = DataAnalyst.calculate_stats(tag_df)
-            adv_stats = DataAnalyst.calculate_advanced_stats(tag_df)
-            tag_data = {
-                'tag': tag,
-                'profit': profit,
-                'volume': vol,
-                'roi': roi,
-                'units': adv_stats['flat_profit'],
-                'bets': int(bets_per_tag.get(tag, 0))
-            }
-            result.append(tag_data)
+        removed_tags = SPORTS_TAGS + exclude_tags
+        
+        # Uma única passada: explode só as tags e agrupa as métricas por tag
+        result = tag_stats(
+            df, min_bets=min_bets, exclude_tags=removed_tags, tag_index=tag_index
+            )
        
-        return pd.DataFrame(result).sort_values(by='roi', ascending=False)
+        return result.sort_values(by='roi', ascending=False)
+
+    @staticmethod
+    def tag_significance(
+        df: pd.DataFrame,
+        min_bets: int = 50,
+        exclude_tags: list = [],
+        tag_index: TagIndex | None = None,
+        n_resamples: int = N_RESAMPLES,
+        ) -> pd.DataFrame:
+        """
+        Intervalos de confiança e p-valores (bootstrap) por tag,
+        com os mesmos filtros de tag_analysis.
+        """
+        if 'tags' not in df.columns:
+            return pd.DataFrame(columns=['tag'])
+        
+        return bootstrap_by_tag(
+            df,
+            min_bets=min_bets,
+            exclude_tags=SPORTS_TAGS + exclude_tags,
+            tag_index=tag_index,
+            n_resamples=n_resamples,
+        )
 
     @staticmethod
     def print_tag_report(
@@ -159,25 +186,7 @@ class DataAnalyst:
         Recebe um dataframe e retorna o PL 
         separado por dia
         """
-        df = df.copy()
-        df['endDate'] = pd.to_datetime(
-            df['endDate'], format='ISO8601', utc=True
-            ).dt.tz_localize(None).dt.to_period('D')
-        
-        all_data = []
-        
-        
-        for date, date_df in df.groupby('endDate'):
-            profit, vol, roi = DataAnalyst.calculate_stats(date_df)
-            single_date = {
-                'date': date,
-                'profit': profit,
-                'volume': vol,
-                'roi': roi
-            }
-            all_data.append(single_date)
-        
-        return pd.DataFrame(all_data)
+        return time_bucket_stats(df, freq='day')[['date', 'profit', 'volume', 'roi']]
     
     @staticmethod
     def monthly_balance(df: pd.DataFrame):
@@ -185,196 +194,125 @@ class DataAnalyst:
         Recebe um dataframe e retorna o PL 
         separado por mês
         """
-        df = df.copy()       
-        df['month'] = pd.to_datetime(
-            df['endDate'], format='ISO8601', utc=True
-            ).dt.tz_localize(None).dt.to_period('M')
-        
-        all_data = []
-        
-        for date, date_df in df.groupby('month'):
-            profit, vol, roi = DataAnalyst.calculate_stats(date_df)
-            single_date = {
-                'date': date,
-                'profit': profit,
-                'volume': vol,
-                'roi': roi
-            }
-            all_data.append(single_date)
-        
-        return pd.DataFrame(all_data)
+        return time_bucket_stats(df, freq='month')[['date', 'profit', 'volume', 'roi']]
 
     @staticmethod
-    def calculate_clv(
-        user_address: str,
-        df: pd.DataFrame,
-    ):
-        
-        print("--- INICIANDO calculate_clv ---")
+    def clv_from_trades(
+        clv_df: pd.DataFrame,
+        trades_df: pd.DataFrame,
+    ) -> tuple[pd.DataFrame, pd.Series]:
+        """
+        Calcula o CLV de forma vetorizada a partir dos trades já baixados.
+        clv_df: posições com 'start_time' e 'match_start_price' (process_dataframe)
+        trades_df: trades da API com 'conditionId', 'asset', 'timestamp', 'size', 'price'
         
-        df = df.copy()
+        Retorna (clv_df com 'price_clv' e 'odds_clv', motivos por chave não calculada)
+        """
+        keys = ['conditionId', 'asset']
+        clv_df = clv_df.copy()
         
-        # Colocar o df na forma correta
-        clv_df = process_dataframe(df)
+        # Início do evento e preço de fechamento: uma linha por (mercado, token)
+        lookup = clv_df[keys + ['start_time', 'match_start_price']].drop_duplicates(keys)
+        start_time = pd.to_datetime(
+            lookup['start_time'], format='ISO8601', utc=True, errors='coerce'
+        )
+        lookup['start_time_unix'] = (
+            (start_time - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)
+        )
+        lookup = lookup.drop(columns='start_time')
+        
+        # A API devolve segundos; aceita também milissegundos
+        timestamp = pd.to_numeric(trades_df['timestamp'], errors='coerce')
+        if timestamp.median() > 1e12:
+            timestamp = timestamp // 1000
+        
+        trades = pd.DataFrame({
+            'conditionId': trades_df['conditionId'],
+            'asset': trades_df['asset'],
+            'timestamp_seconds': timestamp,
+            'size': pd.to_numeric(trades_df['size'], errors='coerce'),
+            'price': pd.to_numeric(trades_df['price'], errors='coerce'),
+        })
+        
+        # Trades de chaves que não estão no df principal são descartados no merge
+        merged = trades.merge(lookup, on=keys, how='inner')
+        
+        # Só entram no preço médio os trades anteriores ao início do evento
+        pre_start = merged['timestamp_seconds'] < merged['start_time_unix']
+        merged['pre_size'] = merged['size'].where(pre_start, 0)
+        merged['pre_notional'] = (merged['size'] * merged['price']).where(pre_start, 0)
+        
+        grouped = merged.groupby(keys, sort=False).agg(
+            total_size=('pre_size', 'sum'),
+            notional=('pre_notional', 'sum'),
+            closing_price=('match_start_price', 'first'),
+        )
         
-        clv_results = {}
-        clv_reasons = {}
+        closing_price = grouped['closing_price'].astype(float)
+        no_closing = closing_price.isna()
+        no_trades = ~no_closing & (grouped['total_size'] == 0)
+        valid = ~no_closing & ~no_trades
         
-        def create_key(df: pd.DataFrame) -> pd.Series:
-            return df['conditionId'].astype(str) + '_' + df['asset'].astype(str)
+        avg_price = (grouped['notional'] / grouped['total_size']).where(valid)
+        grouped['price_clv'] = closing_price - avg_price
+        grouped['odds_clv'] = (1 / avg_price) - (1 / closing_price.where(valid))
         
-        clv_df['_composite_key'] = create_key(df=clv_df)
+        # Mesmas chaves de motivo do relatório original
+        reasons = pd.Series(None, index=grouped.index, dtype=object)
+        reasons[no_closing] = 'closing_price_is_nan'
+        reasons[no_trades] = 'sem_trades_pre_market'
+        reasons = reasons.dropna()
         
-        try:
-            clv_df['start_time_unix'] = pd.to_datetime(
-                clv_df['start_time'], format='ISO8601', utc=True
-            ).astype('int64') // 10**9
-            print(f"DataFrame principal (df) preparado. {len(df)} linhas.")
-            print(f"Exemplo start_time_unix: {clv_df['start_time_unix'].iloc[0]}")
+        position_keys = pd.MultiIndex.from_frame(clv_df[keys])
+        clv_df['price_clv'] = grouped['price_clv'].reindex(position_keys).to_numpy()
+        clv_df['odds_clv'] = grouped['odds_clv'].reindex(position_keys).to_numpy()
         
-        except Exception as e:
-            print(f"Erro CRÍTICO ao converter 'start_time' no df principal: {e}")
-            return clv_df # Retorna o df original se falhar aqui
+        return clv_df, reasons
 
-        df_lookup = clv_df.set_index(['conditionId', 'asset']).sort_index()
+    @staticmethod
+    def calculate_clv(
+        user_address: str,
+        df: pd.DataFrame,
+        cancel: CancelToken | None = None,
+    ):
+        """
+        cancel: (Opcional) CancelToken; cancelado, as buscas param e sobe Cancelled
+        """
+        
+        print("--- INICIANDO calculate_clv ---")
+        
+        # Colocar o df na forma correta
+        clv_df = process_dataframe(df, cancel=cancel)
+        print(f"DataFrame principal (df) preparado. {len(clv_df)} linhas.")
         
         from api import fetch_clv
         print("Buscando trades da API (fetch_clv)...")
         trades_df = fetch_clv.fetch_clv(
             user_address=user_address,
-            df=df
+            df=df,
+            cancel=cancel,
         )
         
         if trades_df.empty:
             print("❌ ERRO: fetch_clv retornou um DataFrame VAZIO. Nenhum trade para processar.")
             print("--- FINALIZANDO calculate_clv (sem dados) ---")
-            clv_df = clv_df.drop(columns=['start_time_unix', '_composite_key'], errors='ignore')
             return clv_df
             
         print(f"✅ Trades recebidos. Shape do trades_df: {trades_df.shape}")
-
-        try:
-            # *** DEBUG: Vamos inspecionar o timestamp ANTES de converter ***
-            raw_timestamp_example = trades_df['timestamp'].iloc[0]
-            print(f"Exemplo de 'timestamp' RAW da API: {raw_timestamp_example} (Tipo: {type(raw_timestamp_example)})")
-            
-            trades_df['timestamp_seconds'] = trades_df['timestamp'].astype(float) // 1000
-            
-            print(f"Exemplo de 'timestamp_seconds' CONVERTIDO: {trades_df['timestamp_seconds'].iloc[0]}")
-            
-        except KeyError:
+        
+        if 'timestamp' not in trades_df.columns:
             print("❌ ERRO: A coluna 'timestamp' não foi encontrada no trades_df.")
-            clv_df = clv_df.drop(columns=['start_time_unix', '_composite_key'], errors='ignore')
             return clv_df
         
-        except Exception as e:
-            print(f"❌ ERRO ao converter timestamp do trades_df: {e}")
-            clv_df = clv_df.drop(columns=['start_time_unix', '_composite_key'], errors='ignore')
-            return clv_df
-
-        trades_df['_composite_key'] = create_key(df=trades_df)
-        df_keys_set = set(zip(clv_df['conditionId'], clv_df['asset']))
-        
-        print(f"--- Iniciando loop por {len(trades_df.groupby(['conditionId', 'asset']))} grupos de trades ---")
-        
-        # Entrar no loop e calcular o CLV para todas as apostas
-        for (condition_id, asset), group_df in trades_df.groupby(['conditionId', 'asset']):
-            composite_key =  f"{condition_id}_{asset}"
-                       
-            try:
-                if (condition_id, asset) not in df_keys_set:
-                    print("  -> SKIP: Chave não encontrada no df principal.")
-                    continue
-                    
-                lookup_row = df_lookup.loc[(condition_id, asset)]
-                
-                if isinstance(lookup_row, pd.DataFrame):
-                    lookup_row = lookup_row.iloc[0]
-                
-                # *** DEBUG: Inspecionar os valores de lookup ***
-                start_time = lookup_row['start_time_unix']
-                closing_price = lookup_row['match_start_price']
-                
-                # *** DEBUG: Checar se o closing_price é NaN ***
-                if pd.isna(closing_price):
-                    print("  -> ERRO: 'match_start_price' (Closing Price) é NaN. Pulando.")
-                    clv_reasons[composite_key] = 'closing_price_is_nan'
-                    continue
-                                
-                # Usar a coluna 'timestamp_seconds' para o filtro
-                filtered_df = group_df[group_df['timestamp_seconds'] < start_time].copy()
-                                
-                total_size = filtered_df['size'].sum()
-                
-                if total_size == 0:
-                    print("  -> SKIP: Nenhum trade encontrado antes do start_time (Total Size = 0).")
-                    clv_reasons[composite_key] = 'sem_trades_pre_market'
-                    continue 
-
-                # Calcular agora o preço médio.
-                avg_price = (
-                    (filtered_df['size'] * filtered_df['price']).sum() 
-                    / total_size
-                    )
-                
-                price_clv = closing_price - avg_price
-
-                odds_clv = safe_divide(1,avg_price) - safe_divide(1,closing_price)
-            
-                
-                clv_results[composite_key] = {
-                    'price_clv': price_clv, 'odds_clv': odds_clv,
-                    'avg_price': avg_price, 'closing_price': closing_price
-                }
-                
-            except Exception as e:
-                print(f"  -> ERRO CRÍTICO no loop: {e}")
-                clv_reasons[composite_key] = f'erro_processamento: {str(e)[:50]}'
-                                
-        print("\n--- Loop finalizado. Mapeando resultados ---")
-        
-        price_clv_map = {key: val['price_clv'] for key, val in clv_results.items()}
-        odds_clv_map = {key: val['odds_clv'] for key, val in clv_results.items()}
-
-        clv_df['price_clv'] = clv_df['_composite_key'].map(price_clv_map)
-        clv_df['odds_clv'] = clv_df['_composite_key'].map(odds_clv_map)
-                
-        clv_df = clv_df.drop(
-            columns=['start_time_unix', '_composite_key'], errors='ignore'
-            )
+        clv_df, clv_reasons = DataAnalyst.clv_from_trades(clv_df, trades_df)
         
         # Imprimir um resumo dos problemas
-        if clv_reasons:
+        if not clv_reasons.empty:
             print("\nRelatório de CLV (itens não calculados):")
-            reason_counts = pd.Series(clv_reasons).value_counts()
-            print(reason_counts)
-        
-        print("Estatísticas do CLV:")
-        print("\n" + "-" * 40)
-        print("-" * 40)
+            print(clv_reasons.value_counts())
         
-        # 1. Isolar os valores de CLV que foram calculados com sucesso (não-nulos)
         valid_clv = clv_df['price_clv'].dropna()
-        total_calculated = len(valid_clv)
-        
-        # 2. Verificar se temos dados para calcular
-        if total_calculated == 0:
-            print("  Nenhum valor de CLV foi calculado com sucesso.")
-            print("  Estatísticas indisponíveis.")
-        
-        else:
-            # 3. Calcular as métricas
-            mean_clv = valid_clv.mean()
-            median_clv = valid_clv.median()
-            
-            # Calcular percentuais
-            pos_percent = (valid_clv > 0).sum() / total_calculated * 100
-            neg_percent = (valid_clv < 0).sum() / total_calculated * 100
-            zero_percent = (valid_clv == 0).sum() / total_calculated * 100
-            
-            
-        
-        print("-" * 40)
+        print(f"CLV calculado para {len(valid_clv)} de {len(clv_df)} posições.")
         print("--- FINALIZANDO calculate_clv (com sucesso) ---")
         
-        return clv_df
\ No newline at end of file
+        return clv_df
@@ -0,0 +1,190 @@
+"""
+Cache de carteiras compartilhado pelo processo (todas as sessões do dashboard).
+- Uma cópia dos datasets por carteira, não importa quantas sessões a abram
+- LRU pelo tamanho real em bytes, limitado por um orçamento de memória
+  (re-medido a cada acesso: índices montados sob demanda também contam)
+- Uma única busca por carteira mesmo com várias sessões pedindo ao mesmo tempo
+- Dados vencidos são servidos enquanto a nova versão é buscada em background
+- submit(): a busca roda numa thread e quem pediu acompanha pelo Future
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Orçamento de memória e idade máxima (antes de revalidar) das carteiras em cache
+WALLET_CACHE_MB = int(os.environ.get('WALLET_CACHE_MB', 1024))
+WALLET_CACHE_MAX_AGE = float(os.environ.get('WALLET_CACHE_MAX_AGE', 15 * 60))
+
+
+def value_nbytes(value) -> int:
+    """
+    Bytes de um valor em cache: objetos com 'nbytes' (WalletDataset) ou
+    dicts/listas deles. Objetos repetidos contam uma vez só.
+    """
+    seen, total = set(), 0
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+
+        if isinstance(item, dict):
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        else:
+            total += int(getattr(item, 'nbytes', 0))
+    return total
+
+
+class WalletCache:
+    """
+    loader(wallet) -> valor imutável (ex.: {'merge', 'closed', 'active'}).
+    Os valores devolvidos são compartilhados: quem usa não deve alterá-los.
+    """
+
+    def __init__(
+        self,
+        loader,
+        budget_bytes: int = WALLET_CACHE_MB * 2**20,
+        max_age: float = WALLET_CACHE_MAX_AGE,
+        ):
+        self._loader = loader
+        self.budget_bytes = budget_bytes
+        self.max_age = max_age
+        self.nbytes = 0
+
+        self._entries = OrderedDict()   # wallet -> {'value', 'nbytes', 'loaded_at'}
+        self._pending = {}              # wallet -> Future da busca em andamento
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(wallet: str) -> str:
+        return wallet.strip().lower()
+
+    def __contains__(self, wallet: str) -> bool:
+        return self._key(wallet) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, wallet: str):
+        """
+        Retorna o valor da carteira (buscando se preciso). Se o valor estiver
+        vencido, devolve o atual e dispara a revalidação em background.
+        """
+        return self._request(wallet, background=False).result()
+
+    def submit(self, wallet: str) -> Future:
+        """
+        Como get(), mas sem bloquear: a busca (se preciso) roda numa thread
+        e o Future dela é devolvido (já resolvido se a carteira está em cache).
+        """
+        return self._request(wallet, background=True)
+
+    def _request(self, wallet: str, background: bool) -> Future:
+        wallet = self._key(wallet)
+
+        with self._lock:
+            entry = self._entries.get(wallet)
+            if entry is not None:
+                self._entries.move_to_end(wallet)
+                self._remeasure(entry)
+                if self._is_stale(entry) and wallet not in self._refreshing:
+                    self._refreshing.add(wallet)
+                    threading.Thread(
+                        target=self._refresh, args=(wallet,), daemon=True
+                    ).start()
+                future = Future()
+                future.set_result(entry['value'])
+                return future
+
+            # Só uma busca por carteira: as outras sessões esperam por ela
+            future = self._pending.get(wallet)
+            if future is not None:
+                return future
+            future = self._pending[wallet] = Future()
+
+        if background:
+            threading.Thread(
+                target=self._load, args=(wallet, future), daemon=True
+            ).start()
+        else:
+            self._load(wallet, future)
+        return future
+
+    def _load(self, wallet: str, future: Future) -> None:
+        try:
+            value = self._loader(wallet)
+            self._store(wallet, value)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._pending.pop(wallet, None)
+
+    def pending(self, wallet: str) -> bool:
+        return self._key(wallet) in self._pending
+
+    def invalidate(self, wallet: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(self._key(wallet), None)
+            if entry is not None:
+                self.nbytes -= entry['nbytes']
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'wallets': len(self._entries),
+                'nbytes': self.nbytes,
+                'budget_bytes': self.budget_bytes,
+                'refreshing': len(self._refreshing),
+            }
+
+    def _is_stale(self, entry: dict) -> bool:
+        return time.monotonic() - entry['loaded_at'] > self.max_age
+
+    def _refresh(self, wallet: str) -> None:
+        try:
+            self._store(wallet, self._loader(wallet))
+        except Exception as e:
+            # Continua servindo a versão anterior; tenta de novo no próximo acesso vencido
+            print(f"⚠️  Falha ao revalidar {wallet}: {type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(wallet)
+
+    def _store(self, wallet: str, value) -> None:
+        nbytes = value_nbytes(value)
+
+        with self._lock:
+            old = self._entries.pop(wallet, None)
+            if old is not None:
+                self.nbytes -= old['nbytes']
+
+            self._entries[wallet] = {
+                'value': value,
+                'nbytes': nbytes,
+                'loaded_at': time.monotonic(),
+            }
+            self.nbytes += nbytes
+            self._evict()
+
+    def _remeasure(self, entry: dict) -> None:
+        # O valor cresce depois da carga (ex.: bitmaps de tags do FilterIndex);
+        # chamado com o lock, na entrada mais recente
+        nbytes = value_nbytes(entry['value'])
+        self.nbytes += nbytes - entry['nbytes']
+        entry['nbytes'] = nbytes
+        self._evict()
+
+    def _evict(self) -> None:
+        # Remove as menos usadas até caber no orçamento (a mais recente fica)
+        while self.nbytes > self.budget_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted['nbytes']
@@ -0,0 +1,566 @@
+"""
+Simulação de copy-trade sobre arrays NumPy (um elemento por fill).
+- Fills:       trades ordenados por (asset, timestamp) e convertidos uma única vez
+- TraderPass:  contabilidade do trader (custo médio) com operações cumulativas
+- simulate():  lado da cópia, o único que depende do caminho, num laço sobre arrays
+- sweep():     grade de parâmetros sobre os mesmos Fills/TraderPass, em processos
+Mesmos resultados do laço por iterrows (uma linha por asset), sem DataFrame por grupo.
+"""
+import os
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from data.risk import drawdown_series
+
+STRATEGIES = ['Flat Staking', 'Capped', '2x Flat']
+SELL_STRATEGIES = ['Proportional', 'One Sell Dumps All', 'Never Sell']
+
+# Preço final a partir do qual o token conta como vencedor
+WON_PRICE = 0.9
+
+# Variação máxima de log(custo) dentro de um trecho da recorrência antes de
+# rebasear (exp(±LOG_REBASE) fica longe de overflow/underflow)
+LOG_REBASE = 30.0
+
+# Grades menores que isso rodam no próprio processo (subir os workers custa mais)
+SWEEP_MIN_PARALLEL = 16
+# Workers do sweep nascem do forkserver, não de um fork do processo que chama:
+# no dashboard ele tem threads (cache, prefetch, escalonador) com locks que o
+# fork copiaria travados. Threads não ajudam (o laço da cópia segura o GIL)
+SWEEP_START_METHOD = 'forkserver'
+
+SWEEP_COLUMNS = [
+    'stake', 'trigger', 'strategy', 'sell_strategy',
+    'pnl', 'roi', 'max_drawdown', 'volume', 'markets',
+]
+
+RESULT_COLUMNS = [
+    'timestamp', 'trade', 'bet', 'won',
+    'copy_total_bought', 'copy_total_sold', 'copy_held_live',
+    'copy_avg_buy', 'copy_avg_sell', 'copy_avg_held',
+    'copy_buy_txs', 'copy_sell_txs',
+    'copy_pnl_realized', 'copy_pnl_live', 'copy_pnl_total', 'copy_roi',
+    'trader_total_bought', 'trader_total_sold', 'trader_held_live',
+    'trader_avg_buy', 'trader_avg_sell', 'trader_avg_held',
+    'trader_buy_txs', 'trader_sell_txs',
+    'trader_pnl_realized', 'trader_pnl_live', 'trader_pnl_total', 'trader_roi',
+]
+
+
+def _divide(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    # Como helpers.safe_divide(num, den, 0.0), elemento a elemento
+    out = np.zeros(np.broadcast(num, den).shape)
+    np.divide(num, den, out=out, where=den != 0)
+    return out
+
+
+def _group_cumsum(
+    values: np.ndarray,
+    starts: np.ndarray,
+    ) -> np.ndarray:
+    # cumsum que recomeça em cada posição de 'starts' (início de grupo/trecho)
+    total = np.cumsum(values)
+    return total - _segment_base(total, starts)
+
+
+def _segment_base(
+    total: np.ndarray,
+    starts: np.ndarray,
+    ) -> np.ndarray:
+    # Valor acumulado antes do início do trecho de cada elemento
+    before = np.zeros(len(starts))
+    before[1:] = total[starts[1:] - 1]
+    lengths = np.diff(np.append(starts, len(total)))
+    return np.repeat(before, lengths)
+
+
+class Fills:
+    """
+    Trades de uma carteira prontos para simular (ordenados por asset e timestamp):
+    price, size, usdc:   por fill
+    buy, sell:           máscaras do lado (outros lados não entram na conta)
+    group, starts:       asset de cada fill e início de cada asset nos arrays
+    meta:                uma linha por asset (timestamp, trade, bet, won)
+    assets:              token de cada asset (na ordem de group)
+    staked:              stake do trader por asset (coluna 'staked' do df), se houver
+    market:              mercado de cada asset (conditionId, ou o próprio asset)
+    resolves_at:         liquidação de cada asset: 'endDate' (se houver), nunca
+                         antes do último fill
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        timestamps = pd.to_datetime(df['timestamp'], unit='s', errors='coerce')
+
+        # Assets em ordem (como o groupby), fills em ordem de tempo dentro de cada um
+        codes, _ = pd.factorize(df['asset'], sort=True)
+        by_time = np.argsort(timestamps.to_numpy(), kind='stable')
+        order = by_time[np.argsort(codes[by_time], kind='stable')]
+        order = order[codes[order] >= 0]
+
+        frame = df.iloc[order]
+        side = frame['side'].astype(str).str.upper().to_numpy()
+        self.price = frame['price'].to_numpy(dtype=float)
+        self.size = frame['size'].to_numpy(dtype=float)
+        self.usdc = self.size * self.price
+        self.buy = side == 'BUY'
+        self.sell = side == 'SELL'
+        self.timestamp = timestamps.to_numpy()[order]
+
+        codes = codes[order]
+        self.starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]][:len(codes)])
+        self.group = np.repeat(
+            np.arange(len(self.starts)), np.diff(np.append(self.starts, len(codes)))
+        )
+
+        first = frame.iloc[self.starts]
+        self.assets = first['asset'].astype(str).to_numpy()
+        won = pd.to_numeric(first['won'], errors='coerce') if 'won' in first.columns \
+            else pd.Series(np.nan, index=first.index)
+        self.meta = pd.DataFrame({
+            'timestamp': self.timestamp[self.starts],
+            'trade': first['title'].to_numpy() if 'title' in first.columns else 'Unknown',
+            'bet': first['outcome'].to_numpy() if 'outcome' in first.columns else 'Unknown',
+            'won': (won.to_numpy() >= WON_PRICE).astype(int),
+        })
+        self.staked = (
+            pd.to_numeric(first['staked'], errors='coerce').to_numpy()
+            if 'staked' in first.columns else None
+        )
+        self.market = (
+            first['conditionId'].fillna(first['asset']) if 'conditionId' in first.columns
+            else first['asset']
+        ).to_numpy()
+
+        ends = np.append(self.starts[1:], len(codes)) - 1
+        last_fill = self.timestamp[ends] if len(codes) else self.timestamp[:0]
+        if 'endDate' in first.columns:
+            end_date = pd.to_datetime(first['endDate'], errors='coerce', utc=True)
+            end_date = end_date.dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+            self.resolves_at = np.where(
+                np.isnat(end_date) | (end_date < last_fill), last_fill, end_date
+            )
+        else:
+            self.resolves_at = last_fill
+
+        # Assets na ordem do primeiro trade (curva de capital)
+        self.time_order = np.argsort(self.meta['timestamp'].to_numpy(), kind='stable')
+
+    def __len__(self) -> int:
+        return len(self.price)
+
+    @property
+    def n_assets(self) -> int:
+        return len(self.starts)
+
+
+class TraderPass:
+    """
+    Lado do trader, independente dos parâmetros da cópia (calculado uma vez por Fills):
+    usdc:        custo da posição depois de cada fill
+    sell_ratio:  fração da posição vendida em cada venda (0 fora das vendas)
+    e os totais por asset (shares, held, realized, gross_*, *_txs).
+    """
+
+    def __init__(self, fills: Fills):
+        starts = fills.starts
+        buy, sell, size = fills.buy, fills.sell, fills.size
+
+        # Shares: soma cumulativa por asset
+        delta = np.where(buy, size, np.where(sell, -size, 0.0))
+        shares = _group_cumsum(delta, starts)
+        before = shares - delta
+
+        ratio = np.zeros(len(fills))
+        held = sell & (before > 0)
+        ratio[held] = np.minimum(size[held] / before[held], 1.0)
+        self.sell_ratio = ratio
+
+        # Custo: recorrência linear c_t = c_{t-1} * (1 - r_t) + compra_t
+        self.usdc = self._cost_basis(
+            keep=np.where(sell, 1.0 - ratio, 1.0),
+            added=np.where(buy, fills.usdc, 0.0),
+            starts=starts,
+        )
+        usdc_before = np.r_[0.0, self.usdc[:-1]] if len(fills) else self.usdc
+        usdc_before[starts] = 0.0
+
+        realized = np.where(sell, fills.usdc - usdc_before * ratio, 0.0)
+
+        ends = np.append(starts[1:], len(fills)) - 1
+        per_asset = lambda values: np.add.reduceat(values, starts) if len(starts) else np.zeros(0)
+        self.shares = shares[ends] if len(starts) else np.zeros(0)
+        self.held = self.usdc[ends] if len(starts) else np.zeros(0)
+        self.realized = per_asset(realized)
+        self.gross_bought = per_asset(np.where(buy, fills.usdc, 0.0))
+        self.shares_bought = per_asset(np.where(buy, size, 0.0))
+        self.gross_sold = per_asset(np.where(sell, fills.usdc, 0.0))
+        self.shares_sold = per_asset(np.where(sell, size, 0.0))
+        self.buy_txs = per_asset(buy.astype(np.int64))
+        self.sell_txs = per_asset(sell.astype(np.int64))
+
+    @staticmethod
+    def _cost_basis(
+        keep: np.ndarray,
+        added: np.ndarray,
+        starts: np.ndarray,
+        ) -> np.ndarray:
+        """
+        c_t = c_{t-1} * keep_t + added_t, recomeçando em cada asset.
+        Dentro de um trecho: c_t = P_t * cumsum(added_k / P_k), P = produto de keep.
+        Trechos novos em cada asset, em cada venda total (keep = 0: zera o custo)
+        e quando log(P) varia mais que LOG_REBASE (o custo do trecho anterior
+        entra multiplicado por P: são raros, resolvidos num laço curto).
+        """
+        n = len(keep)
+        if n == 0:
+            return np.zeros(0)
+
+        reset = np.zeros(n, dtype=bool)
+        reset[starts] = True
+        reset |= keep == 0
+
+        # log(P) por trecho (o fill que zera conta como início do trecho)
+        log_keep = np.where(reset, 0.0, np.log(np.where(keep > 0, keep, 1.0)))
+        resets = np.flatnonzero(reset)
+        log_p = _group_cumsum(log_keep, resets)
+
+        # Cortes de rebase: log(P) cruzou outro múltiplo de LOG_REBASE no mesmo trecho
+        bucket = np.floor(-log_p / LOG_REBASE)
+        rebase = np.r_[False, (bucket[1:] != bucket[:-1]) & ~reset[1:]]
+        cuts = np.flatnonzero(reset | rebase)
+
+        # log(P) relativo ao início de cada trecho final (|.| pequeno: exp sem overflow)
+        base = np.repeat(
+            np.where(reset[cuts], 0.0, log_p[cuts] - log_keep[cuts]),
+            np.diff(np.append(cuts, n)),
+        )
+        rel = log_p - base
+        growth = np.exp(rel)
+        cost = growth * _group_cumsum(added / growth, cuts)
+
+        # Trechos de rebase herdam o custo do anterior (multiplicado pelo P do trecho),
+        # em ordem: o anterior pode ser outro trecho de rebase
+        ends = np.append(cuts[1:], n)
+        for i in np.flatnonzero(rebase[cuts]):
+            start, end = cuts[i], ends[i]
+            cost[start:end] += cost[start - 1] * growth[start:end]
+        return cost
+
+
+def simulate(
+    fills: Fills,
+    trader: TraderPass,
+    copy_stake: float,
+    trigger: float,
+    strategy: str,
+    sell_strategy: str,
+    prices: np.ndarray | None = None,
+    ) -> pd.DataFrame:
+    """
+    Cópia de cada fill do trader com a stake/estratégia dadas (uma linha por asset,
+    colunas RESULT_COLUMNS, ordenadas pelo primeiro trade).
+    prices: preço da cópia em cada fill (ex.: com latência, ver data.latency);
+            padrão: o mesmo preço do trader
+    """
+    copy = copy_pass(fills, trader, copy_stake, trigger, strategy, sell_strategy, prices)
+    return _result(fills, trader, copy)
+
+
+def copy_pass(
+    fills: Fills,
+    trader: TraderPass,
+    copy_stake: float,
+    trigger: float,
+    strategy: str,
+    sell_strategy: str,
+    prices: np.ndarray | None = None,
+    ) -> dict:
+    """
+    Estado final da cópia por asset: {'bought', 'shares_bought', 'sold',
+    'shares_sold', 'shares', 'usdc', 'realized', 'buy_txs', 'sell_txs'}.
+    prices: preço da cópia em cada fill (padrão: fills.price)
+    """
+    events, buys, values = copy_signals(
+        fills, trader, copy_stake, trigger, strategy, sell_strategy
+    )
+
+    n_assets = fills.n_assets
+    out = {
+        key: np.zeros(n_assets) for key in (
+            'bought', 'shares_bought', 'sold', 'shares_sold',
+            'shares', 'usdc', 'realized', 'buy_txs', 'sell_txs',
+        )
+    }
+
+    # --- Laço dependente do caminho (floats do Python sobre listas) ---
+    stake = float(copy_stake)
+    current = -1
+    bought = shares_bought = sold = shares_sold = 0.0
+    shares = usdc = realized = 0.0
+    buy_txs = sell_txs = 0
+
+    def flush(group):
+        for key, value in (
+            ('bought', bought), ('shares_bought', shares_bought),
+            ('sold', sold), ('shares_sold', shares_sold),
+            ('shares', shares), ('usdc', usdc), ('realized', realized),
+            ('buy_txs', buy_txs), ('sell_txs', sell_txs),
+        ):
+            out[key][group] = value
+
+    for group, is_buy, value, price in zip(
+        fills.group[events].tolist(),
+        buys.tolist(),
+        values.tolist(),
+        (fills.price if prices is None else prices)[events].tolist(),
+        ):
+        if group != current:
+            if current >= 0:
+                flush(current)
+            current = group
+            bought = shares_bought = sold = shares_sold = 0.0
+            shares = usdc = realized = 0.0
+            buy_txs = sell_txs = 0
+
+        if is_buy:
+            amount = value - usdc
+            if amount <= 0.01:
+                continue
+            amount = min(amount, stake - usdc)
+            if amount <= 0.001:
+                continue
+
+            buy_txs += 1
+            usdc += amount
+            new_shares = amount / price
+            shares += new_shares
+            bought += amount
+            shares_bought += new_shares
+
+        else:
+            if shares <= 0:
+                continue
+
+            sell_txs += 1
+            sold_shares = shares * value
+            sold_value = sold_shares * price
+            cost_removed = usdc * value
+
+            sold += sold_value
+            shares_sold += sold_shares
+            shares -= sold_shares
+            usdc -= cost_removed
+            realized += sold_value - cost_removed
+
+    if current >= 0:
+        flush(current)
+
+    return out
+
+
+def copy_signals(
+    fills: Fills,
+    trader: TraderPass,
+    copy_stake: float,
+    trigger: float,
+    strategy: str,
+    sell_strategy: str,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fills que podem mexer na cópia, vetorizado: (índices em ordem de asset/tempo,
+    é compra?, valor). O valor é a exposição alvo ($) nas compras e a fração da
+    posição a vender nas vendas.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Estratégia inválida: {strategy}")
+    if sell_strategy not in SELL_STRATEGIES:
+        raise ValueError(f"Estratégia de venda inválida: {sell_strategy}")
+
+    # --- Alvos de exposição (compras) e frações de venda da cópia, vetorizados ---
+    exposure = trader.usdc
+    if strategy == 'Flat Staking':
+        target = np.full(len(fills), float(copy_stake))
+    elif strategy == 'Capped':
+        target = np.minimum(exposure, copy_stake)
+    else:
+        target = np.where(exposure >= copy_stake * 2, float(copy_stake), 0.0)
+
+    if sell_strategy == 'Proportional':
+        copy_ratio = trader.sell_ratio
+    elif sell_strategy == 'One Sell Dumps All':
+        copy_ratio = np.where(fills.size > 0, 1.0, 0.0)
+    else:
+        copy_ratio = np.zeros(len(fills))
+
+    # Só os fills que podem mexer na cópia entram no laço
+    buys = fills.buy & (exposure > trigger)
+    sells = fills.sell & (copy_ratio > 0)
+    events = np.flatnonzero(buys | sells)
+    return events, buys[events], np.where(buys, target, copy_ratio)[events]
+
+
+def copy_pnl(
+    fills: Fills,
+    copy: dict,
+    ) -> np.ndarray:
+    # PnL total da cópia por asset (realizado + valor na resolução - custo em aberto)
+    won = fills.meta['won'].to_numpy().astype(bool)
+    return copy['realized'] + np.where(won, copy['shares'], 0.0) - copy['usdc']
+
+
+def _result(
+    fills: Fills,
+    trader: TraderPass,
+    copy: dict,
+    ) -> pd.DataFrame:
+    # Fechamento por asset (valor final, PnL, médias, ROI) e a tabela de resultados
+    won = fills.meta['won'].to_numpy().astype(bool)
+
+    trader_live = np.where(won, trader.shares, 0.0) - trader.held
+    copy_live = np.where(won, copy['shares'], 0.0) - copy['usdc']
+    trader_total = trader.realized + trader_live
+    copy_total = copy_pnl(fills, copy)
+
+    result = fills.meta.copy()
+    result = result.assign(
+        copy_total_bought=copy['bought'],
+        copy_total_sold=copy['sold'],
+        copy_held_live=copy['usdc'],
+        copy_avg_buy=_divide(copy['bought'], copy['shares_bought']),
+        copy_avg_sell=_divide(copy['sold'], copy['shares_sold']),
+        copy_avg_held=_divide(copy['usdc'], copy['shares']),
+        copy_buy_txs=copy['buy_txs'].astype(np.int64),
+        copy_sell_txs=copy['sell_txs'].astype(np.int64),
+        copy_pnl_realized=copy['realized'],
+        copy_pnl_live=copy_live,
+        copy_pnl_total=copy_total,
+        copy_roi=_divide(copy_total * 100, copy['bought']),
+        trader_total_bought=trader.gross_bought,
+        trader_total_sold=trader.gross_sold,
+        trader_held_live=trader.held,
+        trader_avg_buy=_divide(trader.gross_bought, trader.shares_bought),
+        trader_avg_sell=_divide(trader.gross_sold, trader.shares_sold),
+        trader_avg_held=_divide(trader.held, trader.shares),
+        trader_buy_txs=trader.buy_txs,
+        trader_sell_txs=trader.sell_txs,
+        trader_pnl_realized=trader.realized,
+        trader_pnl_live=trader_live,
+        trader_pnl_total=trader_total,
+        trader_roi=_divide(trader_total * 100, trader.gross_bought),
+    )[RESULT_COLUMNS]
+
+    return result.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+def run_simulation(
+    df: pd.DataFrame,
+    copy_stake: float,
+    trigger: float,
+    strategy: str,
+    sell_strategy: str,
+    ) -> pd.DataFrame:
+    """
+    Atalho para uma combinação: Fills + TraderPass + simulate().
+    df: trades (fetch_clv) com asset, side, price, size, timestamp e won
+    """
+    fills = Fills(df)
+    if fills.n_assets == 0:
+        return pd.DataFrame()
+    return simulate(fills, TraderPass(fills), copy_stake, trigger, strategy, sell_strategy)
+
+
+def summarize(
+    fills: Fills,
+    copy: dict,
+    min_stake: float | None = None,
+    ) -> dict:
+    """
+    Totais de uma simulação: pnl, roi (%), max_drawdown ($, curva na ordem do
+    primeiro trade), volume e markets (assets com alguma compra copiada).
+    min_stake: só assets em que o trader apostou mais que isso (como o filtro de
+               stake do simulador), quando Fills tem 'staked'
+    """
+    keep = np.ones(fills.n_assets, dtype=bool)
+    if min_stake is not None and fills.staked is not None:
+        keep = fills.staked > min_stake
+
+    order = fills.time_order[keep[fills.time_order]]
+    equity = np.cumsum(copy_pnl(fills, copy)[order])
+    drawdown, _ = drawdown_series(equity)
+
+    pnl = float(equity[-1]) if len(equity) else 0.0
+    volume = float(copy['bought'][keep].sum())
+    return {
+        'pnl': pnl,
+        'roi': pnl / volume * 100 if volume > 0 else 0.0,
+        'max_drawdown': float(drawdown.max()) if len(drawdown) else 0.0,
+        'volume': volume,
+        'markets': int((copy['buy_txs'][keep] > 0).sum()),
+    }
+
+
+def _sweep_row(
+    fills: Fills,
+    trader: TraderPass,
+    params: tuple,
+    ) -> dict:
+    stake, trigger, strategy, sell_strategy = params
+    copy = copy_pass(fills, trader, stake, trigger, strategy, sell_strategy)
+    return {
+        'stake': stake,
+        'trigger': trigger,
+        'strategy': strategy,
+        'sell_strategy': sell_strategy,
+        **summarize(fills, copy, min_stake=stake),
+    }
+
+
+# Fills/TraderPass de cada processo do sweep (recebidos uma vez, no initializer)
+_sweep_data = None
+
+
+def _init_sweep(fills: Fills, trader: TraderPass) -> None:
+    global _sweep_data
+    _sweep_data = (fills, trader)
+
+
+def _sweep_worker(params: tuple) -> dict:
+    return _sweep_row(*_sweep_data, params)
+
+
+def sweep(
+    fills: Fills,
+    trader: TraderPass,
+    stakes: list,
+    triggers: list,
+    strategies: list = STRATEGIES,
+    sell_strategies: list = SELL_STRATEGIES,
+    workers: int | None = None,
+    ) -> pd.DataFrame:
+    """
+    Todas as combinações (stake, trigger, strategy, sell_strategy) sobre os
+    mesmos fills e a mesma passada do trader, divididas entre processos.
+    Uma linha por combinação (SWEEP_COLUMNS); cada stake só conta os assets
+    em que o trader apostou mais que ela (ver summarize).
+    """
+    grid = list(itertools.product(stakes, triggers, strategies, sell_strategies))
+    for _, _, strategy, sell_strategy in grid:
+        if strategy not in STRATEGIES or sell_strategy not in SELL_STRATEGIES:
+            raise ValueError(f"Estratégia inválida: {strategy} / {sell_strategy}")
+
+    workers = min(workers or os.cpu_count() or 1, len(grid))
+    if workers <= 1 or len(grid) < SWEEP_MIN_PARALLEL:
+        rows = [_sweep_row(fills, trader, params) for params in grid]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(SWEEP_START_METHOD),
+            initializer=_init_sweep,
+            initargs=(fills, trader),
+            ) as pool:
+            rows = list(pool.map(
+                _sweep_worker, grid, chunksize=max(1, len(grid) // (workers * 4))
+            ))
+    return pd.DataFrame(rows, columns=SWEEP_COLUMNS)
@@ -0,0 +1,228 @@
+"""
+Dataset de posições de uma carteira.
+As colunas derivadas (staked, roi, total_profit, stake_bucket) e o 'endDate' convertido
+são calculados uma única vez na carga; análises e dashboard leem daqui.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from data.tags import TagIndex
+from data.filters import FilterIndex
+
+DERIVED_COLUMNS = ['staked', 'roi', 'total_profit', 'stake_bucket']
+
+# Faixas de stake em escala log (série 1-2-5): [0, 1), [1, 2), [2, 5), ... [1M, inf)
+# Fixas para que os códigos sejam comparáveis entre filtros e carteiras
+STAKE_EDGES = np.concatenate([
+    [0.0],
+    (np.array([1, 2, 5]) * 10.0 ** np.arange(6)[:, None]).ravel(),
+    [1e6, np.inf],
+])
+
+# Resultados derivados (filtros, tabelas, exports) guardados por dataset
+MEMO_ENTRIES = 32
+
+_versions = itertools.count(1)
+
+
+def parse_dates(dates: pd.Series) -> pd.Series:
+    """
+    Converte 'endDate' (ISO8601) para datetime em UTC sem timezone.
+    Colunas que já são datetime não são convertidas de novo.
+    """
+    if isinstance(dates.dtype, pd.DatetimeTZDtype):
+        return dates.dt.tz_convert('UTC').dt.tz_localize(None)
+    
+    if pd.api.types.is_datetime64_dtype(dates):
+        return dates
+    
+    return pd.to_datetime(
+        dates, format='ISO8601', utc=True, errors='coerce'
+        ).dt.tz_localize(None)
+
+
+# --------------------------------------------------------------------------
+# DEFINIÇÕES ÚNICAS DAS COLUNAS DERIVADAS
+# Usam a coluna pronta quando o df vem de um WalletDataset.
+# --------------------------------------------------------------------------
+
+def staked(df: pd.DataFrame) -> pd.Series:
+    """
+    Valor apostado na posição: totalBought * avgPrice
+    """
+    if 'staked' in df.columns:
+        return df['staked']
+    return df['totalBought'] * df['avgPrice']
+
+
+def position_roi(df: pd.DataFrame) -> pd.Series:
+    """
+    ROI da posição: realizedPnl / staked (somado vira Flat Profit em units)
+    """
+    if 'roi' in df.columns:
+        return df['roi']
+    return df['realizedPnl'] / staked(df)
+
+
+def total_profit(df: pd.DataFrame) -> pd.Series:
+    """
+    Lucro total da posição: realizedPnl + cashPnl (quando existir)
+    """
+    if 'total_profit' in df.columns:
+        return df['total_profit']
+
+    profit = df['realizedPnl'].fillna(0)
+    if 'cashPnl' in df.columns:
+        profit = profit + df['cashPnl'].fillna(0)
+    return profit
+
+
+def stake_bucket(df: pd.DataFrame) -> pd.Series:
+    """
+    Código da faixa de stake (índice em STAKE_EDGES); -1 quando não há stake.
+    """
+    if 'stake_bucket' in df.columns:
+        return df['stake_bucket']
+    return pd.Series(stake_bucket_codes(staked(df).to_numpy()), index=df.index)
+
+
+def stake_bucket_codes(stakes: np.ndarray) -> np.ndarray:
+    codes = np.searchsorted(STAKE_EDGES, stakes, side='right') - 1
+    codes[~(stakes >= 0)] = -1   # NaN e stakes negativos
+    return codes.astype(np.int8)
+
+
+def result_nbytes(result) -> int:
+    """
+    Bytes de um resultado derivado. Recortes do frame dividem as strings com ele:
+    só os arrays contam (memory_usage sem deep).
+    """
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage().sum())
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    return int(getattr(result, 'nbytes', 0))
+
+
+def add_derived_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Retorna uma cópia do df com as colunas derivadas e o 'endDate' convertido.
+    """
+    df = df.reset_index(drop=True)
+
+    if 'totalBought' not in df.columns:
+        return df
+
+    df['staked'] = df['totalBought'] * df['avgPrice']
+    df['roi'] = df['realizedPnl'] / df['staked']
+    df['stake_bucket'] = stake_bucket_codes(df['staked'].to_numpy())
+
+    df['total_profit'] = df['realizedPnl'].fillna(0)
+    if 'cashPnl' in df.columns:
+        df['total_profit'] += df['cashPnl'].fillna(0)
+
+    if 'endDate' in df.columns:
+        df['endDate'] = parse_dates(df['endDate'])
+
+    return df
+
+
+class WalletDataset:
+    """
+    Posições de uma carteira prontas para análise:
+    frame:   DataFrame com as colunas derivadas (não deve ser alterado)
+    tags:    TagIndex do frame
+    filters: FilterIndex do frame (montado no primeiro filtro)
+    version: identificador único desta carga (chave para caches)
+    memo():  resultados derivados guardados no próprio dataset (contam em nbytes)
+    """
+
+    def __init__(
+        self,
+        frame: pd.DataFrame,
+        tags: TagIndex | None = None,
+        ):
+        self.frame = frame
+        self.tags = tags if tags is not None else TagIndex.from_frame(frame)
+        self.version = next(_versions)
+        self._frame_nbytes = None
+        self._filters = None
+        self._filters_lock = threading.Lock()
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'WalletDataset':
+        return cls(add_derived_columns(df))
+
+    @classmethod
+    def concat(cls, datasets: list) -> 'WalletDataset':
+        """
+        Junta datasets sem recalcular colunas derivadas nem reler as tags.
+        """
+        frame = pd.concat([d.frame for d in datasets], ignore_index=True)
+
+        labels = pd.Index([])
+        for d in datasets:
+            labels = labels.append(d.tags.labels.difference(labels, sort=False))
+
+        rows, codes, offset = [], [], 0
+        for d in datasets:
+            rows.append(d.tags.rows + offset)
+            codes.append(labels.get_indexer(d.tags.labels)[d.tags.codes])
+            offset += len(d.frame)
+
+        tags = TagIndex(
+            labels,
+            np.concatenate(rows) if rows else np.array([], dtype=np.int64),
+            np.concatenate(codes).astype(np.int32) if codes else np.array([], dtype=np.int32),
+            frame.index,
+        )
+        return cls(frame, tags)
+
+    @property
+    def empty(self) -> bool:
+        return self.frame.empty
+
+    @property
+    def filters(self) -> FilterIndex:
+        if self._filters is None:
+            with self._filters_lock:
+                if self._filters is None:
+                    self._filters = FilterIndex(self.frame, self.tags)
+        return self._filters
+
+    @property
+    def nbytes(self) -> int:
+        # Tamanho real em memória (strings incluídas), usado pelo cache de carteiras.
+        # O frame não muda: só é medido uma vez (o cache re-mede a cada acesso)
+        if self._frame_nbytes is None:
+            self._frame_nbytes = int(self.frame.memory_usage(deep=True).sum())
+        nbytes = self._frame_nbytes + self.tags.nbytes
+        if self._filters is not None:
+            nbytes += self._filters.nbytes
+        with self._memo_lock:
+            results = list(self._memo.values())
+        return nbytes + sum(result_nbytes(result) for result in results)
+
+    def memo(self, key: tuple, build):
+        """
+        Resultado de build() memoizado por key (LRU de MEMO_ENTRIES).
+        Fica no dataset: entra no orçamento do cache de carteiras e sai junto com ela.
+        """
+        with self._memo_lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                return self._memo[key]
+
+        result = build()
+        with self._memo_lock:
+            self._memo[key] = result
+            while len(self._memo) > MEMO_ENTRIES:
+                self._memo.popitem(last=False)
+        return result
+
+    def __len__(self) -> int:
+        return len(self.frame)
@@ -0,0 +1,154 @@
+"""
+Índices de filtro de um WalletDataset: tag / período / stake mínima
+resolvidos como interseção de conjuntos de linhas, sem varrer as colunas.
+- endDate: ordem ordenada -> um período são duas buscas binárias
+- staked:  ordem ordenada -> stake mínima é uma busca binária
+- tags:    um bitmap (bits empacotados) por tag, montado na primeira consulta
+"""
+import threading
+import numpy as np
+import pandas as pd
+from data.tags import TagIndex
+
+_NAT = np.iinfo(np.int64).min
+
+
+def _as_ns(value) -> int:
+    return pd.Timestamp(value).as_unit('ns').value
+
+
+def _ranks(order: np.ndarray) -> np.ndarray:
+    # Posição de cada linha na ordem ordenada
+    ranks = np.empty(len(order), dtype=np.int32)
+    ranks[order] = np.arange(len(order), dtype=np.int32)
+    return ranks
+
+
+class FilterIndex:
+    """
+    Construído uma vez por dataset (ver WalletDataset.filters).
+    select(...) retorna as posições (na ordem do frame) que passam em todos os filtros.
+    """
+
+    def __init__(
+        self,
+        frame: pd.DataFrame,
+        tags: TagIndex,
+        ):
+        self.size = len(frame)
+
+        # endDate ordenado (NaT fica no início e nunca entra num período)
+        if 'endDate' in frame.columns:
+            dates = frame['endDate'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            dates = np.full(self.size, _NAT, dtype=np.int64)
+        self.date_order = np.argsort(dates, kind='stable')
+        self.sorted_dates = dates[self.date_order]
+        self._date_rank = _ranks(self.date_order)
+
+        # staked ordenado, só linhas com stake (NaN nunca passa em 'staked > x')
+        stakes = (
+            frame['staked'].to_numpy(dtype=float) if 'staked' in frame.columns
+            else np.full(self.size, np.nan)
+        )
+        valid = np.flatnonzero(~np.isnan(stakes))
+        order = np.argsort(stakes[valid], kind='stable')
+        self.stake_order = valid[order]
+        self.sorted_stakes = stakes[self.stake_order]
+        # Linhas sem stake ficam com rank -1 (antes de qualquer faixa)
+        self._stake_rank = np.full(self.size, -1, dtype=np.int32)
+        self._stake_rank[self.stake_order] = np.arange(len(self.stake_order), dtype=np.int32)
+
+        # Linhas de cada tag agrupadas por tag_id (posting lists) para montar os bitmaps
+        self._tags = tags
+        by_code = np.argsort(tags.codes, kind='stable')
+        self._tag_rows = tags.rows[by_code]
+        self._tag_bounds = np.searchsorted(
+            tags.codes[by_code], np.arange(len(tags.labels) + 1)
+        )
+        self._bitmaps = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return int(
+            self.date_order.nbytes + self.sorted_dates.nbytes
+            + self.stake_order.nbytes + self.sorted_stakes.nbytes
+            + self._date_rank.nbytes + self._stake_rank.nbytes
+            + self._tag_rows.nbytes + self._tag_bounds.nbytes
+            + sum(bitmap.nbytes for bitmap in self._bitmaps.values())
+        )
+
+    # ------------------------------------------------------------------
+    # Conjuntos de linhas (bits empacotados: 1 bit por linha do frame)
+    # ------------------------------------------------------------------
+
+    def _bits(self, rows: np.ndarray) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask)
+
+    def tag_bitmap(self, tag_id: int) -> np.ndarray:
+        bitmap = self._bitmaps.get(tag_id)
+        if bitmap is None:
+            start, end = self._tag_bounds[tag_id], self._tag_bounds[tag_id + 1]
+            bitmap = self._bits(self._tag_rows[start:end])
+            with self._lock:
+                self._bitmaps[tag_id] = bitmap
+        return bitmap
+
+    def date_range(self, start_date, end_date) -> tuple[int, int]:
+        """
+        Faixa [lo, hi) de date_order com start_date <= endDate <= end_date.
+        """
+        lo = np.searchsorted(self.sorted_dates, _as_ns(start_date), side='left')
+        hi = np.searchsorted(self.sorted_dates, _as_ns(end_date), side='right')
+        return int(lo), int(hi)
+
+    def stake_start(self, stake: float) -> int:
+        """
+        Início da faixa de stake_order com staked > stake.
+        """
+        return int(np.searchsorted(self.sorted_stakes, stake, side='right'))
+
+    def _rank_bits(
+        self,
+        ranks: np.ndarray,
+        lo: int,
+        hi: int,
+        ) -> np.ndarray:
+        # Faixa contígua na ordem ordenada -> bitmap (comparação sequencial, sem scatter)
+        return np.packbits((ranks >= lo) & (ranks < hi))
+
+    def select(
+        self,
+        tags: list = [],
+        stake: float | None = None,
+        start_date=None,
+        end_date=None,
+        ) -> np.ndarray:
+        """
+        Posições das linhas com QUALQUER uma das tags, stake > 'stake' e
+        start_date <= endDate <= end_date (filtros None não se aplicam).
+        """
+        bits = None
+
+        if tags:
+            bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+            for tag_id in self._tags.ids(tags):
+                bits |= self.tag_bitmap(int(tag_id))
+
+        # Mesmo critério de data_helpers.filter_positions: só com as duas datas
+        if start_date is not None and end_date is not None:
+            dates = self._rank_bits(self._date_rank, *self.date_range(start_date, end_date))
+            bits = dates if bits is None else bits & dates
+
+        if stake is not None:
+            stakes = self._rank_bits(
+                self._stake_rank, self.stake_start(stake), len(self.stake_order)
+            )
+            bits = stakes if bits is None else bits & stakes
+
+        if bits is None:
+            return np.arange(self.size)
+        return np.flatnonzero(np.unpackbits(bits, count=self.size).view(bool))
@@ -1,6 +1,7 @@
 import time
 import requests
 import pandas as pd
+from data.tags import TagIndex, SPORTS_TAGS
     
 def assertion_active(
     active_df: pd.DataFrame,
@@ -23,12 +24,16 @@ def assertion_active(
     # Combina os dois DataFrames
     return pd.concat([active_df, closed_df], ignore_index=True)
     
-def process_sports_trades(full_df: pd.DataFrame):
+def process_sports_trades(
+    full_df: pd.DataFrame,
+    tag_index: TagIndex | None = None,
+    ):
     """
     Filtra todas as linhas que tenham a tag 'Games' OU 'Sports'
     
     Args:
         full_df: DataFrame completo com coluna 'tags'
+        tag_index: (Opcional) tags já normalizadas do full_df
     
     Returns:
         DataFrame filtrado contendo apenas mercados com tag 'Games' ou 'Sports'
@@ -41,10 +46,8 @@ def process_sports_trades(full_df: pd.DataFrame):
         return pd.DataFrame()
     
     # Filtrar linhas que tenham a tag 'Games' OU 'Sports'
-    sports_games_mask = full_df['tags'].apply(
-        lambda tags: ('Games' in tags or 'Sports' in tags) if isinstance(tags, list) else False
-    )
-    sports_games_df = full_df[sports_games_mask].copy()
+    tag_index = TagIndex.for_frame(full_df, tag_index)
+    sports_games_df = full_df[tag_index.mask(full_df, SPORTS_TAGS)]
     
     print(f"Filtrados {len(sports_games_df)} mercados com tag 'Games' ou 'Sports' de {len(full_df)} total")
     
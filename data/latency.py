@@ -0,0 +1,180 @@
+"""
+Latência da cópia: cada fill copiado sai pelo preço do token no CLOB em
+timestamp + latência, não pelo preço do trader.
+- PriceStore:     históricos locais de vários tokens num array ordenado por
+                  (token, t): muitas consultas "primeiro preço a partir de t" num searchsorted
+- load_store():   busca de uma vez o histórico que cobre os fills em todas as latências
+- copy_prices():  preço da cópia em cada fill para uma latência
+- latency_table(): a mesma simulação em várias latências (quanto do edge sobrevive)
+O histórico do CLOB tem resolução de minutos (PRICE_FIDELITY): a cópia usa o
+primeiro ponto em ou depois de timestamp + latência, nunca um anterior ao fill.
+Latências menores que um ponto caem no mesmo ponto ou no seguinte.
+"""
+import numpy as np
+import pandas as pd
+from api.jobs import CancelToken
+from data import copytrade
+
+# Latências comparadas (segundos)
+LATENCIES = [0, 5, 30, 120]
+# Resolução do histórico (minutos)
+PRICE_FIDELITY = 1
+# Ponto de preço mais distante aceito depois do instante pedido (segundos): um ponto
+# do histórico; sem ponto na janela, o fill fica com o preço do trader (fora da cobertura)
+MAX_PRICE_DELAY = PRICE_FIDELITY * 60
+
+LATENCY_COLUMNS = [
+    'latency', 'pnl', 'roi', 'edge_retained', 'avg_buy', 'slippage', 'coverage',
+]
+
+# Chave de busca: código do token nos bits altos, timestamp (segundos) nos 40 de baixo
+_TIME_BITS = 40
+
+
+class PriceStore:
+    """
+    series: {token: (timestamps unix, preços)}, cada um em ordem de tempo
+    (como devolve api.price_history.fetch_price_histories).
+    """
+
+    def __init__(self, series: dict):
+        self.tokens = pd.Index(list(series))
+        lengths = [len(times) for times, _ in series.values()]
+        self.times = (
+            np.concatenate([times for times, _ in series.values()]).astype(np.int64)
+            if series else np.zeros(0, dtype=np.int64)
+        )
+        self.prices = (
+            np.concatenate([prices for _, prices in series.values()]).astype(float)
+            if series else np.zeros(0)
+        )
+        codes = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        self._keys = (codes << _TIME_BITS) | self.times
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def asof(
+        self,
+        tokens: np.ndarray,
+        timestamps: np.ndarray,
+        max_delay: int = MAX_PRICE_DELAY,
+        ) -> np.ndarray:
+        """
+        Primeiro preço em ou depois de cada (token, timestamp unix), vetorizado.
+        NaN se o token não tem histórico ou o ponto vem mais de max_delay depois.
+        """
+        codes = self.tokens.get_indexer(tokens).astype(np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(len(codes), np.nan)
+        known = codes >= 0
+
+        keys = (np.where(known, codes, 0) << _TIME_BITS) | np.maximum(timestamps, 0)
+        idx = np.searchsorted(self._keys, keys, side='left')
+        found = known & (idx < len(self))
+        idx = np.minimum(idx, len(self) - 1)
+
+        found &= (self._keys[idx] >> _TIME_BITS) == codes
+        found &= self.times[idx] - timestamps <= max_delay
+        return np.where(found, self.prices[idx], np.nan)
+
+
+def _fill_seconds(fills: copytrade.Fills) -> np.ndarray:
+    # Timestamp unix (segundos) de cada fill
+    return fills.timestamp.astype('datetime64[s]').astype(np.int64)
+
+
+def load_store(
+    fills: copytrade.Fills,
+    latencies: list = LATENCIES,
+    cancel: CancelToken | None = None,
+    ) -> PriceStore:
+    """
+    Busca (uma requisição por token e dia, com cache) o histórico que cobre
+    todos os fills em todas as latências (até MAX_PRICE_DELAY depois de cada uma).
+    """
+    # Import lazy, como em DataAnalyst.calculate_clv
+    from api.price_history import fetch_price_histories
+
+    seconds = _fill_seconds(fills)
+    valid = ~np.isnat(fills.timestamp)
+    tokens = fills.assets[fills.group][valid]
+    delays = [latency for latency in latencies if latency > 0]
+    if not delays or not valid.any():
+        return PriceStore({})
+
+    # O ponto usado pode cair no dia seguinte ao do instante pedido
+    targets = np.concatenate([seconds[valid] + latency for latency in delays])
+    series = fetch_price_histories(
+        np.tile(tokens, 2 * len(delays)),
+        np.concatenate([targets, targets + MAX_PRICE_DELAY]),
+        fidelity=PRICE_FIDELITY,
+        cancel=cancel,
+    )
+    return PriceStore(series)
+
+
+def copy_prices(
+    fills: copytrade.Fills,
+    store: PriceStore,
+    latency: int,
+    max_delay: int = MAX_PRICE_DELAY,
+    ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (preço da cópia por fill, máscara dos fills precificados pelo histórico).
+    Latência 0, ou sem ponto de preço válido: o preço do trader.
+    """
+    if latency <= 0:
+        return fills.price, np.zeros(len(fills), dtype=bool)
+
+    prices = store.asof(
+        fills.assets[fills.group], _fill_seconds(fills) + latency, max_delay
+    )
+    priced = ~np.isnat(fills.timestamp) & (prices > 0)
+    return np.where(priced, prices, fills.price), priced
+
+
+def latency_table(
+    fills: copytrade.Fills,
+    trader: copytrade.TraderPass,
+    store: PriceStore,
+    copy_stake: float,
+    trigger: float,
+    strategy: str,
+    sell_strategy: str,
+    latencies: list = LATENCIES,
+    ) -> pd.DataFrame:
+    """
+    Uma linha por latência (LATENCY_COLUMNS), sempre com a latência 0 como base:
+    edge_retained = PnL / PnL sem latência (%), slippage = preço médio de compra
+    contra o sem latência (%), coverage = fills copiados com preço do histórico (%).
+    """
+    events, _, _ = copytrade.copy_signals(
+        fills, trader, copy_stake, trigger, strategy, sell_strategy
+    )
+
+    rows = []
+    for latency in sorted(set([0, *latencies])):
+        prices, priced = copy_prices(fills, store, latency)
+        copy = copytrade.copy_pass(
+            fills, trader, copy_stake, trigger, strategy, sell_strategy, prices
+        )
+        pnl = float(copytrade.copy_pnl(fills, copy).sum())
+        volume = float(copy['bought'].sum())
+        shares = float(copy['shares_bought'].sum())
+        rows.append({
+            'latency': latency,
+            'pnl': pnl,
+            'roi': pnl / volume * 100 if volume > 0 else 0.0,
+            'avg_buy': volume / shares if shares > 0 else np.nan,
+            'coverage': (
+                priced[events].mean() * 100 if latency > 0 and len(events) else np.nan
+            ),
+        })
+
+    table = pd.DataFrame(rows)
+    base = table.iloc[0]
+    table['edge_retained'] = table['pnl'] / base['pnl'] * 100 if base['pnl'] > 0 else np.nan
+    table['slippage'] = (table['avg_buy'] / base['avg_buy'] - 1) * 100
+    return table[LATENCY_COLUMNS]
@@ -0,0 +1,227 @@
+"""
+Leaderboard persistente de carteiras (sqlite).
+Uma linha por carteira (wallets) e uma por carteira x tag (wallet_tags).
+Re-sincronizar uma carteira só reescreve as linhas dela; os índices por
+métrica (e por tag + métrica) deixam as consultas de top-k rápidas.
+"""
+import os
+import sqlite3
+import pandas as pd
+from contextlib import closing
+from datetime import datetime, timezone
+from data.tags import TagIndex
+from data.aggregation import tag_breakdown
+from data.summary import clv_summary, _number
+
+LEADERBOARD_PATH = os.environ.get('LEADERBOARD_PATH', 'leaderboard.sqlite')
+
+WALLET_COLUMNS = [
+    'wallet', 'bets', 'profit', 'volume',
+    'roi', 'roi_low', 'roi_high', 'flat_units', 'units_low', 'units_high',
+    'clv', 'clv_positive', 'clv_bets',
+    'sharpe', 'max_drawdown', 'win_rate',
+    'first_date', 'last_date', 'synced_at',
+]
+TAG_COLUMNS = [
+    'wallet', 'tag', 'bets', 'profit', 'volume', 'roi', 'flat_units',
+    'clv', 'clv_positive', 'clv_bets',
+]
+
+# Métricas de ranking (todas indexadas) e como aparecem no dashboard
+RANK_METRICS = {
+    'roi_low': 'Score (ROI 95% CI low)',
+    'roi': 'ROI',
+    'flat_units': 'Flat Units',
+    'profit': 'Profit',
+    'clv': 'Avg CLV',
+    'clv_positive': 'CLV+',
+    'sharpe': 'Sharpe',
+    'bets': 'Bets',
+}
+# Por tag não há bootstrap nem risco
+TAG_METRICS = ['roi', 'flat_units', 'profit', 'clv', 'clv_positive', 'bets']
+
+_TEXT_COLUMNS = ('wallet', 'tag', 'first_date', 'last_date', 'synced_at')
+
+# CLV depende de uma busca à parte (calculate_clv): um sync sem CLV mantém o anterior
+_CLV_COLUMNS = ('clv', 'clv_positive', 'clv_bets')
+
+
+def _upsert_sql(table: str, columns: list, keys: tuple) -> str:
+    updates = ', '.join(
+        f'{c}=COALESCE(excluded.{c}, {table}.{c})' if c in _CLV_COLUMNS else f'{c}=excluded.{c}'
+        for c in columns if c not in keys
+    )
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT({', '.join(keys)}) DO UPDATE SET {updates}"
+    )
+
+_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS wallets (
+        wallet TEXT PRIMARY KEY,
+        {', '.join(f'{c} {"TEXT" if c in _TEXT_COLUMNS else "REAL"}' for c in WALLET_COLUMNS[1:])}
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS wallet_tags (
+        wallet TEXT NOT NULL,
+        tag TEXT NOT NULL,
+        {', '.join(f'{c} REAL' for c in TAG_COLUMNS[2:])},
+        PRIMARY KEY (wallet, tag)
+    )""",
+    *(f"CREATE INDEX IF NOT EXISTS wallets_{m} ON wallets ({m} DESC)" for m in RANK_METRICS),
+    *(f"CREATE INDEX IF NOT EXISTS wallet_tags_{m} ON wallet_tags (tag, {m} DESC)" for m in TAG_METRICS),
+]
+
+
+class Leaderboard:
+    """
+    Acesso ao arquivo do leaderboard. Cada operação abre a própria conexão,
+    então a mesma instância serve a várias threads (sessões do streamlit).
+    """
+
+    def __init__(self, path: str = LEADERBOARD_PATH):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            for statement in _SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL: leituras do dashboard não bloqueiam a escrita do lote
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _execute(self, query: str, params: tuple = ()) -> list:
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(query, params).fetchall()
+
+    def upsert(
+        self,
+        summary: dict,
+        tags: pd.DataFrame | None = None,
+        ) -> None:
+        """
+        Grava o resumo de uma carteira (SUMMARY_COLUMNS) e, se passado,
+        substitui o breakdown por tag dela (tag_breakdown). Uma transação.
+        """
+        row = {c: summary.get(c) for c in WALLET_COLUMNS}
+        row['synced_at'] = summary.get('synced_at') or datetime.now(timezone.utc).isoformat()
+        row = {c: v if c in _TEXT_COLUMNS else _number(v) for c, v in row.items()}
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                _upsert_sql('wallets', WALLET_COLUMNS, ('wallet',)),
+                tuple(row.values()),
+            )
+            if tags is not None:
+                self._replace_tags(conn, row['wallet'], tags)
+
+    def update_clv(
+        self,
+        wallet: str,
+        df: pd.DataFrame,
+        tag_index: TagIndex | None = None,
+        clv_column: str = 'price_clv',
+        ) -> None:
+        """
+        Atualiza só as colunas de CLV de uma carteira (depois de calculate_clv).
+        """
+        clv = clv_summary(df, clv_column)
+        if not clv:
+            return
+
+        tags = tag_breakdown(df, tag_index, clv_column)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE wallets SET clv=?, clv_positive=?, clv_bets=? WHERE wallet=?",
+                (*(_number(clv[c]) for c in ('clv', 'clv_positive', 'clv_bets')), wallet),
+            )
+            conn.executemany(
+                "UPDATE wallet_tags SET clv=?, clv_positive=?, clv_bets=? WHERE wallet=? AND tag=?",
+                [
+                    (_number(r.clv), _number(r.clv_positive), _number(r.clv_bets), wallet, r.tag)
+                    for r in tags.itertuples(index=False)
+                ],
+            )
+
+    @staticmethod
+    def _replace_tags(
+        conn: sqlite3.Connection,
+        wallet: str,
+        tags: pd.DataFrame,
+        ) -> None:
+        rows = [
+            (wallet, row[0], *(_number(v) for v in row[1:]))
+            for row in tags[TAG_COLUMNS[1:]].itertuples(index=False)
+        ]
+        conn.executemany(_upsert_sql('wallet_tags', TAG_COLUMNS, ('wallet', 'tag')), rows)
+
+        # Tags que a carteira não tem mais
+        current = [row[1] for row in rows]
+        conn.execute(
+            f"DELETE FROM wallet_tags WHERE wallet=? "
+            f"AND tag NOT IN ({', '.join('?' * len(current))})",
+            (wallet, *current),
+        )
+
+    def top(
+        self,
+        metric: str = 'roi_low',
+        k: int = 50,
+        tag: str | None = None,
+        min_bets: int = 0,
+        ) -> pd.DataFrame:
+        """
+        As k melhores carteiras pela métrica (geral ou dentro de uma tag).
+        Carteiras sem a métrica (ex.: CLV não calculado) ficam de fora.
+        """
+        if tag is None:
+            if metric not in RANK_METRICS:
+                raise ValueError(f"Métrica inválida: {metric}")
+            query = (
+                # '+bets': o filtro não disputa com o índice da métrica (ORDER BY ... LIMIT)
+                f"SELECT * FROM wallets WHERE {metric} IS NOT NULL AND +bets >= ? "
+                f"ORDER BY {metric} DESC LIMIT ?"
+            )
+            params = (min_bets, k)
+            columns = WALLET_COLUMNS
+        else:
+            if metric not in TAG_METRICS:
+                raise ValueError(f"Métrica inválida por tag: {metric}")
+            query = (
+                f"SELECT t.*, w.synced_at FROM wallet_tags t JOIN wallets w USING (wallet) "
+                f"WHERE t.tag = ? AND t.{metric} IS NOT NULL AND +t.bets >= ? "
+                f"ORDER BY t.{metric} DESC LIMIT ?"
+            )
+            params = (tag, min_bets, k)
+            columns = TAG_COLUMNS + ['synced_at']
+
+        df = self._frame(self._execute(query, params), columns)
+        df.insert(0, 'rank', range(1, len(df) + 1))
+        return df
+
+    @staticmethod
+    def _frame(rows: list, columns: list) -> pd.DataFrame:
+        # NULL -> NaN nas colunas numéricas
+        df = pd.DataFrame(rows, columns=columns)
+        numeric = [c for c in columns if c not in _TEXT_COLUMNS]
+        df[numeric] = df[numeric].astype(float)
+        return df
+
+    def wallet_tags(self, wallet: str) -> pd.DataFrame:
+        rows = self._execute(
+            "SELECT * FROM wallet_tags WHERE wallet=? ORDER BY bets DESC", (wallet,)
+        )
+        return self._frame(rows, TAG_COLUMNS)
+
+    def tags(self, min_wallets: int = 1) -> list[str]:
+        rows = self._execute(
+            "SELECT tag FROM wallet_tags GROUP BY tag HAVING COUNT(*) >= ? "
+            "ORDER BY COUNT(*) DESC",
+            (min_wallets,),
+        )
+        return [tag for (tag,) in rows]
+
+    def __len__(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM wallets")[0][0]
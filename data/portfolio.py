@@ -0,0 +1,378 @@
+"""
+Copy-trade de várias carteiras com uma banca só.
+- Cada carteira gera seus sinais de cópia como no simulador (copytrade.copy_signals)
+- merge(): os fluxos de cada carteira, já ordenados por tempo, intercalados num só
+  (k-way merge) junto com as liquidações de cada posição
+- simulate(): percorre o fluxo aplicando os limites da carteira (banca, exposição
+  por mercado e posições abertas ao mesmo tempo) e monta uma curva de capital
+A posição de cada carteira em cada asset é copiada como no simulador individual;
+os limites só cortam (ou recusam) compras. Capital marcado pelo custo: o PnL
+aparece nas vendas e na liquidação (em 'resolves_at').
+"""
+import numpy as np
+import pandas as pd
+from data import copytrade
+from data.risk import drawdown_series
+
+# Ações do fluxo (na mesma data, liquidações vêm depois dos fills)
+BUY, SELL, RESOLVE = 0, 1, 2
+ACTIONS = np.array(['buy', 'sell', 'resolve'])
+
+EQUITY_COLUMNS = [
+    'timestamp', 'wallet', 'trade', 'bet', 'action',
+    'amount', 'pnl', 'cash', 'exposure', 'equity', 'drawdown',
+]
+
+WALLET_COLUMNS = [
+    'wallet', 'pnl', 'volume', 'roi', 'markets', 'buy_txs', 'sell_txs',
+    'blocked_bankroll', 'blocked_exposure', 'blocked_positions',
+]
+
+
+class Book:
+    """
+    Carteiras copiadas, prontas para simular (Fills e TraderPass uma vez por carteira).
+    slots: uma linha por (carteira, asset), com os metadados de Fills.meta
+    """
+
+    def __init__(self, frames: dict[str, pd.DataFrame]):
+        self.wallets = []
+        self.fills = []
+        self.traders = []
+        self.offsets = []
+
+        metas, markets, resolves_at = [], [], []
+        offset = 0
+        for wallet, df in frames.items():
+            fills = copytrade.Fills(df)
+            if fills.n_assets == 0:
+                continue
+            self.wallets.append(wallet)
+            self.fills.append(fills)
+            self.traders.append(copytrade.TraderPass(fills))
+            self.offsets.append(offset)
+            offset += fills.n_assets
+
+            metas.append(fills.meta.assign(wallet=wallet))
+            markets.append(fills.market)
+            resolves_at.append(fills.resolves_at)
+
+        self.slots = (
+            pd.concat(metas, ignore_index=True) if metas else pd.DataFrame(
+                columns=['timestamp', 'trade', 'bet', 'won', 'wallet']
+            )
+        )
+        self.slot_wallet = np.repeat(
+            np.arange(len(self.wallets)), [f.n_assets for f in self.fills]
+        )
+        # Mercado de cada slot (o mesmo mercado em várias carteiras divide o limite)
+        self.slot_market, _ = pd.factorize(
+            pd.Series(np.concatenate(markets) if markets else [], dtype=object)
+        )
+        self.n_markets = int(self.slot_market.max()) + 1 if len(self.slot_market) else 0
+
+        # Liquidação por mercado: a mais tardia entre as carteiras
+        resolves = (
+            np.concatenate(resolves_at).astype('datetime64[ns]').view(np.int64)
+            if resolves_at else np.zeros(0, dtype=np.int64)
+        )
+        market_resolves = np.full(self.n_markets, np.iinfo(np.int64).min)
+        np.maximum.at(market_resolves, self.slot_market, resolves)
+        self.slot_resolves = market_resolves[self.slot_market]
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def merge(
+        self,
+        copy_stake: float,
+        trigger: float,
+        strategy: str,
+        sell_strategy: str,
+        ) -> dict:
+        """
+        Fluxo único em ordem de tempo: {'timestamp', 'slot', 'action', 'value', 'price'}.
+        Cada carteira (e as liquidações) é ordenada por tempo separadamente; o argsort
+        estável (timsort) sobre os trechos concatenados acha os trechos já ordenados
+        e só os intercala. Empates: ordem das carteiras, liquidações por último.
+        """
+        streams = []
+        for fills, trader, offset in zip(self.fills, self.traders, self.offsets):
+            events, buys, values = copytrade.copy_signals(
+                fills, trader, copy_stake, trigger, strategy, sell_strategy
+            )
+            timestamp = fills.timestamp[events].view(np.int64)
+            by_time = np.argsort(timestamp, kind='stable')
+            streams.append({
+                'timestamp': timestamp[by_time],
+                'slot': offset + fills.group[events][by_time],
+                'action': np.where(buys[by_time], BUY, SELL),
+                'value': values[by_time],
+                'price': fills.price[events][by_time],
+            })
+
+        by_time = np.argsort(self.slot_resolves, kind='stable')
+        streams.append({
+            'timestamp': self.slot_resolves[by_time],
+            'slot': by_time,
+            'action': np.full(len(by_time), RESOLVE),
+            'value': np.zeros(len(by_time)),
+            'price': np.zeros(len(by_time)),
+        })
+
+        merged = {key: np.concatenate([s[key] for s in streams]) for key in streams[0]}
+        order = np.argsort(merged['timestamp'], kind='stable')
+        return {key: values[order] for key, values in merged.items()}
+
+    def simulate(
+        self,
+        copy_stake: float,
+        trigger: float,
+        strategy: str,
+        sell_strategy: str,
+        bankroll: float,
+        max_exposure: float | None = None,
+        max_positions: int | None = None,
+        ) -> dict:
+        """
+        Todas as carteiras copiadas da mesma banca.
+        bankroll:       capital inicial (compras só com o caixa disponível)
+        max_exposure:   custo máximo em aberto por mercado, somando as carteiras
+        max_positions:  mercados com posição aberta ao mesmo tempo
+        Retorna {'equity': DataFrame (EQUITY_COLUMNS, uma linha por operação),
+                 'wallets': DataFrame (WALLET_COLUMNS), 'summary': dict}.
+        """
+        stream = self.merge(copy_stake, trigger, strategy, sell_strategy)
+
+        n_slots, n_wallets = len(self.slots), len(self.wallets)
+        won = self.slots['won'].to_numpy().astype(bool).tolist()
+        slot_market = self.slot_market.tolist()
+        slot_wallet = self.slot_wallet.tolist()
+
+        shares = [0.0] * n_slots
+        usdc = [0.0] * n_slots
+        bought = [0.0] * n_slots
+        realized = [0.0] * n_slots
+        buy_txs = [0] * n_slots
+        sell_txs = [0] * n_slots
+        market_usdc = [0.0] * self.n_markets
+        market_open = [0] * self.n_markets     # Slots com shares no mercado
+        blocked = {
+            reason: [0] * n_wallets for reason in ('bankroll', 'exposure', 'positions')
+        }
+
+        stake = float(copy_stake)
+        cash = float(bankroll)
+        exposure = 0.0
+        open_markets = 0
+        peak_exposure = 0.0
+        peak_positions = 0
+        no_exposure_limit = max_exposure is None
+        no_position_limit = max_positions is None
+
+        # Operações executadas (linhas da curva de capital)
+        rows = {
+            key: [] for key in
+            ('timestamp', 'slot', 'action', 'amount', 'pnl', 'cash', 'exposure')
+        }
+
+        for timestamp, slot, action, value, price in zip(
+            stream['timestamp'].tolist(),
+            stream['slot'].tolist(),
+            stream['action'].tolist(),
+            stream['value'].tolist(),
+            stream['price'].tolist(),
+            ):
+            market = slot_market[slot]
+
+            if action == BUY:
+                # Mesmas regras do simulador individual...
+                held = usdc[slot]
+                amount = value - held
+                if amount <= 0.01:
+                    continue
+                amount = min(amount, stake - held)
+                if amount <= 0.001:
+                    continue
+
+                # ...e os limites da carteira
+                opening = shares[slot] <= 0
+                if opening and market_open[market] == 0 and not no_position_limit \
+                        and open_markets >= max_positions:
+                    blocked['positions'][slot_wallet[slot]] += 1
+                    continue
+                if not no_exposure_limit:
+                    amount = min(amount, max_exposure - market_usdc[market])
+                    if amount <= 0.001:
+                        blocked['exposure'][slot_wallet[slot]] += 1
+                        continue
+                amount = min(amount, cash)
+                if amount <= 0.001:
+                    blocked['bankroll'][slot_wallet[slot]] += 1
+                    continue
+
+                if opening:
+                    if market_open[market] == 0:
+                        open_markets += 1
+                        peak_positions = max(peak_positions, open_markets)
+                    market_open[market] += 1
+
+                cash -= amount
+                usdc[slot] = held + amount
+                shares[slot] += amount / price
+                bought[slot] += amount
+                buy_txs[slot] += 1
+                market_usdc[market] += amount
+                exposure += amount
+                peak_exposure = max(peak_exposure, exposure)
+                pnl = 0.0
+
+            elif action == SELL:
+                if shares[slot] <= 0:
+                    continue
+
+                sold_shares = shares[slot] * value
+                amount = sold_shares * price
+                cost_removed = usdc[slot] * value
+                pnl = amount - cost_removed
+
+                shares[slot] -= sold_shares
+                usdc[slot] -= cost_removed
+                realized[slot] += pnl
+                sell_txs[slot] += 1
+                cash += amount
+                market_usdc[market] -= cost_removed
+                exposure -= cost_removed
+
+                if shares[slot] <= 0:
+                    market_open[market] -= 1
+                    if market_open[market] == 0:
+                        open_markets -= 1
+
+            else:
+                if shares[slot] <= 0 and usdc[slot] == 0:
+                    continue
+
+                # Liquidação: shares vencedoras valem $1
+                amount = shares[slot] if won[slot] else 0.0
+                cost_removed = usdc[slot]
+                pnl = amount - cost_removed
+
+                realized[slot] += pnl
+                cash += amount
+                market_usdc[market] -= cost_removed
+                exposure -= cost_removed
+
+                if shares[slot] > 0:
+                    market_open[market] -= 1
+                    if market_open[market] == 0:
+                        open_markets -= 1
+                shares[slot] = usdc[slot] = 0.0
+
+            rows['timestamp'].append(timestamp)
+            rows['slot'].append(slot)
+            rows['action'].append(action)
+            rows['amount'].append(amount)
+            rows['pnl'].append(pnl)
+            rows['cash'].append(cash)
+            rows['exposure'].append(exposure)
+
+        equity = self._equity(rows, bankroll)
+        wallets = self._wallets(bought, realized, buy_txs, sell_txs, blocked)
+
+        drawdown = equity['drawdown'].to_numpy()
+        pnl = float(wallets['pnl'].sum())
+        volume = float(wallets['volume'].sum())
+        blocked_total = wallets[['blocked_bankroll', 'blocked_exposure', 'blocked_positions']]
+        return {
+            'equity': equity,
+            'wallets': wallets,
+            'summary': {
+                'pnl': pnl,
+                'roi': pnl / volume * 100 if volume > 0 else 0.0,
+                'return': pnl / bankroll * 100 if bankroll > 0 else 0.0,
+                'max_drawdown': float(drawdown.max()) if len(drawdown) else 0.0,
+                'volume': volume,
+                'peak_exposure': peak_exposure,
+                'peak_positions': peak_positions,
+                'blocked': int(blocked_total.to_numpy().sum()),
+            },
+        }
+
+    def _equity(
+        self,
+        rows: dict,
+        bankroll: float,
+        ) -> pd.DataFrame:
+        # Curva de capital (caixa + custo em aberto) e drawdown, uma linha por operação
+        slot = np.asarray(rows['slot'], dtype=np.int64)
+        cash = np.asarray(rows['cash'], dtype=float)
+        exposure = np.asarray(rows['exposure'], dtype=float)
+        equity = cash + exposure
+        drawdown, _ = drawdown_series(equity - bankroll)
+
+        return pd.DataFrame({
+            'timestamp': np.asarray(rows['timestamp'], dtype=np.int64).view('datetime64[ns]'),
+            'wallet': self.slots['wallet'].to_numpy()[slot],
+            'trade': self.slots['trade'].to_numpy()[slot],
+            'bet': self.slots['bet'].to_numpy()[slot],
+            'action': ACTIONS[np.asarray(rows['action'], dtype=np.int64)],
+            'amount': np.asarray(rows['amount'], dtype=float),
+            'pnl': np.asarray(rows['pnl'], dtype=float),
+            'cash': cash,
+            'exposure': exposure,
+            'equity': equity,
+            'drawdown': drawdown,
+        }, columns=EQUITY_COLUMNS)
+
+    def _wallets(
+        self,
+        bought: list,
+        realized: list,
+        buy_txs: list,
+        sell_txs: list,
+        blocked: dict,
+        ) -> pd.DataFrame:
+        # Totais por carteira (soma dos slots de cada uma)
+        n_wallets = len(self.wallets)
+        per_wallet = lambda values: np.bincount(
+            self.slot_wallet, weights=np.asarray(values, dtype=float), minlength=n_wallets
+        )
+        bought_total = per_wallet(bought)
+        pnl = per_wallet(realized)
+
+        return pd.DataFrame({
+            'wallet': self.wallets,
+            'pnl': pnl,
+            'volume': bought_total,
+            'roi': copytrade._divide(pnl * 100, bought_total),
+            'markets': per_wallet(np.asarray(buy_txs) > 0).astype(np.int64),
+            'buy_txs': per_wallet(buy_txs).astype(np.int64),
+            'sell_txs': per_wallet(sell_txs).astype(np.int64),
+            'blocked_bankroll': blocked['bankroll'],
+            'blocked_exposure': blocked['exposure'],
+            'blocked_positions': blocked['positions'],
+        }, columns=WALLET_COLUMNS)
+
+
+def run_portfolio(
+    frames: dict[str, pd.DataFrame],
+    copy_stake: float,
+    trigger: float,
+    strategy: str,
+    sell_strategy: str,
+    bankroll: float,
+    max_exposure: float | None = None,
+    max_positions: int | None = None,
+    ) -> dict | None:
+    """
+    Atalho: Book + simulate(). frames: {carteira: trades (como em copytrade.run_simulation)}.
+    None se nenhuma carteira tem trades.
+    """
+    book = Book(frames)
+    if len(book) == 0:
+        return None
+    return book.simulate(
+        copy_stake, trigger, strategy, sell_strategy,
+        bankroll=bankroll, max_exposure=max_exposure, max_positions=max_positions,
+    )
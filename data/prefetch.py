@@ -0,0 +1,143 @@
+"""
+Prefetch especulativo (baixa prioridade) do que o dashboard provavelmente pede em seguida.
+- wallet(): a busca das posições começa enquanto o endereço ainda é validado
+- clv():    trades e preços de fechamento das tags principais da carteira, para
+            que 'Fetch CLV' encontre as respostas em cache
+As buscas levam um CancelToken de prioridade 'background': o escalonador só lhes
+dá a folga do orçamento e as segura enquanto houver requisições de outras classes na fila.
+"""
+import re
+import threading
+import numpy as np
+import pandas as pd
+from api.jobs import CancelToken, Cancelled, JobRegistry
+from data.cache import WalletCache
+from data.dataset import WalletDataset
+from data.tags import SPORTS_TAGS
+
+WALLET_ADDRESS = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+# Quantas tags (as mais frequentes) e posições (as mais recentes) aquecer para o CLV
+PREFETCH_TOP_TAGS = 3
+PREFETCH_MAX_POSITIONS = 500
+# Paralelismo das buscas de fundo (o ritmo é dado pela folga do rate limiter)
+PREFETCH_WORKERS = 4
+
+
+def top_tag_positions(
+    dataset: WalletDataset,
+    n_tags: int = PREFETCH_TOP_TAGS,
+    max_positions: int = PREFETCH_MAX_POSITIONS,
+    ) -> pd.DataFrame:
+    """
+    Posições com alguma das n_tags tags mais frequentes (fora as genéricas
+    de SPORTS_TAGS), as mais recentes primeiro.
+    """
+    tags = dataset.tags
+    counts = np.bincount(tags.codes, minlength=len(tags.labels))
+    counts[tags.ids(SPORTS_TAGS)] = 0
+    top = np.argsort(counts, kind='stable')[::-1][:n_tags]
+    top = top[counts[top] > 0]
+
+    rows = np.unique(tags.rows[np.isin(tags.codes, top)])
+    df = dataset.frame.iloc[rows]
+    if 'endDate' in df.columns:
+        df = df.sort_values('endDate', ascending=False)
+    return df.head(max_positions)
+
+
+class Prefetcher:
+    """
+    Um por processo (ver dashboard.backend.user_data.get_prefetcher).
+    """
+
+    def __init__(
+        self,
+        cache: WalletCache,
+        jobs: JobRegistry,
+        ):
+        self._cache = cache
+        self._jobs = jobs
+        self._warming = {}      # wallet -> (versão do dataset, CancelToken)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(wallet: str) -> str:
+        return wallet.strip().lower()
+
+    def wallet(self, wallet: str) -> None:
+        # Começa a busca das posições como job de fundo (sessões que esperam o promovem)
+        wallet = wallet.strip()
+        if not WALLET_ADDRESS.match(wallet) or wallet in self._cache or self._cache.pending(wallet):
+            return
+        self._jobs.prefetch(wallet)
+        self._cache.submit(wallet)
+
+    def discard(self, wallet: str) -> None:
+        # Endereço inválido ou abandonado: cancela o que ninguém está esperando
+        self._jobs.discard(wallet)
+        with self._lock:
+            warming = self._warming.pop(self._key(wallet), None)
+        if warming is not None:
+            warming[1].cancel()
+
+    def clv(
+        self,
+        wallet: str,
+        dataset: WalletDataset,
+        ) -> None:
+        # Aquece trades e preços de fechamento (uma vez por carga da carteira)
+        wallet = self._key(wallet)
+        with self._lock:
+            warming = self._warming.get(wallet)
+            if warming is not None and warming[0] == dataset.version:
+                return
+            if warming is not None:
+                warming[1].cancel()
+            token = CancelToken(priority='background')
+            self._warming[wallet] = (dataset.version, token)
+
+        threading.Thread(
+            target=self._warm_clv, args=(wallet, dataset, token), daemon=True
+        ).start()
+
+    def _warm_clv(
+        self,
+        wallet: str,
+        dataset: WalletDataset,
+        token: CancelToken,
+        ) -> None:
+        # Import lazy, como em DataAnalyst.calculate_clv
+        from api import fetch_clv
+        from api.price_history import process_dataframe
+
+        try:
+            df = top_tag_positions(dataset)
+            if df.empty:
+                return
+            if 'start_time' in df.columns:
+                process_dataframe(
+                    df, max_concurrency=PREFETCH_WORKERS, verbose=False, cancel=token
+                )
+            if 'conditionId' in df.columns:
+                fetch_clv.fetch_clv(
+                    user_address=wallet,
+                    df=df,
+                    max_workers=PREFETCH_WORKERS,
+                    simultaneous_requests=PREFETCH_WORKERS,
+                    cancel=token,
+                )
+
+        except Cancelled:
+            self._forget(wallet, token)
+
+        except Exception as e:
+            print(f"⚠️  Falha no prefetch de CLV de {wallet}: {type(e).__name__}: {e}")
+            self._forget(wallet, token)
+
+    def _forget(self, wallet: str, token: CancelToken) -> None:
+        # Sem aquecimento registrado, o próximo clv() tenta de novo
+        with self._lock:
+            warming = self._warming.get(wallet)
+            if warming is not None and warming[1] is token:
+                del self._warming[wallet]
@@ -0,0 +1,139 @@
+"""
+Métricas de risco vetorizadas a partir da série de PnL acumulado.
+Tudo é calculado com running max / cumsum em uma passada, para poder
+rodar a cada mudança de filtro no dashboard.
+"""
+import numpy as np
+import pandas as pd
+from data.dataset import parse_dates
+
+# Mercados resolvem todos os dias (inclusive fins de semana)
+PERIODS_PER_YEAR = 365
+
+
+def daily_pnl(
+    df: pd.DataFrame,
+    pnl_column: str = 'realizedPnl',
+    date_column: str = 'endDate',
+    ) -> pd.DataFrame:
+    """
+    Lucro diário e acumulado das posições.
+    Colunas: ['Date', 'Profit', 'Cumulative Profit']
+    """
+    # Agrupa direto pela data normalizada, sem copiar o df (groupby já ordena)
+    dates = parse_dates(df[date_column]).dt.normalize()
+    daily_profit = df[pnl_column].groupby(dates.to_numpy()).sum()
+
+    out_df = daily_profit.reset_index()
+    out_df.columns = ['Date', 'Profit']
+    out_df['Cumulative Profit'] = out_df['Profit'].cumsum()
+
+    return out_df
+
+
+def drawdown_series(cumulative: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Recebe o PnL acumulado e retorna (drawdown em $, posição do último topo).
+    O capital começa em 0, então um prejuízo inicial já conta como drawdown.
+    """
+    running_max = np.maximum.accumulate(np.maximum(cumulative, 0))
+    drawdown = running_max - cumulative
+
+    # Posição do último topo: onde o acumulado bateu o máximo até ali
+    at_peak = cumulative >= running_max
+    peak_position = np.maximum.accumulate(
+        np.where(at_peak, np.arange(len(cumulative)), -1)
+    )
+    return drawdown, peak_position
+
+
+def longest_streak(flags: np.ndarray) -> int:
+    """
+    Maior sequência consecutiva de True.
+    """
+    if not flags.any():
+        return 0
+
+    # Cada False "zera" a contagem: subtrai o cumsum no último False
+    counts = np.cumsum(flags)
+    resets = np.maximum.accumulate(np.where(~flags, counts, 0))
+    return int((counts - resets).max())
+
+
+def risk_metrics(
+    daily: pd.DataFrame,
+    positions: pd.DataFrame | None = None,
+    pnl_column: str = 'realizedPnl',
+    ) -> dict:
+    """
+    Recebe o DataFrame de daily_pnl (['Date', 'Profit', 'Cumulative Profit'])
+    e, opcionalmente, as posições (para streak e win/loss por aposta).
+
+    Retorna:
+        max_drawdown: maior queda do topo em $
+        max_drawdown_days: maior tempo (dias) entre um topo e a recuperação
+        time_under_water: fração dos dias abaixo do topo anterior
+        longest_losing_streak: maior sequência de apostas perdedoras (ou dias, sem posições)
+        sharpe / sortino: anualizados sobre o PnL diário (dias sem resolução = 0)
+        win_loss_ratio: lucro médio das vitórias / prejuízo médio das derrotas
+        win_rate: fração de apostas vencedoras
+    """
+    metrics = {
+        'max_drawdown': 0.0,
+        'max_drawdown_days': 0,
+        'time_under_water': 0.0,
+        'longest_losing_streak': 0,
+        'sharpe': None,
+        'sortino': None,
+        'win_loss_ratio': None,
+        'win_rate': None,
+    }
+
+    if daily.empty:
+        return metrics
+
+    # PnL diário em calendário contínuo: dias sem resolução entram como 0
+    profit = daily.set_index('Date')['Profit']
+    calendar = pd.date_range(profit.index.min(), profit.index.max(), freq='D')
+    profit = profit.reindex(calendar, fill_value=0.0).to_numpy(dtype=float)
+    cumulative = np.cumsum(profit)
+
+    drawdown, peak_position = drawdown_series(cumulative)
+    underwater = drawdown > 0
+
+    metrics['max_drawdown'] = float(drawdown.max())
+    metrics['time_under_water'] = float(underwater.mean())
+
+    # Dias desde o último topo, medido em cada dia abaixo d'água
+    days_since_peak = np.arange(len(cumulative)) - np.maximum(peak_position, -1)
+    metrics['max_drawdown_days'] = int(np.where(underwater, days_since_peak, 0).max())
+
+    std = profit.std(ddof=1) if len(profit) > 1 else 0.0
+    downside = np.minimum(profit, 0)
+    downside_std = np.sqrt(np.mean(downside ** 2))
+    mean = profit.mean()
+
+    if std > 0:
+        metrics['sharpe'] = float(mean / std * np.sqrt(PERIODS_PER_YEAR))
+    if downside_std > 0:
+        metrics['sortino'] = float(mean / downside_std * np.sqrt(PERIODS_PER_YEAR))
+
+    # Streak e win/loss por aposta quando temos as posições
+    if positions is not None and not positions.empty:
+        order = np.argsort(positions['endDate'].to_numpy(), kind='stable')
+        outcome = positions[pnl_column].to_numpy(dtype=float)[order]
+    else:
+        outcome = daily['Profit'].to_numpy(dtype=float)
+
+    outcome = outcome[~np.isnan(outcome)]
+    wins = outcome[outcome > 0]
+    losses = outcome[outcome < 0]
+
+    metrics['longest_losing_streak'] = longest_streak(outcome < 0)
+
+    if len(wins) + len(losses) > 0:
+        metrics['win_rate'] = float(len(wins) / (len(wins) + len(losses)))
+    if len(wins) and len(losses):
+        metrics['win_loss_ratio'] = float(wins.mean() / -losses.mean())
+
+    return metrics
@@ -0,0 +1,202 @@
+"""
+Resumo de uma carteira em uma linha: o pipeline do DataAnalyst
+(stats, risco, bootstrap, sizing e recorte de Sports) sem dashboard.
+Usado pelas análises em lote, que rodam isso em processos separados.
+"""
+import numpy as np
+import pandas as pd
+from data.dataset import WalletDataset
+from data.tags import SPORTS_TAGS
+from data.analysis import DataAnalyst
+from data.aggregation import sizing_edge, tag_breakdown
+from data.risk import daily_pnl, risk_metrics
+from data.significance import bootstrap_stats, N_RESAMPLES
+
+SUMMARY_COLUMNS = [
+    'wallet', 'status', 'error',
+    'closed_positions', 'active_positions', 'bets',
+    'profit', 'volume', 'roi', 'roi_low', 'roi_high', 'roi_p',
+    'flat_units', 'units_low', 'units_high', 'units_p',
+    'avg_stake', 'median_stake',
+    'max_drawdown', 'max_drawdown_days', 'time_under_water',
+    'longest_losing_streak', 'sharpe', 'sortino', 'win_rate', 'win_loss_ratio',
+    'sizes_up', 'stake_edge_corr',
+    'clv', 'clv_positive', 'clv_bets',
+    'sports_bets', 'sports_profit', 'sports_roi',
+    'first_date', 'last_date',
+]
+
+
+def _number(value):
+    # Tipos nativos (checkpoint em JSON); NaN/inf viram None
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def _merged_dataset(
+    closed_df: pd.DataFrame,
+    active_df: pd.DataFrame,
+    ) -> WalletDataset:
+    closed = WalletDataset.from_frame(closed_df.reset_index(drop=True))
+    active = WalletDataset.from_frame(active_df.reset_index(drop=True))
+    return WalletDataset.concat([active, closed])
+
+
+def wallet_summary(
+    wallet: str,
+    closed_df: pd.DataFrame,
+    active_df: pd.DataFrame,
+    n_resamples: int = N_RESAMPLES,
+    seed: int | None = 0,
+    ) -> dict:
+    """
+    Recebe as posições fechadas/ativas de uma carteira (fetch_pnl_data)
+    e retorna um dict com SUMMARY_COLUMNS.
+    """
+    return dataset_summary(
+        wallet, _merged_dataset(closed_df, active_df),
+        closed_positions=len(closed_df),
+        active_positions=len(active_df),
+        n_resamples=n_resamples,
+        seed=seed,
+    )
+
+
+def wallet_profile(
+    wallet: str,
+    closed_df: pd.DataFrame,
+    active_df: pd.DataFrame,
+    n_resamples: int = N_RESAMPLES,
+    seed: int | None = 0,
+    ) -> tuple[dict, pd.DataFrame | None]:
+    """
+    wallet_summary + estatísticas por tag (tag_breakdown), para o leaderboard.
+    """
+    merged = _merged_dataset(closed_df, active_df)
+    summary = dataset_summary(
+        wallet, merged,
+        closed_positions=len(closed_df),
+        active_positions=len(active_df),
+        n_resamples=n_resamples,
+        seed=seed,
+    )
+    if summary['status'] != 'ok':
+        return summary, None
+
+    return summary, tag_breakdown(merged.frame, merged.tags)
+
+
+def clv_summary(
+    df: pd.DataFrame,
+    clv_column: str = 'price_clv',
+    ) -> dict:
+    """
+    CLV médio, CLV+ (fração das posições que bateram o fechamento)
+    e quantas posições têm CLV. Vazio se o df não passou por calculate_clv.
+    """
+    if clv_column not in df.columns:
+        return {}
+
+    clv = df[clv_column].dropna()
+    return {
+        'clv': clv.mean() if len(clv) else None,
+        'clv_positive': (clv > 0).mean() if len(clv) else None,
+        'clv_bets': len(clv),
+    }
+
+
+def dataset_summary(
+    wallet: str,
+    merged: WalletDataset,
+    closed_positions: int | None = None,
+    active_positions: int | None = None,
+    n_resamples: int = N_RESAMPLES,
+    seed: int | None = 0,
+    ) -> dict:
+    """
+    Mesmo resumo de wallet_summary para um dataset já carregado (dashboard).
+    """
+    summary = dict.fromkeys(SUMMARY_COLUMNS)
+    summary.update(
+        wallet=wallet,
+        status='ok',
+        closed_positions=closed_positions,
+        active_positions=active_positions,
+    )
+    df = merged.frame
+
+    if merged.empty or 'totalBought' not in df.columns:
+        summary['status'] = 'empty'
+        return summary
+
+    profit, volume, roi = DataAnalyst.calculate_stats(df)
+    stats = DataAnalyst.calculate_advanced_stats(df)
+    boot = bootstrap_stats(df, n_resamples=n_resamples, seed=seed)
+    risk = risk_metrics(daily_pnl(df), positions=df)
+    sizing = sizing_edge(df)
+
+    summary.update(
+        bets=len(df),
+        profit=profit,
+        volume=volume,
+        roi=roi,
+        roi_low=boot['roi']['low'],
+        roi_high=boot['roi']['high'],
+        roi_p=boot['roi']['p_value'],
+        flat_units=stats['flat_profit'],
+        units_low=boot['units']['low'],
+        units_high=boot['units']['high'],
+        units_p=boot['units']['p_value'],
+        avg_stake=stats['avg_stake'],
+        median_stake=stats['median_stake'],
+        sizes_up=sizing['sizes_up'],
+        stake_edge_corr=sizing['correlation'],
+    )
+    summary.update(clv_summary(df))
+    summary.update({key: risk[key] for key in (
+        'max_drawdown', 'max_drawdown_days', 'time_under_water',
+        'longest_losing_streak', 'sharpe', 'sortino', 'win_rate', 'win_loss_ratio',
+    )})
+
+    # Recorte de Sports/Games (mesmo critério de process_sports_trades)
+    sports = df[merged.tags.mask(df, SPORTS_TAGS)]
+    sports_profit, _, sports_roi = DataAnalyst.calculate_stats(sports)
+    summary.update(
+        sports_bets=len(sports),
+        sports_profit=sports_profit,
+        sports_roi=sports_roi,
+    )
+
+    if 'endDate' in df.columns and df['endDate'].notna().any():
+        summary['first_date'] = df['endDate'].min().isoformat()
+        summary['last_date'] = df['endDate'].max().isoformat()
+
+    return {
+        key: value if key in ('wallet', 'status', 'error', 'first_date', 'last_date')
+        else _number(value)
+        for key, value in summary.items()
+    }
+
+
+def score_wallets(
+    df: pd.DataFrame,
+    min_bets: int = 20,
+    ) -> pd.DataFrame:
+    """
+    Ordena os resumos (SUMMARY_COLUMNS) por 'sharpness'.
+    score = limite inferior do IC do ROI: premia ROI alto *e* amostra grande;
+    carteiras sem resumo ou com menos de min_bets apostas ficam sem score.
+    """
+    df = df.copy()
+    eligible = df['status'].eq('ok') & pd.to_numeric(df['bets'], errors='coerce').ge(min_bets)
+    df['score'] = pd.to_numeric(df['roi_low'], errors='coerce').where(eligible)
+
+    df = df.sort_values('score', ascending=False, na_position='last').reset_index(drop=True)
+    df['rank'] = df['score'].rank(ascending=False, method='min').astype('Int64')
+    return df
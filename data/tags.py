@@ -0,0 +1,156 @@
+"""
+Representação das tags em códigos inteiros.
+As listas de tags são lidas uma única vez (na carga da carteira) e viram
+um dicionário de tags + uma tabela (linha, tag_id). Filtros, detecção de
+Sports/Games e estatísticas por tag passam a ser operações em inteiros.
+"""
+import itertools
+import numpy as np
+import pandas as pd
+from helpers import to_list
+
+SPORTS_TAGS = ['Games', 'Sports']
+
+
+class TagIndex:
+    """
+    Tags de um DataFrame normalizadas:
+    labels: pd.Index com o nome de cada tag_id
+    rows:   posição (no DataFrame de origem) de cada par da tabela
+    codes:  tag_id de cada par da tabela
+    index:  índice do DataFrame de origem, usado para alinhar subconjuntos filtrados
+    """
+
+    def __init__(
+        self,
+        labels: pd.Index,
+        rows: np.ndarray,
+        codes: np.ndarray,
+        index: pd.Index,
+        ):
+        self.labels = labels
+        self.rows = rows
+        self.codes = codes
+        self.index = index
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        column: str = 'tags',
+        ) -> 'TagIndex':
+        """
+        Lê a coluna de tags (listas ou strings de listas) uma única vez.
+        """
+        if column not in df.columns:
+            return cls(pd.Index([]), np.array([], dtype=np.int64),
+                       np.array([], dtype=np.int32), df.index)
+
+        lists = [to_list(x) for x in df[column].to_numpy()]
+        lengths = np.fromiter((len(x) for x in lists), dtype=np.int64, count=len(lists))
+
+        flat = pd.Series(list(itertools.chain.from_iterable(lists)), dtype=object)
+        rows = np.repeat(np.arange(len(lists), dtype=np.int64), lengths)
+
+        valid = flat.notna().to_numpy()
+        codes, labels = pd.factorize(flat[valid])
+
+        return cls(pd.Index(labels), rows[valid], codes.astype(np.int32), df.index)
+
+    @classmethod
+    def for_frame(
+        cls,
+        df: pd.DataFrame,
+        tag_index: 'TagIndex | None' = None,
+        ) -> 'TagIndex':
+        """
+        Usa o índice já construído quando ele serve para 'df' (df é a origem
+        ou um subconjunto filtrado dela: todas as linhas de df estão na origem);
+        caso contrário constrói um novo.
+        """
+        if tag_index is None:
+            return cls.from_frame(df)
+        if df.index.equals(tag_index.index):
+            return tag_index
+        if (
+            tag_index.index.is_unique and df.index.is_unique
+            and df.index.isin(tag_index.index).all()
+            ):
+            return tag_index
+        return cls.from_frame(df)
+
+    @property
+    def nbytes(self) -> int:
+        return int(
+            self.rows.nbytes + self.codes.nbytes
+            + self.labels.memory_usage(deep=True)
+        )
+
+    def ids(self, tags: list) -> np.ndarray:
+        """
+        Converte nomes de tags para tag_ids (tags desconhecidas são ignoradas).
+        """
+        ids = self.labels.get_indexer(pd.Index(list(tags), dtype=object))
+        return ids[ids >= 0]
+
+    def membership(self, df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Tabela (linha, tag_id) restrita às linhas de 'df', com as linhas
+        em posições de 'df'.
+        """
+        if len(df) == len(self.index) and df.index.equals(self.index):
+            return self.rows, self.codes
+
+        # Posição de cada linha de 'df' no DataFrame de origem
+        source_positions = self.index.get_indexer(df.index)
+        found = source_positions >= 0
+
+        lookup = np.full(len(self.index), -1, dtype=np.int64)
+        lookup[source_positions[found]] = np.flatnonzero(found)
+
+        df_rows = lookup[self.rows]
+        keep = df_rows >= 0
+        return df_rows[keep], self.codes[keep]
+
+    def mask(
+        self,
+        df: pd.DataFrame,
+        tags: list,
+        ) -> np.ndarray:
+        """
+        Máscara booleana das linhas de 'df' que têm QUALQUER uma das tags.
+        """
+        rows, codes = self.membership(df)
+        hits = np.isin(codes, self.ids(tags))
+
+        out = np.zeros(len(df), dtype=bool)
+        out[rows[hits]] = True
+        return out
+
+    def explode(
+        self,
+        df: pd.DataFrame,
+        exclude_tags: list = [],
+        ) -> tuple[np.ndarray, pd.Categorical]:
+        """
+        Equivalente ao explode da coluna de tags, sem copiar 'df'.
+        Retorna (posições das linhas em 'df', tag de cada linha explodida).
+        """
+        rows, codes = self.membership(df)
+
+        if exclude_tags:
+            keep = ~np.isin(codes, self.ids(exclude_tags))
+            rows, codes = rows[keep], codes[keep]
+
+        # Mesma ordem do explode: por linha e, dentro da linha, pela ordem das tags
+        order = np.argsort(rows, kind='stable')
+        rows, codes = rows[order], codes[order]
+
+        return rows, pd.Categorical.from_codes(codes, categories=self.labels)
+
+    def unique_tags(self, df: pd.DataFrame) -> int:
+        """
+        Número de tags distintas presentes nas linhas de 'df'.
+        """
+        _, codes = self.membership(df)
+        return int(np.unique(codes).size)
@@ -20,32 +20,33 @@ def to_list(x):
             return []
     return []
 
-def get_exploded_df(df: pd.DataFrame, exclude_tags: list = []) -> pd.DataFrame:
+def get_exploded_df(
+    df: pd.DataFrame,
+    exclude_tags: list = [],
+    tag_index=None,
+    ) -> pd.DataFrame:
     """
     Cria DataFrame exploded com tags para análise detalhada.
-    Usa a lógica de 'tag_analysis' para duplicar a funcionalidade.
+    tag_index: (Opcional) TagIndex já construído para o df de origem.
     """
-    df = df.copy()
-    removed_tags = ['Games', 'Sports'] + exclude_tags
+    # Import local: data.tags depende deste módulo
+    from data.tags import TagIndex, SPORTS_TAGS
+    from data.dataset import staked, position_roi, total_profit
     
-    tmp = df.copy()
-    tmp['__tags_list'] = tmp['tags'].apply(to_list)
-    exploded = tmp.explode('__tags_list', ignore_index=True)
-    exploded = exploded.rename(columns={'__tags_list': 'tag'})
-    exploded = exploded[exploded['tag'].notna()]
-    exploded = exploded[~exploded['tag'].isin(removed_tags)]
+    tag_index = TagIndex.for_frame(df, tag_index)
+    positions, tag = tag_index.explode(df, exclude_tags=SPORTS_TAGS + exclude_tags)
+    
+    exploded = df.iloc[positions].reset_index(drop=True)
+    exploded['tag'] = pd.Series(tag, dtype=object)
     
-    # Usar apenas realizedPnl para evitar duplicação
     if 'realizedPnl' not in exploded.columns:
         exploded['realizedPnl'] = 0
-        
-    exploded['total_profit'] = exploded['realizedPnl'].fillna(0)
-    exploded['volume'] = exploded['totalBought'] * exploded['avgPrice']
-    exploded['staked'] = exploded['totalBought'] * exploded['avgPrice']
     
-
-    exploded['roi'] = safe_divide(exploded['total_profit'], exploded['volume'])
-
+    # Prontas quando o df vem de um WalletDataset; calculadas só se faltarem
+    exploded['staked'] = staked(exploded)
+    exploded['volume'] = exploded['staked']
+    exploded['roi'] = position_roi(exploded)
+    exploded['total_profit'] = total_profit(exploded)
     
     return exploded
 
@@ -92,6 +93,13 @@ def loading_animation(initial_message: str = "Carregando..."):
     """
     # --- MUDANÇA: Cria um dicionário para compartilhar o status ---
     status_data = {'message': initial_message}
+    
+    # Fora da thread principal (buscas paralelas, streamlit) as animações
+    # disputariam a mesma linha do terminal: só repassa o status
+    if threading.current_thread() is not threading.main_thread():
+        yield status_data
+        return
+    
     stop_event = threading.Event()
     
     animation_thread = threading.Thread(
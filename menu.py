@@ -1,7 +1,7 @@
 import sys
 import pandas as pd
 from api.fetch_clv import *
-from helpers import get_exploded_df
+from data.tags import TagIndex
 from data.analysis import DataAnalyst
 from api.fetch import fetch_total_trades
 from helpers import sep
@@ -68,8 +68,11 @@ def clv_menu(
         except ValueError:
             print('Escolha um valor válido para o mínimo de tags')
         
+    # Tags normalizadas uma vez para toda a sessão do menu
+    tag_index = TagIndex.from_frame(df)
+    
     # Imprime os dados para o user escolher
-    tag_df = DataAnalyst.tag_analysis(df=df, min_bets=min_bets)
+    tag_df = DataAnalyst.tag_analysis(df=df, min_bets=min_bets, tag_index=tag_index)
     DataAnalyst.print_tag_report(tag_df=tag_df)
     
     # Hora de deixar o user filtar
@@ -83,12 +86,12 @@ def clv_menu(
         
 
     # Filtrar o DF pela tag escolhida:
-    exploded_df = get_exploded_df(df)
+    chosen_df = df[tag_index.mask(df, [chosen_tag])]
     # Com a tag, vamos puxar os dados:
     
     clv_df = DataAnalyst.calculate_clv(
         user_address=user_address,
-        df=exploded_df[exploded_df['tag'] == chosen_tag]
+        df=chosen_df
         )
     
     print(f'CLV para a tag {chosen_tag} calculado.')
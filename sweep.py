@@ -0,0 +1,182 @@
+"""
+Varredura de mercados (ROADMAP v2): analisa todos os holders de um conjunto de mercados.
+
+Uso:
+    python sweep.py markets.txt --output sweep_results.parquet --fetch-workers 8
+
+1. Resolve os mercados (slug ou conditionId) e lista os holders de cada um
+   pelo subgraph de posições.
+2. Junta as carteiras de todos os mercados (cada carteira é baixada uma vez só).
+3. Roda o lote de batch.py nas carteiras e ordena o resultado por score
+   (limite inferior do IC do ROI, ver data.summary.score_wallets).
+
+Retomada: os holders de cada mercado ficam em <output>.holders.jsonl e as carteiras
+analisadas em <output>.checkpoint.jsonl; rodar de novo continua de onde parou.
+A vazão é limitada pelos rate limiters de api.session, não por pausas fixas.
+"""
+import os
+import json
+import argparse
+import pandas as pd
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from helpers import sep
+from api.holders import resolve_markets, get_market_holders
+from data.summary import score_wallets
+from data.significance import N_RESAMPLES
+from data.leaderboard import LEADERBOARD_PATH
+from batch import read_lines, run_batch, write_output
+
+
+def holders_path(output: str) -> str:
+    return f"{os.path.splitext(output)[0]}.holders.jsonl"
+
+
+def load_holders(path: str) -> dict:
+    """
+    Mercados já listados: {conditionId: [wallets]}.
+    """
+    holders = {}
+    if not os.path.exists(path):
+        return holders
+
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Linha cortada por uma interrupção
+            holders[record['condition_id']] = record['wallets']
+    return holders
+
+
+def collect_holders(
+    markets: list[str],
+    output: str,
+    workers: int = 4,
+    ) -> dict:
+    """
+    Lista os holders de cada mercado (em paralelo, com checkpoint por mercado).
+    Retorna {conditionId: [wallets]}.
+    """
+    resolved = resolve_markets(markets)
+    missing = [m for m in markets if m not in resolved]
+    if missing:
+        print(f"⚠️  {len(missing)} mercados não encontrados: {', '.join(missing[:5])}"
+              f"{'...' if len(missing) > 5 else ''}")
+
+    path = holders_path(output)
+    holders = load_holders(path)
+    pending = {
+        condition_id: market for market, condition_id in resolved.items()
+        if condition_id not in holders
+    }
+    print(f"{len(resolved)} mercados | {len(resolved) - len(pending)} no checkpoint | "
+          f"{len(pending)} a listar")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(get_market_holders, condition_id): condition_id
+            for condition_id in pending
+        }
+        for future in as_completed(futures):
+            condition_id = futures[future]
+            market = pending[condition_id]
+            try:
+                positions = future.result()
+            except Exception as e:
+                # Fica fora do checkpoint: a próxima execução tenta de novo
+                print(f"❌ {market}: {type(e).__name__}: {e}")
+                continue
+
+            wallets = list(dict.fromkeys(p['wallet'] for p in positions))
+            holders[condition_id] = wallets
+            with open(path, 'a') as f:
+                f.write(json.dumps({
+                    'market': market,
+                    'condition_id': condition_id,
+                    'wallets': wallets,
+                }) + '\n')
+            print(f"{market}: {len(wallets)} holders")
+
+    return {
+        condition_id: holders[condition_id]
+        for condition_id in resolved.values() if condition_id in holders
+    }
+
+
+def run_sweep(
+    markets: list[str],
+    output: str = 'sweep_results.parquet',
+    workers: int | None = None,
+    fetch_workers: int = 4,
+    min_bets: int = 20,
+    n_resamples: int = N_RESAMPLES,
+    retry_errors: bool = False,
+    leaderboard: str | None = None,
+    ) -> pd.DataFrame:
+    """
+    Holders dos mercados -> análise em lote -> ranking por score.
+    leaderboard: (Opcional) arquivo do leaderboard a atualizar
+    """
+    print(sep())
+    holders = collect_holders(markets, output, workers=fetch_workers)
+
+    # Carteiras em mais mercados primeiro: são as mais relevantes se a varredura parar
+    markets_held = Counter(wallet for wallets in holders.values() for wallet in wallets)
+    wallets = [wallet for wallet, _ in markets_held.most_common()]
+
+    results = run_batch(
+        wallets,
+        output=output,
+        workers=workers,
+        fetch_workers=fetch_workers,
+        n_resamples=n_resamples,
+        retry_errors=retry_errors,
+        leaderboard=leaderboard,
+    )
+
+    results.insert(1, 'markets_held', results['wallet'].map(markets_held).astype('Int64'))
+    results = score_wallets(results, min_bets=min_bets)
+    path = write_output(results, output)
+
+    print(sep())
+    print(f"{results['score'].notna().sum()} carteiras com score | ranking em {path}")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Analisa todos os holders de um conjunto de mercados da Polymarket."
+    )
+    parser.add_argument('markets', help="Arquivo com um slug ou conditionId por linha")
+    parser.add_argument('-o', '--output', default='sweep_results.parquet',
+                        help="Arquivo de saída (.parquet ou .csv)")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="Processos para a análise (padrão: número de CPUs)")
+    parser.add_argument('-f', '--fetch-workers', type=int, default=4,
+                        help="Downloads ao mesmo tempo (mercados e carteiras)")
+    parser.add_argument('--min-bets', type=int, default=20,
+                        help="Mínimo de apostas para a carteira receber score")
+    parser.add_argument('--resamples', type=int, default=N_RESAMPLES,
+                        help="Reamostras do bootstrap por carteira")
+    parser.add_argument('--retry-errors', action='store_true',
+                        help="Analisa de novo as carteiras que falharam no checkpoint")
+    parser.add_argument('--leaderboard', nargs='?', const=LEADERBOARD_PATH, default=None,
+                        help="Grava também no leaderboard (padrão: %(const)s)")
+    args = parser.parse_args()
+
+    run_sweep(
+        read_lines(args.markets),
+        output=args.output,
+        workers=args.workers,
+        fetch_workers=args.fetch_workers,
+        min_bets=args.min_bets,
+        n_resamples=args.resamples,
+        retry_errors=args.retry_errors,
+        leaderboard=args.leaderboard,
+    )
+
+
+if __name__ == '__main__':
+    main()